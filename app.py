@@ -1,12 +1,17 @@
 import streamlit as st
+from streamlit.runtime.scriptrunner import get_script_run_ctx
 import pandas as pd
-import yfinance as yf
 import plotly.graph_objects as go
-from datetime import datetime, timedelta
-import numpy as np
+from datetime import datetime, timedelta, timezone
 import time
-from cybo_api import get_data, get_crypto_info
-from datetime import datetime, timedelta
+from cybo_api import get_crypto_info
+from data_store import load_many, write_bars, download_many, retry_with_backoff, REFRESH_AFTER
+from signal_cache import read_latest
+from downsample import downsample_chart, CHART_WIDTH
+from shared_cache import SharedCache
+from live import LiveBoard, poll_feed
+from indicators import calculate_signals
+import profiling
 
 # Page configuration
 st.set_page_config(
@@ -55,6 +60,15 @@ timeframe = st.selectbox(
     ["1D", "5D", "1M", "3M", "6M", "1Y"]
 )
 
+# Live mode streams hourly bars and only redraws the live panel
+live_mode = st.toggle("Live mode (hourly bars, updates every few seconds)")
+LIVE_REFRESH = 5  # seconds
+
+# Debug panel: profile this render (always recorded when HMM_PROFILE=1) and show the last runs
+debug_mode = st.sidebar.checkbox("Debug: profile renders")
+DEBUG_RUNS = 10
+profiling.start_run('dashboard', force=debug_mode)
+
 # Convert timeframe to days
 timeframe_days = {
     "1D": 1,
@@ -65,50 +79,73 @@ timeframe_days = {
     "1Y": 365
 }
 
-@st.cache_data(ttl=300)  # Cache for 5 minutes
-def fetch_crypto_data(symbol, days):
-    try:
+@st.cache_resource
+def symbol_formats():
+    # Yahoo ticker format that worked per symbol, shared across reruns so the fallback runs at most once
+    return {}
+
+def warn(message):
+    # st.warning only reaches a page from the script thread; the shared-cache refresh and
+    # live polling threads have no session to show it in, so they log it instead
+    if get_script_run_ctx(suppress_warning=True) is not None:
+        st.warning(message)
+    else:
+        print(message)
+
+def download_universe(symbols, start_date, end_date, interval):
+    formats = symbol_formats()
+    tickers = {symbol: formats.get(symbol, symbol) for symbol in symbols}
+    
+    # One grouped request for every symbol, retried with exponential backoff and jitter
+    frames = retry_with_backoff(download_many, list(tickers.values()), start_date, end_date, interval)
+    results = {symbol: frames.get(ticker, pd.DataFrame()) for symbol, ticker in tickers.items()}
+    for symbol, df in results.items():
+        if not df.empty:
+            formats.setdefault(symbol, tickers[symbol])
+    
+    # Try alternative symbol format (without hyphen) for symbols that were never resolved
+    missing = [symbol for symbol, df in results.items() if df.empty and symbol not in formats]
+    if missing:
+        warn(f"No data available for {', '.join(missing)}. Trying alternative symbol format...")
+        alt_tickers = {symbol: symbol.replace('-', '') for symbol in missing}
+        alt_frames = retry_with_backoff(download_many, list(alt_tickers.values()), start_date, end_date, interval)
+        for symbol in missing:
+            df = alt_frames.get(alt_tickers[symbol], pd.DataFrame())
+            results[symbol] = df
+            formats[symbol] = alt_tickers[symbol] if not df.empty else symbol
+    
+    return results
+
+@st.cache_resource
+def shared_cache():
+    # Shared by every session and every server process (SQLite under data/), cached for 5 minutes
+    return SharedCache(ttl=300)
+
+def fetch_universe(symbols, days):
+    def fetch():
         # Calculate date range
-        end_date = datetime.now()
+        end_date = datetime.now(timezone.utc)
         start_date = end_date - timedelta(days=days)
         
         # For 1D and 5D, use 1h interval, otherwise use 1d
         interval = "1h" if days <= 5 else "1d"
         
-        # Download data with retries
-        for attempt in range(3):  # Try 3 times
-            try:
-                df = yf.download(
-                    tickers=symbol,
-                    start=start_date,
-                    end=end_date,
-                    interval=interval,
-                    progress=False,
-                    threads=False,  # Disable multi-threading to avoid potential issues ?
-                    timeout=10
-                )
-                if not df.empty:
-                    break
-            except Exception as e:
-                if attempt == 2:  # Last attempt
-                    raise e
-                time.sleep(1)  # Wait before retry
-        
-        if df.empty:
-            st.error(f"No data available for {symbol}. Trying alternative symbol format...")
-            # Try alternative symbol format
-            alt_symbol = symbol.replace('-', '')  # Try without hyphen
-            df = yf.download(
-                tickers=alt_symbol,
-                start=start_date,
-                end=end_date,
-                interval=interval,
-                progress=False,
-                threads=False
-            )
+        # Served from the local data store, missing bars for all symbols come from one batched download
+        return load_many(symbols, interval, start_date, end_date, fetch_many=download_universe)
+    
+    # Concurrent sessions share one in-flight fetch per (universe, timeframe)
+    return shared_cache().get(f"universe:{','.join(symbols)}:{days}", fetch)
+
+def cached_crypto_info(symbol):
+    return shared_cache().get(f"info:{symbol}", lambda: get_crypto_info(symbol))
+
+def fetch_crypto_data(symbol, days):
+    try:
+        # The whole universe is loaded and cached together, so switching symbols hits a warm cache
+        df = fetch_universe(tuple(crypto_options.values()), days).get(symbol, pd.DataFrame())
         
         if df.empty:
-            st.error(f"No data available for {symbol} or {alt_symbol}")
+            st.error(f"No data available for {symbol}")
             return pd.DataFrame()
             
         # Ensure all required columns exist
@@ -117,16 +154,74 @@ def fetch_crypto_data(symbol, days):
             st.error(f"Missing required price data for {symbol}")
             return pd.DataFrame()
             
-        return df
+        return df.copy()
         
     except Exception as e:
         st.error(f"Error fetching data: {str(e)}")
         return pd.DataFrame()
 
+@st.cache_data(ttl=300)
+def chart_payload(symbol, days, width=CHART_WIDTH):
+    # Downsampled candles and MA lines per (symbol, timeframe), plus the latest trading signal:
+    # the chart gets at most width / PIXELS_PER_CANDLE candles and `width` points per line,
+    # whatever the history length, and the signals are computed once for both
+    df = fetch_universe(tuple(crypto_options.values()), days).get(symbol, pd.DataFrame())
+    if df.empty:
+        return df, {}, None
+    df = calculate_signals(df.copy())
+    candles, lines = downsample_chart(df, lines=('SMA20', 'SMA50'), width=width)
+    return candles, lines, df['Signal'].iloc[-1]
+
+def live_bars_fetcher(symbols):
+    # Every poll downloads only the last few hourly bars (the forming bar and anything newer)
+    # into memory; they go to the store at most once per REFRESH_AFTER instead of rewriting
+    # every symbol's 1h file on each poll
+    last_write = 0.0
+
+    def fetch():
+        nonlocal last_write
+        end_date = datetime.now(timezone.utc)
+        frames = download_universe(symbols, end_date - timedelta(hours=3), end_date, "1h")
+        if time.time() - last_write >= REFRESH_AFTER:
+            for symbol, df in frames.items():
+                write_bars(symbol, "1h", df)
+            last_write = time.time()
+        return frames
+    return fetch
+
+@st.cache_resource
+def live_board():
+    # One board and one polling thread per server process, shared by every session
+    symbols = tuple(crypto_options.values())
+    board = LiveBoard()
+    board.seed(fetch_universe(symbols, 5))
+    board.start(poll_feed(live_bars_fetcher(symbols), interval=LIVE_REFRESH))
+    return board
+
+def show_debug_panel():
+    # Close this render's run, then list the last runs from every profiled process
+    profiling.end_run()
+    if not debug_mode:
+        return
+    with st.sidebar.expander("Profiling", expanded=True):
+        runs = profiling.load_runs(DEBUG_RUNS)
+        if not runs:
+            st.caption("No profiled runs yet.")
+            return
+        st.dataframe(pd.DataFrame([{'run': r['name'], 'started': r['started'], 'seconds': round(r['seconds'], 3),
+                                    'rss_peak_mb': r.get('rss_peak_mb'), 'pid': r['pid']} for r in runs[::-1]]),
+                     hide_index=True)
+        run_labels = [f"{r['started']} {r['name']}" for r in runs[::-1]]
+        picked = runs[::-1][run_labels.index(st.selectbox("Run", run_labels))]
+        st.dataframe(profiling.runs_frame([picked]).drop(columns=['run', 'started']).round(4), hide_index=True)
+        if picked['counters']:
+            st.json(picked['counters'])
+        st.caption(f"Log: {profiling.RUNS_LOG}, Prometheus: {profiling.PROM_FILE}")
+
 # Get data
-with st.spinner('Fetching cryptocurrency data...'):
+with st.spinner('Fetching cryptocurrency data...'), profiling.stage('fetch'):
     df = fetch_crypto_data(crypto_options[selected_crypto], timeframe_days[timeframe])
-    crypto_info = get_crypto_info(crypto_options[selected_crypto])
+    crypto_info = cached_crypto_info(crypto_options[selected_crypto])
 
 if not df.empty and crypto_info:
     # Display key metrics in a grid
@@ -167,45 +262,34 @@ if not df.empty and crypto_info:
         max_supply = crypto_info['max_supply']
         st.metric("Max Supply", f"{max_supply:,.0f}" if max_supply != "N/A" else "N/A")
 
-    # Calculate technical indicators
-    def calculate_signals(df):
-        # Simple example using Moving Averages
-        df['SMA20'] = df['Close'].rolling(window=20, min_periods=1).mean()
-        df['SMA50'] = df['Close'].rolling(window=50, min_periods=1).mean()
-        
-        # Generate trading signals (simple example)
-        df['Signal'] = 'HOLD'
-        df.loc[df['SMA20'] > df['SMA50'], 'Signal'] = 'BUY'
-        df.loc[df['SMA20'] < df['SMA50'], 'Signal'] = 'SELL'
-        
-        return df
-
-    df = calculate_signals(df)
+    with profiling.stage('chart_payload'):
+        candles, ma_lines, current_signal = chart_payload(crypto_options[selected_crypto], timeframe_days[timeframe])
+    profiling.count('candles_rendered', len(candles))
 
     # Create the main price chart
     fig = go.Figure()
 
     # Add candlestick chart
     fig.add_trace(go.Candlestick(
-        x=df.index,
-        open=df['Open'],
-        high=df['High'],
-        low=df['Low'],
-        close=df['Close'],
+        x=candles.index,
+        open=candles['Open'],
+        high=candles['High'],
+        low=candles['Low'],
+        close=candles['Close'],
         name='Price'
     ))
 
     # Add moving averages
     fig.add_trace(go.Scatter(
-        x=df.index,
-        y=df['SMA20'],
+        x=ma_lines['SMA20'].index,
+        y=ma_lines['SMA20'],
         name='20 Period MA',
         line=dict(color='orange')
     ))
 
     fig.add_trace(go.Scatter(
-        x=df.index,
-        y=df['SMA50'],
+        x=ma_lines['SMA50'].index,
+        y=ma_lines['SMA50'],
         name='50 Period MA',
         line=dict(color='blue')
     ))
@@ -220,10 +304,10 @@ if not df.empty and crypto_info:
     )
 
     # Display the chart
-    st.plotly_chart(fig, use_container_width=True)
+    with profiling.stage('render_chart'):
+        st.plotly_chart(fig, use_container_width=True)
 
     # Display current trading signal
-    current_signal = df['Signal'].iloc[-1]
     signal_color = {
         'BUY': 'green',
         'SELL': 'red',
@@ -236,6 +320,45 @@ if not df.empty and crypto_info:
         </div>
     """, unsafe_allow_html=True)
 
+    # HMM regime signal, precomputed by signal_producer.py (no model fitting here)
+    st.subheader("HMM Regime Signal")
+    with profiling.stage('read_hmm_signal'):
+        hmm_signal = read_latest(crypto_options[selected_crypto])
+    if hmm_signal is None:
+        st.info("No HMM signal available yet. Start the producer with `python signal_producer.py`.")
+    else:
+        hmm_col1, hmm_col2, hmm_col3 = st.columns(3)
+        hmm_col1.metric("Regime", hmm_signal['regime'].title())
+        hmm_col2.metric("Position", "Long" if hmm_signal['position'] else "Flat")
+        hmm_col3.metric("Action", hmm_signal['action'].upper())
+        last_action = (f"last {hmm_signal['last_action']} on {hmm_signal['last_action_at'][:10]}"
+                       if hmm_signal['last_action_at'] else "no trades yet")
+        st.caption(f"As of {hmm_signal['as_of'][:10]} ({last_action}), "
+                   f"updated {hmm_signal['age'] / 60:.0f} min ago")
+
+    # The live loop below never returns, so the render run ends here
+    show_debug_panel()
+
+    # Live signal: only this panel is re-sent, from the deltas the board recorded since the last loop
+    if live_mode:
+        st.subheader("Live Signal")
+        live_panel = st.empty()
+        board = live_board()
+        live_symbol = crypto_options[selected_crypto]
+        cursor = 0
+        while True:
+            deltas, cursor = board.deltas_since(cursor, {live_symbol})
+            if deltas:
+                latest = deltas[-1]
+                with live_panel.container():
+                    live_col1, live_col2, live_col3, live_col4 = st.columns(4)
+                    live_col1.metric("Live Price", f"${latest['close']:,.2f}")
+                    live_col2.metric("SMA20", f"${latest['SMA20']:,.2f}")
+                    live_col3.metric("SMA50", f"${latest['SMA50']:,.2f}")
+                    live_col4.metric("Live Signal", latest['signal'])
+                    st.caption(f"Last bar {latest['time']} ({len(deltas)} update(s) since last refresh)")
+            time.sleep(LIVE_REFRESH)
+
 else:
     st.error("""
     Unable to fetch cryptocurrency data. This could be due to:
@@ -247,4 +370,5 @@ else:
     1. Refreshing the page
     2. Selecting a different timeframe
     3. Checking your internet connection
-    """)
\ No newline at end of file
+    """)
+    show_debug_panel()
@@ -4,201 +4,145 @@
 #import hmmlearn
 #pip install hmmlearn
 #pip install yfinance pandas numpy scikit-learn hmmlearn matplotlib
-import yfinance as yf
 import numpy as np
 import pandas as pd
-from hmmlearn import hmm
-from sklearn.preprocessing import StandardScaler
-import matplotlib.pyplot as plt
-from datetime import datetime, timedelta
+from portfolio import positions_from_states, run_portfolio
+from metrics import performance_report, trade_counts
+from profiling import timed, count
 
 # ====================
-# Data Preparation
+# Data Preparation, Feature Engineering & HMM Modeling
 # ====================
-def fetch_crypto_data(tickers, start_date, end_date):
-    data = yf.download(tickers, start=start_date, end=end_date, interval='1d')
-    return data['Close']
+# Shared with the strategy module (re-exported here for existing callers)
+from strategy import fetch_crypto_data, create_features, fit_hmm, fit_hmm_many
 
-end_date = datetime.now()
-start_date = end_date - timedelta(days=365*3)  # 3 years of data
-btc_eth_data = fetch_crypto_data(['BTC-USD', 'ETH-USD'], start_date, end_date)
-
-# ====================
-# Feature Engineering
-# ====================
-def create_features(data):
-    returns = data.pct_change().dropna()
-    volatility = returns.rolling(window=30).std().shift(1)  # Prevent lookahead bias
-    mean_return = returns.rolling(window=30).mean().shift(1)
-    
-    features = pd.concat([
-        returns.rename('return'),
-        volatility.rename('volatility'),
-        mean_return.rename('mean_return')
-    ], axis=1).dropna()
-    
-    return features
-
-btc_features = create_features(btc_eth_data['BTC-USD'])
-eth_features = create_features(btc_eth_data['ETH-USD'])
-
-# ====================
-# HMM Modeling
-# ====================
-def fit_hmm(features, n_components=3):
-    scaler = StandardScaler()
-    scaled_features = scaler.fit_transform(features)
-    
-    model = hmm.GaussianHMM(
-        n_components=n_components,
-        covariance_type="diag",
-        n_iter=1000,
-        random_state=42
-    )
-    model.fit(scaled_features)
-    hidden_states = model.predict(scaled_features)
-    
-    return model, hidden_states, scaler
-
-btc_model, btc_states, _ = fit_hmm(btc_features)
-eth_model, eth_states, _ = fit_hmm(eth_features)
+__all__ = [
+    'fetch_crypto_data', 'create_features', 'fit_hmm', 'fit_hmm_many',
+    'interpret_states', 'asset_name', 'generate_portfolio_signals', 'generate_signals', 'signal_assets',
+    'run_backtest', 'analyze_performance', 'plot_results', 'analyze_trades',
+]
 
 # ====================
 # State Interpretation
 # ====================
+@timed()
 def interpret_states(features, states):
     state_df = features.copy()
     state_df['state'] = states
     
     state_means = state_df.groupby('state').mean()
     ordered_states = state_means['volatility'].sort_values().index
-    state_mapping = {ordered_states[0]: 0, ordered_states[1]: 1, ordered_states[2]: 2}
+    # 0=low volatility, 2=high, every state in between 1 (works for any n_components)
+    state_mapping = {state: 1 for state in ordered_states}
+    state_mapping[ordered_states[0]] = 0
+    state_mapping[ordered_states[-1]] = 2
     state_df['mapped_state'] = state_df['state'].map(state_mapping)
     
     return state_df
 
-btc_state_df = interpret_states(btc_features, btc_states)
-eth_state_df = interpret_states(eth_features, eth_states)
-
 # ====================
 # Signal Generation
 # ====================
-def generate_signals(btc_states, eth_states, btc_prices, eth_prices):
-    signals = pd.DataFrame(index=btc_states.index)
-    signals['btc_state'] = btc_states
-    signals['eth_state'] = eth_states
-    signals['btc_price'] = btc_prices
-    signals['eth_price'] = eth_prices
-    
-    # Initialize positions
-    signals['btc_position'] = 0
-    signals['eth_position'] = 0
-    
-    for i in range(1, len(signals)):
-        # BTC Rules
-        current_btc_state = signals['btc_state'].iloc[i]
-        prev_btc_state = signals['btc_state'].iloc[i-1]
-        
-        if current_btc_state == 0 and prev_btc_state != 0:
-            signals.at[signals.index[i], 'btc_position'] = 1
-        elif current_btc_state == 2:
-            signals.at[signals.index[i], 'btc_position'] = 0
-        else:
-            signals.at[signals.index[i], 'btc_position'] = signals['btc_position'].iloc[i-1]
-        
-        # ETH Rules
-        current_eth_state = signals['eth_state'].iloc[i]
-        prev_eth_state = signals['eth_state'].iloc[i-1]
-        
-        if current_eth_state == 0 and prev_eth_state != 0:
-            signals.at[signals.index[i], 'eth_position'] = 1
-        elif current_eth_state == 2:
-            signals.at[signals.index[i], 'eth_position'] = 0
-        else:
-            signals.at[signals.index[i], 'eth_position'] = signals['eth_position'].iloc[i-1]
-    
-    # Shift positions forward (execute next day)
-    signals['btc_position'] = signals['btc_position'].shift(1).fillna(0)
-    signals['eth_position'] = signals['eth_position'].shift(1).fillna(0)
+def asset_name(symbol):
+    # 'BTC-USD' -> 'btc', used as the column prefix in the signals frame
+    return symbol.split('-')[0].lower()
+
+@timed('generate_signals')
+def generate_portfolio_signals(states, prices):
+    """Signals frame for any number of assets
+
+    states: DataFrame of mapped states, prices: DataFrame of Close prices, both with one
+    column per symbol. Adds <asset>_state, <asset>_price and <asset>_position columns.
+    """
+    names = [asset_name(symbol) for symbol in states.columns]
+    signals = pd.DataFrame(index=states.index)
+    for name, symbol in zip(names, states.columns):
+        signals[f'{name}_state'] = states[symbol]
+    for name, symbol in zip(names, states.columns):
+        signals[f'{name}_price'] = prices[symbol].reindex(states.index)
+    
+    # Positions for every asset in one vectorized pass, executed the next day
+    positions = positions_from_states(states.to_numpy())
+    for i, name in enumerate(names):
+        signals[f'{name}_position'] = positions[:, i].astype(float)
     
     return signals
 
-signals = generate_signals(
-    btc_state_df['mapped_state'],
-    eth_state_df['mapped_state'],
-    btc_eth_data['BTC-USD'],
-    btc_eth_data['ETH-USD']
-)
+def generate_signals(btc_states, eth_states, btc_prices, eth_prices):
+    states = pd.DataFrame({'btc': btc_states, 'eth': eth_states}, index=btc_states.index)
+    prices = pd.DataFrame({'btc': btc_prices, 'eth': eth_prices})
+    return generate_portfolio_signals(states, prices)
+
+def signal_assets(signals):
+    """Asset prefixes of a signals frame, in column order"""
+    return [column[:-len('_position')] for column in signals.columns if column.endswith('_position')]
 
 # ====================
 # Backtest Execution
 # ====================
+@timed()
 def run_backtest(signals, fee=0.001):
-    # Calculate daily returns
-    signals['btc_return'] = signals['btc_price'].pct_change()
-    signals['eth_return'] = signals['eth_price'].pct_change()
-    
-    # Detect trades (position changes)
-    btc_trades = signals['btc_position'].diff().abs().fillna(0)
-    eth_trades = signals['eth_position'].diff().abs().fillna(0)
-    
-    # Calculate strategy returns (with fees)
-    signals['strategy_return'] = (
-        (signals['btc_position'] * signals['btc_return'] * (1 - fee * btc_trades)) +
-        (signals['eth_position'] * signals['eth_return'] * (1 - fee * eth_trades)))
+    assets = signal_assets(signals)
+    count('bars_backtested', len(signals) * len(assets))
+    if signals.empty:
+        # Nothing to trade: same columns as a normal run, no rows
+        for column in ([f'{name}_return' for name in assets] + ['strategy_return', 'strategy_cumulative']
+                       + [f'{name}_hold' for name in assets]):
+            signals[column] = pd.Series(dtype=float)
+        return signals
+    result = run_portfolio(signals[[f'{name}_position' for name in assets]].to_numpy(dtype=float),
+                           signals[[f'{name}_price' for name in assets]].to_numpy(dtype=float),
+                           fee=fee)
+    
+    # Daily returns
+    for name in assets:
+        signals[f'{name}_return'] = signals[f'{name}_price'].pct_change()
+    
+    # Strategy returns, with fees charged on traded notional (the first day has no return)
+    signals['strategy_return'] = result['returns']
+    signals.iloc[0, signals.columns.get_loc('strategy_return')] = np.nan
     
     # Cumulative returns
     signals['strategy_cumulative'] = (1 + signals['strategy_return']).cumprod()
-    signals['btc_hold'] = (1 + signals['btc_return']).cumprod()
-    signals['eth_hold'] = (1 + signals['eth_return']).cumprod()
+    for name in assets:
+        signals[f'{name}_hold'] = (1 + signals[f'{name}_return']).cumprod()
     
     return signals
 
-signals = run_backtest(signals, fee=0.001)  # 0.1% fee per trade
-
 # ====================
 # Performance Analysis
 # ====================
+@timed()
 def analyze_performance(signals):
-    # Calculate key metrics
-    total_days = len(signals)
-    years = total_days / 365
+    # Key metrics for the strategy and every buy & hold leg (see metrics.performance_report)
+    assets = signal_assets(signals)
+    returns = signals[['strategy_return'] + [f'{name}_return' for name in assets]]
+    report = performance_report(returns)
+    strategy = report.loc['strategy_return']
     
-    # Strategy metrics
-    total_return = signals['strategy_cumulative'].iloc[-1] - 1
-    cagr = (signals['strategy_cumulative'].iloc[-1] ** (1/years)) - 1
-    sharpe = (signals['strategy_return'].mean() / signals['strategy_return'].std()) * np.sqrt(252)
-    max_drawdown = (signals['strategy_cumulative'] / signals['strategy_cumulative'].cummax() - 1).min()
+    print(f"Strategy CAGR: {strategy['cagr']:.2%}")
+    print(f"Strategy Sharpe Ratio: {strategy['sharpe']:.2f}")
+    print(f"Strategy Max Drawdown: {strategy['max_drawdown']:.2%}")
+    print(f"Strategy Total Return: {strategy['total_return']:.2%}")
     
     # Benchmark metrics
-    btc_return = signals['btc_hold'].iloc[-1] - 1
-    eth_return = signals['eth_hold'].iloc[-1] - 1
-    
-    print(f"Strategy CAGR: {cagr:.2%}")
-    print(f"Strategy Sharpe Ratio: {sharpe:.2f}")
-    print(f"Strategy Max Drawdown: {max_drawdown:.2%}")
-    print(f"Strategy Total Return: {total_return:.2%}")
-    print(f"\nBTC Buy & Hold Return: {btc_return:.2%}")
-    print(f"ETH Buy & Hold Return: {eth_return:.2%}")
-    
-    return {
-        'cagr': cagr,
-        'sharpe': sharpe,
-        'max_drawdown': max_drawdown,
-        'total_return': total_return
-    }
-
-metrics = analyze_performance(signals)
+    print()
+    for name in assets:
+        print(f"{name.upper()} Buy & Hold Return: {report.loc[f'{name}_return', 'total_return']:.2%}")
+    
+    return strategy.to_dict()
 
 # ====================
 # Visualization
 # ====================
 def plot_results(signals):
+    import matplotlib.pyplot as plt  # Imported lazily, plotting is only needed for interactive runs
+    
     plt.figure(figsize=(12, 8))
     
     plt.plot(signals['strategy_cumulative'], label='HMM Strategy', linewidth=2)
-    plt.plot(signals['btc_hold'], label='BTC Buy & Hold', alpha=0.7)
-    plt.plot(signals['eth_hold'], label='ETH Buy & Hold', alpha=0.7)
+    for name in signal_assets(signals):
+        plt.plot(signals[f'{name}_hold'], label=f'{name.upper()} Buy & Hold', alpha=0.7)
     
     plt.title('HMM Trading Strategy vs Buy & Hold', fontsize=16)
     plt.xlabel('Date', fontsize=12)
@@ -208,45 +152,32 @@ def plot_results(signals):
     
     plt.show()
 
-plot_results(signals)
-
 # ====================
 # Trade Analysis
 # ====================
 def analyze_trades(signals):
     # Count trades
-    btc_trades = signals['btc_position'].diff().abs().sum()
-    eth_trades = signals['eth_position'].diff().abs().sum()
+    trades = trade_counts(signals[[f'{name}_position' for name in signal_assets(signals)]])
     
-    print(f"\nBTC Trades: {btc_trades:.0f}")
-    print(f"ETH Trades: {eth_trades:.0f}")
-    print(f"Total Trades: {btc_trades + eth_trades:.0f}")
-
-analyze_trades(signals)
+    print()
+    for column, n_trades in trades.items():
+        print(f"{column[:-len('_position')].upper()} Trades: {n_trades:.0f}")
+    print(f"Total Trades: {trades.sum():.0f}")
+    
+    return trades
 
 
 if __name__ == "__main__":
+    from pipeline import Pipeline
+    
     try:
-        # Fetch data
-        end_date = datetime.now()
-        start_date = end_date - timedelta(days=365*3)
-        btc_eth_data = fetch_crypto_data(['BTC-USD', 'ETH-USD'], start_date, end_date)
-        
-        # Generate and analyze signals
-        signals = generate_signals(
-            btc_state_df['mapped_state'],
-            eth_state_df['mapped_state'],
-            btc_eth_data['BTC-USD'],
-            btc_eth_data['ETH-USD']
-        )
-        
-        # Run backtest
-        signals = run_backtest(signals, fee=0.001)
+        # Fetch 3 years of data, fit the HMMs and backtest with a 0.1% fee per trade
+        pipeline = Pipeline(['BTC-USD', 'ETH-USD'], fee=0.001)
         
         # Display results
-        metrics = analyze_performance(signals)
-        plot_results(signals)
-        analyze_trades(signals)
+        metrics = pipeline.metrics
+        plot_results(pipeline.backtest)
+        analyze_trades(pipeline.backtest)
         
     except Exception as e:
         print(f"Error running backtest: {str(e)}")
\ No newline at end of file
@@ -0,0 +1,699 @@
+# Performance benchmarks
+# Per-feature micro-benchmarks on synthetic or stubbed inputs; most of them also assert
+# that the fast path matches its reference and meets its target.
+# Run with: python benchmark.py (regression suite: see benchmark_suite.py)
+import os
+import copy
+import time
+import asyncio
+import shutil
+import tempfile
+import threading
+import tracemalloc
+import multiprocessing
+import numpy as np
+import pandas as pd
+import cybo_api
+import profiling
+from profiling import timeit_best
+from cybo_api import CRYPTO_SYMBOLS, get_all_crypto_info, records_to_chunk, topic_interval
+from cybo_fetch import FetchManager
+from data_store import store_path, read_bars, missing_ranges
+from signal_engine import compute_signals, combine_actions
+from strategy import create_features, fit_hmm, fit_hmm_many
+from hmm_online import OnlineHMM
+from hmm_batch import decode_batch
+from features import create_features_panel, StreamingFeatures
+from feature_join import align_records
+from indicators import compute, IndicatorContext
+from portfolio import run_portfolio, positions_from_states
+from simulator import BarSimulator, load_bar_arrays
+from metrics import performance_report
+from downsample import downsample_chart
+from shared_cache import SharedCache
+from live import LiveBoard, replay_feed
+from pipeline import Pipeline
+from synthetic import regime_states, ohlcv_arrays, synthetic_flows, FakeDatasource
+
+HOURS_PER_YEAR = 24 * 365
+
+def _random_states(n_bars, n_assets, seed=42, stay=0.98):
+    # Sticky 3-state regime paths, roughly what a fitted HMM produces
+    return regime_states(n_bars, n_assets, seed, stay)
+
+def _regime_prices(n_bars, symbols, seed=42, stay=0.99):
+    # Close prices whose daily volatility switches between three sticky regimes
+    vols = np.array([0.01, 0.025, 0.06])
+    states = _random_states(n_bars, len(symbols), seed, stay)
+    rng = np.random.default_rng(seed + 1)
+    returns = rng.normal(0.0005, 1.0, size=states.shape) * vols[states]
+    index = pd.date_range('2015-01-01', periods=n_bars, freq='D')
+    return pd.DataFrame(100 * np.exp(np.cumsum(returns, axis=0)), index=index, columns=list(symbols))
+
+def _pandas_features(data, window=30):
+    # The original pandas create_features, kept as the reference implementation
+    returns = data.pct_change().dropna()
+    volatility = returns.rolling(window=window).std().shift(1)
+    mean_return = returns.rolling(window=window).mean().shift(1)
+    features = pd.concat([returns, volatility, mean_return], axis=1).dropna()
+    features.columns = ['return', 'volatility', 'mean_return']
+    return features
+
+def _loop_positions(states):
+    # Per-row reference implementation of the position rules
+    positions = np.zeros(len(states), dtype=np.int8)
+    for i in range(1, len(states)):
+        if states[i] == 0 and states[i-1] != 0:
+            positions[i] = 1
+        elif states[i] == 2:
+            positions[i] = 0
+        else:
+            positions[i] = positions[i-1]
+    return positions
+
+# ====================
+# Signal Engine
+# ====================
+def bench_signal_engine(years=10):
+    names = [symbol.split('-')[0] for symbol in CRYPTO_SYMBOLS]
+    n_bars = years * HOURS_PER_YEAR
+    states = _random_states(n_bars, len(names))
+
+    engine_time, (positions, actions) = timeit_best(compute_signals, states)
+    label_time, _ = timeit_best(combine_actions, actions, names)
+    loop_time, loop_positions = timeit_best(_loop_positions, states[:, 0], repeat=1)
+    assert (loop_positions == positions[:, 0]).all()
+
+    total_bars = n_bars * len(names)
+    print(f"Signal engine: {years}y hourly x {len(names)} assets ({total_bars:,} bars)")
+    print(f"  positions/actions: {engine_time * 1000:.1f} ms ({total_bars / engine_time:,.0f} bars/s)")
+    print(f"  action labels:     {label_time * 1000:.1f} ms")
+    print(f"  per-row loop (1 asset): {loop_time * 1000:.1f} ms "
+          f"-> est. {loop_time * len(names) / engine_time:.0f}x slower for the universe")
+
+# ====================
+# Crypto Info Snapshot
+# ====================
+def bench_crypto_info(latency=0.2):
+    # Local stand-ins for yf.Ticker(symbol).info with a fixed round-trip time
+    def stub_info(symbol):
+        time.sleep(latency)
+        return {'symbol': symbol}
+
+    def faulty_info(symbol):
+        if symbol == 'DOGE-USD':
+            raise ValueError("stub failure")
+        time.sleep(latency * 20 if symbol == 'MATIC-USD' else latency)  # MATIC hangs
+        return {'symbol': symbol}
+
+    print(f"Crypto info snapshot: {len(CRYPTO_SYMBOLS)} symbols, {latency * 1000:.0f} ms per call")
+    times = {}
+    for workers in (1, 2, 5, 10):
+        cybo_api._info_cache.clear()
+        times[workers], df = timeit_best(get_all_crypto_info, None, workers, 60, 300, stub_info, repeat=1)
+        print(f"  {workers:>2} workers: {times[workers] * 1000:6.0f} ms, {len(df)} symbols returned")
+        assert len(df) == len(CRYPTO_SYMBOLS)
+    assert times[10] < times[1] / 4, "10 workers should take well under the time of 1"
+    elapsed, df = timeit_best(get_all_crypto_info, None, 10, 60, 300, stub_info, repeat=1)
+    print(f"  warm cache: {elapsed * 1000:6.1f} ms, {len(df)} symbols returned")
+    assert len(df) == len(CRYPTO_SYMBOLS) and elapsed < latency / 2, "second call should be a cache hit"
+
+    # 3 workers need 4 rounds for 10 symbols, longer than the timeout: the deadline is per symbol
+    cybo_api._info_cache.clear()
+    timeout = latency * 3
+    elapsed, df = timeit_best(get_all_crypto_info, None, 3, timeout, 300, faulty_info, repeat=1)
+    print(f"  one failing + one hung symbol, {timeout * 1000:.0f} ms timeout: "
+          f"{elapsed * 1000:.0f} ms, {len(df)} symbols returned")
+    assert set(df['symbol']) == set(CRYPTO_SYMBOLS) - {'DOGE-USD', 'MATIC-USD'}, "expected partial results"
+    assert elapsed < latency * 20, "a hung symbol should not block the snapshot"
+    cybo_api._info_cache.clear()
+
+# ====================
+# Multi-Asset HMM Fitting
+# ====================
+def bench_fit_hmm_many(n_bars=1500, n_iter=100):
+    prices = _regime_prices(n_bars, CRYPTO_SYMBOLS)
+    features = {symbol: create_features(prices[symbol]) for symbol in prices}
+    cores = os.cpu_count() or 1
+
+    print(f"HMM fitting: {len(features)} symbols x {n_bars} daily bars, n_iter={n_iter}, {cores} cores")
+    times, fits = {}, {}
+    # n_jobs=2 always runs (even on one core) so the process pool path is checked against n_jobs=1
+    for n_jobs in sorted({1, 2, 4, cores}):
+        if n_jobs > max(cores, 2):
+            continue
+        times[n_jobs], fits[n_jobs] = timeit_best(fit_hmm_many, features, 3, n_jobs, n_iter, repeat=1)
+        print(f"  {n_jobs:>2} workers: {times[n_jobs]:6.2f} s (speedup {times[1] / times[n_jobs]:.1f}x)")
+
+    for n_jobs, models in fits.items():
+        for symbol, (model, states, _) in models.items():
+            reference, reference_states, _ = fits[1][symbol]
+            assert (np.array_equal(model.means_, reference.means_) and np.array_equal(model.transmat_, reference.transmat_)
+                    and np.array_equal(states, reference_states)), f"{symbol}: n_jobs={n_jobs} fit differs from n_jobs=1"
+    if cores > 1:
+        # Near-linear: at least half the ideal speedup on every core
+        ideal = min(cores, len(features))
+        assert times[1] / times[cores] >= ideal / 2, f"speedup below {ideal / 2:.1f}x on {cores} cores"
+    else:
+        print("  speedup check skipped: 1 core")
+
+# ====================
+# Incremental HMM Updates
+# ====================
+def bench_online_hmm(histories=(500, 1000, 2000, 4000), n_new=50):
+    prices = _regime_prices(max(histories) + n_new + 32, ['BTC-USD'])
+    features = create_features(prices['BTC-USD'])
+
+    print("HMM update per new bar: full refit vs warm-started window refit + forward filter")
+    for history in histories:
+        past, new = features.iloc[:history], features.iloc[history:history + n_new].to_numpy()
+        full_time, (model, _, scaler) = timeit_best(fit_hmm, past, repeat=1)
+        tracker = OnlineHMM(model, scaler, past, window=365, n_iter=5)
+        start = time.perf_counter()
+        for row in new:
+            tracker.update(row)
+        online_time = (time.perf_counter() - start) / n_new
+        print(f"  {history:>5} bars of history: full refit {full_time * 1000:7.1f} ms, "
+              f"online {online_time * 1000:5.2f} ms/bar")
+
+    # States the model never starts in (startprob 0) must filter without divide-by-zero warnings
+    model = copy.deepcopy(model)
+    model.startprob_ = np.eye(model.n_components)[0]
+    with np.errstate(divide='raise', invalid='raise'):
+        tracker = OnlineHMM(model, scaler, past, window=365, n_iter=0)
+    assert np.isfinite(tracker.log_alpha).any() and not np.isnan(tracker.log_alpha).any()
+    print("  forward filter with zero start/transition probabilities: no warnings, no NaN")
+
+# ====================
+# Feature Engine
+# ====================
+def bench_features(n_bars=80000, n_assets=10, histories=(1000, 10000, 75000), n_new=200):
+    symbols = [f"A{i}" for i in range(n_assets)]
+    prices = _regime_prices(n_bars, symbols)
+
+    print(f"Features for {n_assets} assets x {n_bars} bars")
+    pandas_time, reference = timeit_best(lambda: {symbol: _pandas_features(prices[symbol]) for symbol in symbols})
+    panel_time, panel = timeit_best(create_features_panel, prices)
+    worst = max(np.max(np.abs(panel[symbol].to_numpy() - reference[symbol].to_numpy())) for symbol in symbols)
+    print(f"  pandas rolling per symbol: {pandas_time * 1000:7.1f} ms")
+    print(f"  create_features_panel:     {panel_time * 1000:7.1f} ms (max abs diff {worst:.1e})")
+
+    # Streaming must match the batch features bar for bar, also across missing prices
+    n_check = min(n_bars, 20000)
+    gappy = prices.iloc[:n_check].copy()
+    gappy.iloc[np.arange(500, n_check, 997), 0] = np.nan
+    stream = StreamingFeatures(n_assets=n_assets)
+    stream.update(gappy.iloc[0].to_numpy())
+    streamed = np.array([np.column_stack(stream.update(row)) for row in gappy.to_numpy()[1:]])
+    for i, symbol in enumerate(symbols):
+        expected = create_features(gappy[symbol].dropna())
+        rows = gappy.index[1:].get_indexer(expected.index)
+        assert np.allclose(streamed[rows, i], expected.to_numpy(), rtol=1e-9, atol=1e-12), \
+            f"streaming features differ from create_features for {symbol}"
+    print(f"  StreamingFeatures matches create_features on {n_check} bars ({(gappy.isna().sum().sum())} missing prices)")
+
+    print("Features for one new bar: recompute with pandas vs StreamingFeatures.update")
+    for history in histories:
+        past = prices[symbols[0]].iloc[:history]
+        recompute_time, _ = timeit_best(_pandas_features, past)
+        stream = StreamingFeatures(n_assets=1)
+        for price in past.to_numpy():
+            stream.update(price)
+        new = prices[symbols[0]].iloc[history:history + n_new].to_numpy()
+        start = time.perf_counter()
+        for price in new:
+            stream.update(price)
+        stream_time = (time.perf_counter() - start) / len(new)
+        print(f"  {history:>6} bars of history: recompute {recompute_time * 1e6:8.1f} us, "
+              f"streaming {stream_time * 1e6:5.1f} us/bar")
+
+# ====================
+# Portfolio Backtester
+# ====================
+def bench_portfolio(shapes=((1000000, 2), (100000, 100), (20000, 500))):
+    print("Portfolio backtest (positions + prices -> returns, fees, equity, trades)")
+    rng = np.random.default_rng(42)
+    for n_bars, n_assets in shapes:
+        prices = (100 * np.exp(np.cumsum(rng.normal(0, 0.02, (n_bars, n_assets)), axis=0))).astype(np.float32)
+        positions = (_random_states(n_bars, n_assets) == 0).astype(np.int8)
+
+        tracemalloc.start()
+        elapsed, result = timeit_best(run_portfolio, positions, prices, 0.001, repeat=1)
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  {n_bars:>8} bars x {n_assets:>3} assets: {elapsed * 1000:7.1f} ms "
+              f"({n_bars * n_assets / elapsed / 1e6:5.1f}M values/s), peak {peak / 1e6:5.1f} MB, "
+              f"{result['trades'].sum()} trades")
+
+# ====================
+# Event-Driven Simulator
+# ====================
+def _hourly_bars(n_bars, n_assets, seed=42):
+    # Synthetic OHLCV bars with regime-switching volatility
+    return ohlcv_arrays(_random_states(n_bars, n_assets, seed, stay=0.995), seed)
+
+def bench_simulator(symbols=('BTC-USD', 'ETH-USD'), years=10, target=1e6):
+    try:
+        index, bars = load_bar_arrays(list(symbols), '1h')
+        source = f"stored 1h history ({len(index)} bars)"
+    except Exception:
+        index = None
+    if index is None or len(index) < HOURS_PER_YEAR:
+        bars = _hourly_bars(years * HOURS_PER_YEAR, len(symbols))
+        source = f"{years}y of synthetic 1h bars"
+    n_bars = len(bars['Close'])
+    targets = 0.5 * positions_from_states(_random_states(n_bars, len(symbols)))
+
+    print(f"Bar simulator (rebalancer), {len(symbols)} assets, {source}")
+    for fill_model in ('next_open', 'vwap', 'volume_slippage'):
+        simulator = BarSimulator(bars, fill_model=fill_model)
+        elapsed, result = timeit_best(simulator.run, targets)
+        # Time bars per second; only the bars with orders run Python code
+        rate = n_bars / elapsed
+        print(f"  {fill_model:<16} {elapsed * 1000:7.1f} ms, {rate / 1e6:5.2f}M bars/s, "
+              f"{len(result['fills'])} fills, final equity {result['equity'].iloc[-1]:,.0f}")
+        assert rate >= target, f"{fill_model} below {target / 1e6:.0f}M bars/s"
+
+    # An order whose fill bar has no price is re-queued and fills on the bar after
+    order_bar = int(np.flatnonzero(np.diff(targets[:, 0]) != 0)[0]) + 1
+    gappy = {column: values.copy() for column, values in bars.items()}
+    gappy['Open'][order_bar + 1, 0] = np.nan
+    result = BarSimulator(gappy).run(targets)
+    fill = next(fill for fill in result['fills'] if fill.asset == 0)
+    assert fill.bar == order_bar + 2 and np.isclose(fill.price, gappy['Open'][order_bar + 2, 0]), \
+        "a lapsed order should fill on the next bar"
+    print(f"  lapsed order from bar {order_bar} re-queued, filled on bar {fill.bar}")
+
+    # A target change on a bar without a close is sized against the last known close
+    gappy = {column: values.copy() for column, values in bars.items()}
+    gappy['Close'][order_bar, 0] = np.nan
+    result = BarSimulator(gappy).run(targets)
+    order = next(order for order in result['orders'] if order.asset == 0)
+    assert order.bar == order_bar and np.isfinite(order.quantity) and result['units'][order_bar + 1, 0] != 0, \
+        "a missing close should not drop the order"
+    print(f"  order on bar {order_bar} without a close sized against the last known close")
+
+# ====================
+# Performance Metrics
+# ====================
+def _pandas_metrics(returns):
+    # The previous per-series analyze_performance calculation, without the printing
+    cumulative = (1 + returns).cumprod()
+    return {
+        'cagr': cumulative.iloc[-1] ** (365 / len(returns)) - 1,
+        'sharpe': returns.mean() / returns.std() * np.sqrt(252),
+        'max_drawdown': (cumulative / cumulative.cummax() - 1).min(),
+        'total_return': cumulative.iloc[-1] - 1
+    }
+
+def bench_metrics(n_days=1000, curves=(10, 1000, 10000)):
+    print(f"Performance reports for many {n_days}-day equity curves")
+    rng = np.random.default_rng(42)
+    for n_curves in curves:
+        returns = pd.DataFrame(rng.normal(0.0005, 0.02, (n_days, n_curves)))
+        report_time, _ = timeit_best(performance_report, returns, repeat=1)
+        loop_curves = min(n_curves, 1000)
+        loop_time, _ = timeit_best(lambda: [_pandas_metrics(returns[c]) for c in returns.columns[:loop_curves]], repeat=1)
+        loop_time *= n_curves / loop_curves
+        print(f"  {n_curves:>6} curves: per-series pandas {loop_time * 1000:8.1f} ms (4 metrics), "
+              f"performance_report {report_time * 1000:7.1f} ms (9 metrics)")
+
+# ====================
+# Chart Downsampling
+# ====================
+def _chart_json_size(candles, lines):
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    fig.add_trace(go.Candlestick(x=candles.index, open=candles['Open'], high=candles['High'],
+                                 low=candles['Low'], close=candles['Close']))
+    for line in lines.values():
+        fig.add_trace(go.Scatter(x=line.index, y=line))
+    return len(fig.to_json())
+
+def bench_downsample(years=(1, 5)):
+    print("Chart payload (candles + SMA20/SMA50) for hourly history, full vs downsampled")
+    for n_years in years:
+        bars = _hourly_bars(n_years * HOURS_PER_YEAR, 1)
+        index = pd.date_range('2015-01-01', periods=len(bars['Close']), freq='h')
+        df = pd.DataFrame({column: values[:, 0] for column, values in bars.items()}, index=index)
+        df['SMA20'] = df['Close'].rolling(window=20, min_periods=1).mean()
+        df['SMA50'] = df['Close'].rolling(window=50, min_periods=1).mean()
+
+        elapsed, (candles, lines) = timeit_best(downsample_chart, df, ('SMA20', 'SMA50'))
+        full = _chart_json_size(df, {'SMA20': df['SMA20'], 'SMA50': df['SMA50']})
+        reduced = _chart_json_size(candles, lines)
+        print(f"  {n_years}y ({len(df)} bars): {full / 1e6:6.2f} MB -> {reduced / 1e6:5.2f} MB "
+              f"({len(candles)} candles), downsampling {elapsed * 1000:5.1f} ms")
+
+# ====================
+# Shared Cache
+# ====================
+def _session_worker(path, n_threads, symbols, latency, calls):
+    # One dashboard server process: n_threads sessions loading every symbol at once
+    cache = SharedCache(path, ttl=300)
+
+    def upstream(symbol):
+        with calls.get_lock():
+            calls.value += 1
+        time.sleep(latency)
+        return {'symbol': symbol}
+
+    def session():
+        for symbol in symbols:
+            cache.get(f"info:{symbol}", lambda symbol=symbol: upstream(symbol))
+
+    threads = [threading.Thread(target=session) for _ in range(n_threads)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+def bench_shared_cache(n_processes=5, sessions_per_process=10, latency=0.2):
+    symbols = list(CRYPTO_SYMBOLS)
+    path = os.path.join(tempfile.mkdtemp(), 'cache.sqlite')
+    calls = multiprocessing.Value('i', 0)
+
+    start = time.perf_counter()
+    workers = [multiprocessing.Process(target=_session_worker,
+                                       args=(path, sessions_per_process, symbols, latency, calls))
+               for _ in range(n_processes)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+
+    n_sessions = n_processes * sessions_per_process
+    print(f"Shared cache: {n_sessions} concurrent sessions in {n_processes} processes x {len(symbols)} symbols")
+    print(f"  upstream fetches: {calls.value} (uncached: {n_sessions * len(symbols)}), {elapsed:.2f}s total")
+    assert calls.value == len(symbols), "expected one upstream fetch per symbol per TTL window"
+
+    # Stale-while-revalidate: an expired value is served at once while one refresh runs
+    cache = SharedCache(path, ttl=0.1)
+    time.sleep(0.2)
+    refreshed = {'symbol': 'BTC-USD', 'refreshed': True}
+    hit_time, value = timeit_best(cache.get, 'info:BTC-USD', lambda: time.sleep(latency) or refreshed, repeat=1)
+    print(f"  stale read while revalidating: {hit_time * 1000:.1f} ms")
+    assert value == {'symbol': 'BTC-USD'} and hit_time < latency / 4, "stale read should return the old value at once"
+    time.sleep(latency * 2)
+    assert cache.get('info:BTC-USD', lambda: None, ttl=60) == refreshed, "background refresh should replace the value"
+
+# ====================
+# Live Signals
+# ====================
+def _recompute_sma_signal(close):
+    # What a dashboard rerun did per refresh: full rolling SMA20/SMA50 over the frame
+    sma20 = close.rolling(window=20, min_periods=1).mean()
+    sma50 = close.rolling(window=50, min_periods=1).mean()
+    return np.where(sma20 > sma50, 'BUY', np.where(sma20 < sma50, 'SELL', 'HOLD'))[-1]
+
+def bench_live(n_symbols=10, n_bars=5000, history=8760):
+    frames = {f"S{i}": _regime_prices(n_bars, ['Close'], seed=i) for i in range(n_symbols)}
+    board = LiveBoard()
+    start = time.perf_counter()
+    asyncio.run(board.run(replay_feed(frames)))
+    stream_time = (time.perf_counter() - start) / (n_symbols * n_bars)
+
+    close = _regime_prices(history, ['Close'])['Close']
+    recompute_time, _ = timeit_best(_recompute_sma_signal, close)
+    print(f"Live SMA20/SMA50 signal, {n_symbols} symbols x {n_bars} bars replayed")
+    print(f"  incremental: {stream_time * 1e6:6.2f} us/bar ({1 / stream_time:,.0f} bars/s incl. feed)")
+    print(f"  recompute over {history} bars: {recompute_time * 1e6:8.1f} us/bar")
+
+# ====================
+# Indicator Library
+# ====================
+INDICATOR_SET = {
+    'SMA20': ('sma', 20), 'SMA50': ('sma', 50), 'EMA12': ('ema', 12), 'EMA26': ('ema', 26),
+    'RSI14': ('rsi', 14), 'ATR14': ('atr', 14), 'BB20': ('bollinger', 20, 2),
+    'MACD': ('macd', 12, 26, 9), 'RV30': ('realized_vol', 30)
+}
+
+def _pandas_indicators(close, high, low):
+    # The same set, one pandas call chain per series
+    out = {
+        'SMA20': close.rolling(20).mean(), 'SMA50': close.rolling(50).mean(),
+        'EMA12': close.ewm(span=12, adjust=False).mean(), 'EMA26': close.ewm(span=26, adjust=False).mean()
+    }
+    delta = close.diff()
+    gain = delta.clip(lower=0).ewm(alpha=1 / 14, adjust=False, min_periods=14).mean()
+    loss = (-delta).clip(lower=0).ewm(alpha=1 / 14, adjust=False, min_periods=14).mean()
+    out['RSI14'] = 100 - 100 / (1 + gain / loss)
+    true_range = pd.concat([high - low, (high - close.shift()).abs(), (low - close.shift()).abs()], axis=1).max(axis=1)
+    out['ATR14'] = true_range.ewm(alpha=1 / 14, adjust=False, min_periods=14).mean()
+    mid, std = close.rolling(20).mean(), close.rolling(20).std()
+    out['BB20_upper'], out['BB20_lower'] = mid + 2 * std, mid - 2 * std
+    line = close.ewm(span=12, adjust=False).mean() - close.ewm(span=26, adjust=False).mean()
+    out['MACD_line'], out['MACD_signal'] = line, line.ewm(span=9, adjust=False).mean()
+    out['RV30'] = np.log(close / close.shift()).rolling(30).std() * np.sqrt(365)
+    return out
+
+def _exact_rolling_std(values, window):
+    # Two-pass sample std of every window; pandas' online rolling std drifts by ~1e-6 on
+    # long price series, so it cannot be the reference at 1e-9
+    out = np.full(len(values), np.nan)
+    out[window - 1:] = np.lib.stride_tricks.sliding_window_view(values, window).std(axis=1, ddof=1)
+    return out
+
+def bench_indicators(shapes=((100000, 10), (10000, 100), (1000000, 1)), tolerance=1e-9):
+    print(f"Indicator set ({', '.join(INDICATOR_SET)})")
+    # Warm up (scipy.signal import, lfilter's first call) outside the timed runs
+    compute(IndicatorContext(_hourly_bars(100, 2)), INDICATOR_SET)
+    for n_bars, n_assets in shapes:
+        bars = _hourly_bars(n_bars, n_assets)
+        frames = {field: pd.DataFrame(values) for field, values in bars.items()}
+        pandas_time, reference = timeit_best(lambda: [_pandas_indicators(frames['Close'][i], frames['High'][i], frames['Low'][i])
+                                                  for i in range(n_assets)], repeat=1)
+        ctx_holder = []
+        def run():
+            ctx_holder[:] = [IndicatorContext(bars)]
+            return compute(ctx_holder[0], INDICATOR_SET)
+        registry_time, results = timeit_best(run)
+
+        worst = 0.0
+        for i in range(n_assets):
+            expected = dict(reference[i])
+            band = 2 * _exact_rolling_std(bars['Close'][:, i], 20)
+            expected['BB20_upper'] = expected['SMA20'].to_numpy() + band
+            expected['BB20_lower'] = expected['SMA20'].to_numpy() - band
+            for name, values in expected.items():
+                values = np.asarray(values, dtype=float)
+                assert np.array_equal(np.isnan(results[name][:, i]), np.isnan(values)), f"{name} NaNs differ"
+                worst = max(worst, np.nanmax(np.abs(results[name][:, i] - values), initial=0.0))
+        assert worst < tolerance, f"indicators differ from the reference by {worst:.1e}"
+        print(f"  {n_bars:>7} bars x {n_assets:>3} assets: per-series pandas {pandas_time * 1000:7.1f} ms, "
+              f"registry {registry_time * 1000:6.1f} ms ({ctx_holder[0].hits} shared intermediates reused, "
+              f"max abs diff {worst:.1e})")
+
+# ====================
+# Profiling Overhead
+# ====================
+def _profiled_pipeline(prices):
+    # Runs in a fresh interpreter started with HMM_PROFILE=1, so the pipeline's @timed
+    # functions are wrapped when their modules are imported
+    profiling.enable(trace_memory=True)
+    with profiling.run('pipeline', export=False):
+        Pipeline(list(prices.columns), prices=prices, use_registry=False, n_jobs=1).backtest
+    return profiling.RUNS[-1]
+
+def bench_profiling(n_calls=200000, max_off_ns=250):
+    def body(x):
+        profiling.count('calls')
+        return x
+
+    def bare(x):
+        return x
+
+    def loop(fn):
+        for i in range(n_calls):
+            fn(i)
+
+    enabled = profiling.is_enabled()
+    profiling.disable()
+    off = profiling.timed('noop')(body)
+    assert off is body, "@timed should not wrap while profiling is off"
+    profiling.enable()
+    on = profiling.timed('noop')(body)
+    if not enabled:
+        profiling.disable()
+    bare_time, _ = timeit_best(loop, bare, repeat=7)
+    off_time, _ = timeit_best(loop, off, repeat=7)
+    with profiling.run('bench', force=True, export=False):
+        on_time, _ = timeit_best(loop, on)
+    off_ns = (off_time - bare_time) / n_calls * 1e9
+    print(f"Profiling overhead per instrumented call ({n_calls} calls, one @timed function + one count)")
+    print(f"  off: {off_ns:6.0f} ns, on: {(on_time - bare_time) / n_calls * 1e9:6.0f} ns")
+    assert off_ns < max_off_ns, f"profiling off should cost under {max_off_ns} ns per call, got {off_ns:.0f} ns"
+
+    # One profiled pipeline pass: per-stage time, allocation peaks and counters
+    prices = _regime_prices(1500, ['BTC-USD', 'ETH-USD'])
+    previous = os.environ.get('HMM_PROFILE')
+    os.environ['HMM_PROFILE'] = '1'
+    try:
+        with multiprocessing.get_context('spawn').Pool(1) as pool:
+            result = pool.apply(_profiled_pipeline, (prices,))
+    finally:
+        if previous is None:
+            del os.environ['HMM_PROFILE']
+        else:
+            os.environ['HMM_PROFILE'] = previous
+    print(f"Profiled pipeline run: {result['seconds']:.2f}s")
+    for name, stage in result['stages'].items():
+        print(f"  {name:<22} {stage['seconds'] * 1000:9.1f} ms  peak {stage['peak_mb']:6.1f} MB")
+    print(f"  counters: {result['counters']}")
+
+# ====================
+# Batched Decoding
+# ====================
+def bench_batch_decode(shapes=((100, 1000), (500, 365), (10, 5000))):
+    features = create_features(_regime_prices(5031, ['BTC-USD'])['BTC-USD'])
+    model, _, scaler = fit_hmm(features, n_iter=30)
+    scaled = scaler.transform(features)
+    rng = np.random.default_rng(0)
+
+    print("HMM decoding: per-model predict + predict_proba vs one decode_batch call (Viterbi + filtered + smoothed)")
+    for n_sequences, n_bars in shapes:
+        # Perturbed copies stand in for per-symbol fits and histories
+        sequences = [scaled[-n_bars:] + rng.normal(0, 0.05, (n_bars, scaled.shape[1])) for _ in range(n_sequences)]
+        models = [copy.deepcopy(model) for _ in range(n_sequences)]
+        loop_time, expected = timeit_best(lambda: [m.predict(x) for m, x in zip(models, sequences)]
+                                      + [m.predict_proba(x) for m, x in zip(models, sequences)])
+        batch_time, result = timeit_best(decode_batch, sequences, models, None, True)
+        same = all((a == b).all() for a, b in zip(result['states'], expected[:n_sequences]))
+        assert same, "batched Viterbi paths differ from model.predict"
+        assert all(np.allclose(a, b) for a, b in zip(result['smoothed'], expected[n_sequences:])), \
+            "smoothed probabilities differ from model.predict_proba"
+        # Filtered probabilities at bar t are the posterior of the sequence cut after t
+        for i in (0, n_sequences - 1):
+            for t in (n_bars // 2, n_bars - 1):
+                assert np.allclose(result['filtered'][i][t], models[i].predict_proba(sequences[i][:t + 1])[-1]), \
+                    "filtered probabilities differ from predict_proba on the prefix"
+        print(f"  {n_sequences:>4} sequences x {n_bars:>5} bars: loop {loop_time * 1000:7.1f} ms, "
+              f"batch {batch_time * 1000:7.1f} ms (x{loop_time / batch_time:4.1f}), same states: {same}")
+
+# ====================
+# On-Chain Feature Join
+# ====================
+def _pandas_window_join(flows, days, lag):
+    # Per-bar boolean mask over every record: O(bars x records)
+    available = flows.index.tz_convert(None) + pd.Timedelta(hours=1) + lag
+    out = []
+    for day in days:
+        close = day + pd.Timedelta(days=1)
+        mask = (available <= close) & (available > close - pd.Timedelta(days=1))
+        out.append(flows['flow_total'][mask].sum() if mask.any() else np.nan)
+    return pd.Series(out, index=days)
+
+def _pandas_resample_join(flows, days, lag):
+    # Calendar resample then merge_asof on availability time (the usual pandas route)
+    shifted = flows[['flow_total']].set_axis(flows.index.tz_convert(None) + pd.Timedelta(hours=1) + lag)
+    daily = shifted.resample('D', label='right', closed='right').sum()
+    bars = pd.DataFrame({'close': days + pd.Timedelta(days=1)})
+    return pd.merge_asof(bars, daily.rename_axis('close').reset_index(), on='close')
+
+def bench_feature_join(years=5):
+    hours = pd.date_range('2019-01-01', periods=years * HOURS_PER_YEAR, freq='h')
+    flows = synthetic_flows(_random_states(len(hours), 1, stay=0.999)[:, 0], hours)
+    days = pd.date_range('2019-01-02', periods=years * 365 - 2, freq='D')
+    lag = pd.Timedelta(hours=1)
+
+    window_time, expected = timeit_best(_pandas_window_join, flows, days, lag, repeat=1)
+    resample_time, resampled = timeit_best(_pandas_resample_join, flows, days, lag)
+    join_time, joined = timeit_best(align_records, flows, days, ['flow_total'], 'sum', None, lag)
+    same = np.allclose(joined['flow_total'].to_numpy(), expected.to_numpy(), equal_nan=True)
+    assert same, "as-of join differs from the per-bar mask"
+    assert np.allclose(resampled['flow_total'].to_numpy(), expected.to_numpy(), equal_nan=True), \
+        "resample + merge_asof differs from the per-bar mask"
+    print(f"On-chain as-of join, {len(flows)} hourly records -> {len(days)} daily bars")
+    print(f"  pandas per-bar mask   {window_time * 1000:8.1f} ms")
+    print(f"  pandas resample+asof  {resample_time * 1000:8.1f} ms")
+    print(f"  searchsorted kernel   {join_time * 1000:8.1f} ms (same values: {same})")
+
+# ====================
+# Concurrent Topic Fetch
+# ====================
+def bench_fetch_manager(n_topics=12, latency=0.05, failure_rate=0.1):
+    topics = [f"fake|bench/topic-{i}?window=hour" for i in range(n_topics)]
+    start, end = pd.Timestamp('2023-01-01', tz='UTC'), pd.Timestamp('2024-01-01', tz='UTC')
+    jobs = [(topic, start, end) for topic in topics]
+    # Ground truth straight from the fake: every hourly record of the year, per topic
+    truth = FakeDatasource()
+    expected = {topic: records_to_chunk(truth.records(topic, int(start.timestamp() * 1000), HOURS_PER_YEAR))[0]
+                for topic in topics}
+
+    def fetch(fake, settings):
+        manager = FetchManager(query=fake.query, store=False, **settings)
+        return asyncio.run(manager.run(jobs)), manager
+
+    def check(frames):
+        return all(frames[topic].equals(expected[topic]) for topic in topics)
+
+    sequential = FakeDatasource(latency)
+    seq_time, (frames, _) = timeit_best(fetch, sequential, {'max_concurrency': 1, 'rate': None, 'slice_pages': None},
+                                    repeat=1)
+    assert check(frames), "sequential fetch returned wrong records"
+    flaky = FakeDatasource(latency, failure_rate)
+    managed_time, (frames, manager) = timeit_best(fetch, flaky, {'max_concurrency': 128, 'rate': None,
+                                                             'base_delay': latency}, repeat=1)
+    report = manager.report
+    assert not report['failed'] and report['retries'] == flaky.failures and check(frames), \
+        "failed pages should be retried until every record is in"
+    print(f"Cybotrade fetch, {n_topics} topics x 1 year hourly, {latency * 1000:.0f} ms per request")
+    print(f"  one topic at a time  {seq_time:6.2f} s ({sequential.calls} requests)")
+    print(f"  fetch manager        {managed_time:6.2f} s ({report['slices']} slices, {flaky.peak_in_flight} in flight, "
+          f"{report['retries']} retried pages at {failure_rate:.0%} failures), slowest slice "
+          f"{report['slowest_slice_seconds']:.2f} s")
+    assert managed_time < seq_time / 4, "slices should be fetched concurrently"
+
+    # Without retries some slices fail; retry_failed() reruns only those
+    broken = FakeDatasource(latency, 0.5)
+    _, (frames, manager) = timeit_best(fetch, broken, {'max_concurrency': 128, 'rate': None, 'max_attempts': 1},
+                                   repeat=1)
+    failed = len(manager.failed())
+    assert failed and not check(frames)
+    broken.failure_rate, calls = 0.0, broken.calls
+    frames = asyncio.run(manager.retry_failed())
+    assert not manager.failed() and check(frames) and broken.calls - calls == failed
+    print(f"  retry_failed         {failed} failed slices rerun with {broken.calls - calls} requests, all records in")
+
+    # A stored stream leaves one compacted file and marks its range as fetched
+    topic = "fake|bench/stream?window=hour"
+    base = store_path(topic, topic_interval(topic), 'cybotrade')[:-len('.parquet')]
+    stream_end = start + pd.Timedelta(days=30)
+
+    async def stream():
+        manager = FetchManager(query=FakeDatasource(0.0).query, page_size=24, rate=None)
+        return [chunk async for chunk in manager.stream(topic, start, stream_end)]
+
+    try:
+        chunks = asyncio.run(stream())
+        stored = read_bars(topic, topic_interval(topic), start, stream_end, kind='cybotrade')
+        assert not os.listdir(f"{base}.parts"), "streamed pages should be compacted"
+        assert len(stored) == sum(len(chunk) for chunk in chunks) == 30 * 24
+        assert not missing_ranges(topic, topic_interval(topic), start, stream_end, kind='cybotrade'), \
+            "a finished stream should be marked as fetched"
+        print(f"  stream(store=True)   {len(chunks)} pages stored, compacted and marked as fetched")
+    finally:
+        shutil.rmtree(f"{base}.parts", ignore_errors=True)
+        for leftover in [f"{base}.parquet", f"{base}.from"]:
+            if os.path.exists(leftover):
+                os.remove(leftover)
+
+
+if __name__ == "__main__":
+    bench_signal_engine()
+    bench_crypto_info()
+    bench_fit_hmm_many()
+    bench_online_hmm()
+    bench_features()
+    bench_portfolio()
+    bench_simulator()
+    bench_metrics()
+    bench_downsample()
+    bench_shared_cache()
+    bench_live()
+    bench_indicators()
+    bench_profiling()
+    bench_batch_decode()
+    bench_feature_join()
+    bench_fetch_manager()
@@ -0,0 +1,158 @@
+# Benchmark regression suite
+# Times the main pipeline functions on synthetic regime-switching markets of 1k/100k/10M
+# bars x 2/10/100 assets and stores the results per commit as JSON:
+#   python benchmark_suite.py [--quick] [--max-values N]   -> data/benchmarks/<commit>.json
+#   python benchmark_suite.py compare OLD.json NEW.json    (exit code 1 on regressions)
+# Every case runs by default; the 10M x 100 market alone needs well over 40 GB of RAM, so on smaller
+# machines pass --quick (skips 10M bars) or --max-values N (skips cases over N bars x assets).
+import os
+import io
+import sys
+import json
+import time
+import platform
+import subprocess
+from contextlib import redirect_stdout
+import numpy as np
+import pandas as pd
+from profiling import timeit_best
+from data_store import DATA_DIR
+from strategy import create_features, fit_hmm
+from backtest import generate_portfolio_signals, run_backtest, analyze_performance
+from indicators import calculate_signals
+from synthetic import synthetic_market, close_frame, ohlcv_frames
+
+SUITE_BARS = (1000, 100000, 10000000)
+SUITE_ASSETS = (2, 10, 100)
+SUITE_FIT_MAX_BARS = 100_000    # EM costs ~25 s per iteration at 10M bars, larger fits are skipped
+SUITE_FIT_ITER = 5              # EM iterations per fit_hmm case (ns_per_value is per iteration)
+SUITE_DIR = os.path.join(DATA_DIR, 'benchmarks')
+REGRESSION_RATIO = 1.2          # compare flags cases at least this much slower
+
+def _git_commit():
+    # (short commit hash, uncommitted changes?) of the working tree
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                check=True).stdout.strip()
+        dirty = bool(subprocess.run(['git', 'status', '--porcelain', '--untracked-files=no'],
+                                    capture_output=True, text=True).stdout.strip())
+        return commit, dirty
+    except Exception:
+        return 'unknown', False
+
+def _features_by_symbol(close):
+    return {symbol: create_features(close[symbol]) for symbol in close}
+
+def _fit_model(features):
+    return fit_hmm(features, n_iter=SUITE_FIT_ITER)[0]
+
+def _quiet_performance(signals):
+    with redirect_stdout(io.StringIO()):
+        return analyze_performance(signals)
+
+def _frames_signals(frames):
+    return [calculate_signals(df) for df in frames.values()]
+
+def _suite_case(n_bars, n_assets, fit_max_bars=SUITE_FIT_MAX_BARS):
+    """{function: result} for one synthetic market of n_bars x n_assets"""
+    market = synthetic_market(n_bars, n_assets)
+    close = close_frame(market)
+    repeat = 3 if n_bars * n_assets <= 1_000_000 else 1
+    results = {}
+
+    def record(name, func, *args, values=n_bars * n_assets):
+        elapsed, result = timeit_best(func, *args, repeat=repeat)
+        results[name] = {'seconds': elapsed, 'ns_per_value': elapsed / values * 1e9}
+        return result
+
+    features = record('create_features', _features_by_symbol, close)
+    if n_bars <= fit_max_bars:
+        # One asset, a fixed number of EM iterations (per-asset fits are independent)
+        model = record('fit_hmm', _fit_model, features[market['symbols'][0]])
+        results['fit_hmm']['ns_per_value'] = results['fit_hmm']['seconds'] / (n_bars * model.monitor_.iter) * 1e9
+        results['fit_hmm']['em_iterations'] = model.monitor_.iter
+    else:
+        results['fit_hmm'] = {'skipped': f"over {fit_max_bars} bars"}
+    del features
+
+    # The generated regimes stand in for fitted HMM states
+    states = pd.DataFrame(market['states'], index=market['index'], columns=market['symbols'])
+    signals = record('generate_signals', generate_portfolio_signals, states, close)
+    # run_backtest / calculate_signals only (re)assign their output columns, so reruns are equivalent
+    record('run_backtest', run_backtest, signals)
+    record('analyze_performance', _quiet_performance, signals)
+    del signals, states, close
+    frames = ohlcv_frames(market)
+    record('calculate_signals', _frames_signals, frames)
+    return results
+
+def run_suite(bars=SUITE_BARS, assets=SUITE_ASSETS, max_values=None, path=None):
+    """Run every (bars, assets) case and write the results as JSON; returns the results dict
+
+    max_values: skip cases over this many bars x assets (None: run them all).
+    """
+    commit, dirty = _git_commit()
+    suite = {
+        'commit': commit,
+        'dirty': dirty,
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'pandas': pd.__version__,
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'settings': {'max_values': max_values, 'fit_max_bars': SUITE_FIT_MAX_BARS,
+                     'fit_iter': SUITE_FIT_ITER, 'seed': 42},
+        'cases': []
+    }
+    print(f"Benchmark suite at {commit}{' (uncommitted changes)' if dirty else ''}")
+    for n_bars in bars:
+        for n_assets in assets:
+            if max_values is not None and n_bars * n_assets > max_values:
+                suite['cases'].append({'bars': n_bars, 'assets': n_assets, 'skipped': f"over {max_values} values"})
+                print(f"  {n_bars:>9} bars x {n_assets:>3} assets: skipped (over {max_values:,} values)")
+                continue
+            for function, result in _suite_case(n_bars, n_assets).items():
+                suite['cases'].append({'bars': n_bars, 'assets': n_assets, 'function': function, **result})
+                timing = result.get('skipped') or f"{result['seconds'] * 1000:10.1f} ms ({result['ns_per_value']:7.1f} ns/value)"
+                print(f"  {n_bars:>9} bars x {n_assets:>3} assets  {function:<20} {timing}")
+
+    path = path or os.path.join(SUITE_DIR, f"{commit}{'-dirty' if dirty else ''}.json")
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(suite, f, indent=1)
+    print(f"Results written to {path}")
+    return suite
+
+def compare_suites(old_path, new_path, threshold=REGRESSION_RATIO):
+    """Print new / old time per case; returns the (bars, assets, function) keys that regressed"""
+    with open(old_path) as f:
+        old = json.load(f)
+    with open(new_path) as f:
+        new = json.load(f)
+    old_cases = {(c['bars'], c['assets'], c.get('function')): c for c in old['cases'] if 'seconds' in c}
+
+    print(f"{old['commit']} -> {new['commit']} (ratio = new / old time)")
+    regressions = []
+    for case in new['cases']:
+        key = (case['bars'], case['assets'], case.get('function'))
+        if 'seconds' not in case or key not in old_cases:
+            continue
+        ratio = case['seconds'] / old_cases[key]['seconds']
+        flag = ''
+        if ratio >= threshold:
+            flag = '  REGRESSION'
+            regressions.append(key)
+        elif ratio <= 1 / threshold:
+            flag = '  faster'
+        print(f"  {key[0]:>9} x {key[1]:>3}  {key[2]:<20} {old_cases[key]['seconds'] * 1000:10.1f} ms -> "
+              f"{case['seconds'] * 1000:10.1f} ms  x{ratio:5.2f}{flag}")
+    return regressions
+
+
+if __name__ == "__main__":
+    if sys.argv[1:2] == ['compare']:
+        sys.exit(1 if compare_suites(sys.argv[2], sys.argv[3]) else 0)
+    else:
+        max_values = int(sys.argv[sys.argv.index('--max-values') + 1]) if '--max-values' in sys.argv else None
+        run_suite(bars=SUITE_BARS[:2] if '--quick' in sys.argv else SUITE_BARS, max_values=max_values)
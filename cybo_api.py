@@ -1,12 +1,17 @@
 # import api key
 # pip install cybotrade-datasource
 import os
-import cybotrade_datasource
+import numpy as np
 import pandas as pd
 import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import yfinance as yf
 from dotenv import load_dotenv
 from datetime import datetime, timezone
+from urllib.parse import parse_qs, urlparse
+from data_store import INTERVALS
 
 # load from .env
 load_dotenv()
@@ -59,44 +64,183 @@ def get_crypto_info(symbol):
         print(f"Error fetching data for {symbol}: {str(e)}")
         return None
 
-def get_all_crypto_info():
-    """Get detailed information for all tracked cryptocurrencies"""
-    results = []
-    for symbol in CRYPTO_SYMBOLS.keys():
-        info = get_crypto_info(symbol)
-        if info:
-            results.append(info)
-    return pd.DataFrame(results)
+# Per-symbol cache for get_all_crypto_info: symbol -> (fetched_at, info)
+INFO_TTL = 300  # seconds
+_info_cache = {}
+_info_lock = threading.Lock()
 
-# print(api_key) # testing
-async def main():
-    data = await cybotrade_datasource.query_paginated(
-        api_key=API_KEY,
-        topic='cryptoquant|btc/inter-entity-flows/miner-to-miner?from_miner=f2pool&to_miner=all_miner&window=hour',
-        start_time=datetime(year=2023, month=1, day=1, tzinfo=timezone.utc),
-        end_time=datetime(year=2024, month=1, day=1, tzinfo=timezone.utc)
-    )
-    df = pd.DataFrame(data)
-    print(df)
-
-async def get_data(startyear, startmonth,startday,endyear,endmonth,endday):
-    data = await cybotrade_datasource.query_paginated(
-        api_key=API_KEY,
-        topic='cryptoquant|btc/inter-entity-flows/miner-to-miner?from_miner=f2pool&to_miner=all_miner&window=hour',
-        start_time=datetime(year=startyear, month=startmonth, day=startday, tzinfo=timezone.utc),
-        end_time=datetime(year=endyear, month=endmonth, day=endday, tzinfo=timezone.utc)
-    )
-    df = pd.DataFrame(data)
-    print(df)
-
-async def get_data_latest():
-    data = await cybotrade_datasource.query_paginated(
-        api_key=API_KEY,
-        topic='cryptoquant|btc/inter-entity-flows/miner-to-miner?from_miner=f2pool&to_miner=all_miner&window=hour',
-        limit=10000
-    )
+def get_all_crypto_info(symbols=None, max_workers=10, timeout=10, ttl=INFO_TTL, fetch_info=get_crypto_info):
+    """Get detailed information for all tracked cryptocurrencies
+
+    Symbols fetched within the last `ttl` seconds come from the cache; the rest are
+    fetched concurrently on a bounded thread pool, so a full snapshot costs about one
+    round-trip. Each symbol gets `timeout` seconds from the moment a worker starts on it,
+    so symbols queued behind a slow one are not dropped. Symbols that fail or time out
+    (or can never start because every worker is stuck on a timed-out call) are left out
+    of the result instead of failing the whole snapshot.
+    """
+    symbols = list(symbols or CRYPTO_SYMBOLS.keys())
+    results = {}
+    to_fetch = []
+    
+    now = time.monotonic()
+    with _info_lock:
+        for symbol in symbols:
+            cached = _info_cache.get(symbol)
+            if cached and now - cached[0] < ttl:
+                results[symbol] = cached[1]
+            else:
+                to_fetch.append(symbol)
+    
+    if to_fetch:
+        workers = min(max_workers, len(to_fetch))
+        started = {}  # symbol -> time a worker picked it up
+
+        def fetch(symbol):
+            started[symbol] = time.monotonic()
+            return fetch_info(symbol)
+
+        pool = ThreadPoolExecutor(max_workers=workers)
+        futures = {pool.submit(fetch, symbol): symbol for symbol in to_fetch}
+        pending = set(futures)
+        timed_out = []
+        while pending:
+            now = time.monotonic()
+            expired = {f for f in pending if futures[f] in started and now - started[futures[f]] >= timeout}
+            pending -= expired
+            timed_out += expired
+            if pending and sum(not f.done() for f in timed_out) >= workers:
+                # Every worker is held by a timed-out call, the queued symbols would never start
+                timed_out += pending
+                pending = set()
+            if not pending:
+                break
+            deadlines = [started[futures[f]] + timeout for f in pending if futures[f] in started]
+            done, pending = wait(pending, timeout=max(min(deadlines, default=now + timeout) - now, 0.001),
+                                 return_when=FIRST_COMPLETED)
+            
+            for future in done:
+                symbol = futures[future]
+                try:
+                    info = future.result()
+                except Exception as e:
+                    print(f"Error fetching data for {symbol}: {str(e)}")
+                    continue
+                if info:
+                    results[symbol] = info
+                    with _info_lock:
+                        _info_cache[symbol] = (time.monotonic(), info)
+        # Don't block on slow symbols, their threads finish in the background
+        pool.shutdown(wait=False, cancel_futures=True)
+        for future in timed_out:
+            print(f"Timed out fetching data for {futures[future]}")
+    
+    return pd.DataFrame([results[symbol] for symbol in symbols if symbol in results])
+
+# f2pool miner-to-miner flows, stored locally under data/cybotrade/
+MINER_FLOW_TOPIC = 'cryptoquant|btc/inter-entity-flows/miner-to-miner?from_miner=f2pool&to_miner=all_miner&window=hour'
+
+def topic_interval(topic):
+    """Bar interval of a Datasource topic, taken from its `window` parameter (hour by default)"""
+    query = parse_qs(urlparse(topic.split('|', 1)[-1]).query)
+    return query.get('window', ['hour'])[0]
+
+def records_to_frame(data):
+    """Turn Datasource records into a DataFrame indexed by their start_time (ms epoch)"""
     df = pd.DataFrame(data)
-    print(df)
+    if not df.empty and 'start_time' in df.columns:
+        df.index = pd.to_datetime(df['start_time'], unit='ms', utc=True)
+    return df
+
+def _record_dtype(column, value):
+    if column == 'start_time':
+        return np.int64
+    return np.float64 if isinstance(value, (int, float)) else object
+
+def _cast(value, dtype):
+    # A value of a later page that does not match its column's dtype
+    if value is None:
+        return np.nan if dtype is np.float64 else None
+    if dtype is np.float64:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            return np.nan
+    return str(value) if isinstance(value, (int, float)) else value
+
+def records_to_chunk(records, schema=None):
+    """Build a column chunk with fixed dtypes from one page of records
+
+    The schema ({column: dtype}) carries over from page to page: pass the returned one
+    back in with the next page, so all chunks of a stream have the same columns and
+    dtypes. start_time is int64 (ms epoch), numbers are float64, anything else is
+    object. A column that has only been None so far has dtype None (stored as None)
+    until a page gives it a value; columns first seen on a later page are added. Values
+    that do not fit their column's dtype are cast to it (NaN if not numeric).
+    """
+    schema = dict(schema or {})
+    for record in records:
+        for column, value in record.items():
+            if value is None:
+                schema.setdefault(column, None)
+            elif schema.get(column) is None:
+                schema[column] = _record_dtype(column, value)
+    
+    columns = {}
+    for column, dtype in schema.items():
+        if dtype is None:
+            columns[column] = np.full(len(records), None, dtype=object)
+            continue
+        values = [record.get(column) for record in records]
+        if dtype is object:
+            columns[column] = np.array([_cast(value, dtype) for value in values], dtype=object)
+            continue
+        try:
+            columns[column] = np.array(values, dtype=dtype)
+        except (TypeError, ValueError):
+            columns[column] = np.array([_cast(value, dtype) for value in values], dtype=dtype)
+    index = pd.to_datetime(columns['start_time'], unit='ms', utc=True)
+    return pd.DataFrame(columns, index=index), schema
+
+async def stream_topic(topic, start_time, end_time, page_size=1000, store=True):
+    """Async generator over [start_time, end_time) yielding one typed column chunk per page
+
+    Pages are requested one at a time from the Datasource API, so memory use depends on
+    `page_size` rather than on the length of the range. With `store=True` each chunk is
+    appended to the local store as it arrives. Failed pages are retried as in
+    cybo_fetch.FetchManager, which does the paging.
+    """
+    from cybo_fetch import FetchManager
+
+    async for chunk in FetchManager(page_size=page_size, store=store).stream(topic, start_time, end_time):
+        yield chunk
+
+# print(api_key) # testing
+async def main(topic=MINER_FLOW_TOPIC):
+    start_time = datetime(year=2023, month=1, day=1, tzinfo=timezone.utc)
+    end_time = datetime(year=2024, month=1, day=1, tzinfo=timezone.utc)
+    async for chunk in stream_topic(topic, start_time, end_time, store=False):
+        print(f"{len(chunk)} rows: {chunk.index[0]} -> {chunk.index[-1]}")
+
+async def load_topic(topic, start_time, end_time):
+    """Records of `topic` in [start_time, end_time), fetching only what is not stored locally yet"""
+    from cybo_fetch import load_topics
+
+    return (await load_topics([topic], start_time, end_time))[topic]
+
+async def get_data(startyear, startmonth,startday,endyear,endmonth,endday, topic=MINER_FLOW_TOPIC):
+    start_time = datetime(year=startyear, month=startmonth, day=startday, tzinfo=timezone.utc)
+    end_time = datetime(year=endyear, month=endmonth, day=endday, tzinfo=timezone.utc)
+    
+    return await load_topic(topic, start_time, end_time)
+
+async def get_data_latest(limit=10000, topic=MINER_FLOW_TOPIC, page_size=1000):
+    """The latest `limit` records of `topic`, cursor-paged with stream_topic from `limit` bars ago"""
+    end_time = datetime.now(timezone.utc)
+    start_time = end_time - INTERVALS.get(topic_interval(topic), pd.Timedelta(hours=1)).to_pytimedelta() * limit
+    chunks = [chunk async for chunk in stream_topic(topic, start_time, end_time, page_size=min(page_size, limit),
+                                                    store=False)]
+    return pd.concat(chunks).tail(limit) if chunks else pd.DataFrame()
 
 # Only run main() if this file is executed directly
 if __name__ == "__main__":
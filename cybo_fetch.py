@@ -0,0 +1,265 @@
+# Concurrent Cybotrade fetcher
+# Runs many (topic, start, end) jobs on one event loop instead of one asyncio.run per topic
+# (cybo_api.stream_topic / load_topic go through it too):
+#  - every job's range is cut into time slices of about `slice_pages` pages, fetched in parallel
+#  - a semaphore caps the requests in flight and a token bucket caps the request rate
+#  - a failed page is retried with backoff from its slice's cursor, keeping the pages already
+#    received; a slice that still fails is reported and rerun alone by retry_failed()
+#  - all requests share one query coroutine and event loop, so the Datasource client keeps
+#    its connections across topics
+# With one-page slices and enough concurrency, a year of hourly records for a dozen topics
+# takes about as long as the slowest slice.
+import asyncio
+import random
+import time
+from datetime import datetime, timezone
+import pandas as pd
+import cybotrade_datasource
+from data_store import INTERVALS, utc_datetime, missing_ranges, mark_fetched, read_bars, append_bars, compact_bars
+from cybo_api import API_KEY, topic_interval, records_to_chunk
+import profiling
+
+MAX_CONCURRENCY = 16   # requests in flight
+RATE_LIMIT = 10.0      # requests per second
+PAGE_SIZE = 1000
+SLICE_PAGES = 1        # pages per time slice
+MAX_ATTEMPTS = 4       # tries per page before its slice is given up
+BASE_DELAY = 0.5       # seconds, doubled on every retry (with full jitter)
+COMPACT_PAGES = 50     # streamed pages appended to the store between compactions
+
+# ====================
+# Rate Limiting
+# ====================
+class TokenBucket:
+    """Async rate limiter: `rate` requests per second on average, bursts of up to `burst`"""
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.burst = burst or max(1.0, rate)
+        self.tokens = self.burst
+        self.updated = time.monotonic()
+        self.lock = None
+
+    async def acquire(self):
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:  # Waiters are served in arrival order
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+# ====================
+# Slices
+# ====================
+class Slice:
+    """One time slice [start, end) of a topic, fetched page by page from `cursor`"""
+    __slots__ = ('topic', 'start', 'end', 'cursor', 'chunks', 'pages', 'retries', 'seconds', 'error', 'done')
+
+    def __init__(self, topic, start, end):
+        self.topic = topic
+        self.start = start
+        self.end = end
+        self.cursor = start
+        self.chunks = []
+        self.pages = 0
+        self.retries = 0
+        self.seconds = 0.0
+        self.error = None
+        self.done = False
+
+    def __repr__(self):
+        return f"Slice({self.topic!r}, {self.start:%Y-%m-%d %H:%M} -> {self.end:%Y-%m-%d %H:%M}, pages={self.pages})"
+
+def split_range(start, end, span):
+    """[start, end) as consecutive (start, end) slices of at most `span` (one slice if span is None)"""
+    start, end = utc_datetime(start), utc_datetime(end)
+    if span is None:
+        return [(start, end)] if start < end else []
+    span = pd.Timedelta(span).to_pytimedelta()
+    bounds = []
+    while start < end:
+        bounds.append((start, min(start + span, end)))
+        start += span
+    return bounds
+
+# ====================
+# Fetch Manager
+# ====================
+class FetchManager:
+    """Fetch many (topic, start, end) jobs concurrently
+
+    query: coroutine called as query(api_key=, topic=, start_time=, limit=) and returning
+    {'data': [records]}, cybotrade_datasource.query by default (pass a fake to test offline).
+    slice_pages: pages per time slice, from the topic's interval (None: one slice per job).
+    store: append every page to the local store and compact each topic at the end.
+    """
+
+    def __init__(self, query=None, api_key=None, max_concurrency=MAX_CONCURRENCY, rate=RATE_LIMIT, burst=None,
+                 page_size=PAGE_SIZE, slice_pages=SLICE_PAGES, max_attempts=MAX_ATTEMPTS, base_delay=BASE_DELAY,
+                 store=True):
+        self.query = query or cybotrade_datasource.query
+        self.api_key = api_key or API_KEY
+        self.max_concurrency = max_concurrency
+        self.rate = rate
+        self.burst = burst or max_concurrency
+        self.page_size = page_size
+        self.slice_pages = slice_pages
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.store = store
+        self.schemas = {}
+        self.slices = []
+        self.report = {}
+
+    def split(self, topic, start, end):
+        if self.slice_pages is None:
+            span = None
+        else:
+            span = INTERVALS.get(topic_interval(topic), pd.Timedelta(hours=1)) * self.page_size * self.slice_pages
+        return [Slice(topic, s, e) for s, e in split_range(start, end, span)]
+
+    async def run(self, jobs):
+        """{topic: DataFrame of records in its jobs' ranges}; see self.report for slice stats and failures"""
+        slices = [piece for topic, start, end in jobs for piece in self.split(topic, start, end)]
+        self.slices.extend(slices)
+        await self._run_slices(slices)
+        return self.results()
+
+    async def retry_failed(self):
+        """Rerun only the slices that failed, continuing from their cursors"""
+        failed = self.failed()
+        await self._run_slices(failed)
+        return self.results()
+
+    def failed(self):
+        return [piece for piece in self.slices if not piece.done]
+
+    async def _run_slices(self, slices):
+        started = time.perf_counter()
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        bucket = TokenBucket(self.rate, self.burst) if self.rate else None
+        with profiling.stage('fetch_topics'):
+            await asyncio.gather(*(self._fetch_slice(piece, semaphore, bucket) for piece in slices))
+        if self.store:
+            for topic in sorted({piece.topic for piece in slices}):
+                compact_bars(topic, topic_interval(topic), kind='cybotrade')
+        self.report = {
+            'slices': len(self.slices),
+            'pages': sum(piece.pages for piece in self.slices),
+            'retries': sum(piece.retries for piece in self.slices),
+            'failed': self.failed(),
+            'seconds': time.perf_counter() - started,
+            'slowest_slice_seconds': max((piece.seconds for piece in slices), default=0.0)
+        }
+        failed = self.report['failed']
+        if failed:
+            print(f"Error fetching {len(failed)} of {len(self.slices)} slices, e.g. {failed[0]!r}: {str(failed[0].error)}")
+
+    async def stream(self, topic, start, end):
+        """Async generator over one range [start, end), one typed chunk per page, in order
+
+        Pages are requested one at a time (memory depends on page_size, not on the range)
+        with the same retries as run(); raises the last error once a page runs out of attempts.
+        With store=True the appended pages are compacted every COMPACT_PAGES pages and when
+        the stream ends, and a range streamed to its end is marked as fetched.
+        """
+        interval = topic_interval(topic)
+        try:
+            for bounds in split_range(start, end, None):
+                piece = Slice(topic, *bounds)
+                self.slices.append(piece)
+                bucket = TokenBucket(self.rate, self.burst) if self.rate else None
+                async for chunk in self._pages(piece, asyncio.Semaphore(1), bucket):
+                    yield chunk
+                    if self.store and piece.pages % COMPACT_PAGES == 0:
+                        compact_bars(topic, interval, kind='cybotrade')
+                if not piece.done:
+                    raise piece.error
+                if self.store:
+                    mark_fetched(topic, interval, piece.start, kind='cybotrade')
+        finally:
+            # Also when the consumer stops early or a page fails: keep what was stored
+            if self.store:
+                compact_bars(topic, interval, kind='cybotrade')
+
+    async def _fetch_slice(self, piece, semaphore, bucket):
+        started = time.perf_counter()
+        async for chunk in self._pages(piece, semaphore, bucket):
+            piece.chunks.append(chunk)
+        piece.seconds += time.perf_counter() - started
+
+    async def _pages(self, piece, semaphore, bucket):
+        # Typed chunks of one slice from its cursor on; sets piece.done, or piece.error once a
+        # page has failed max_attempts times
+        interval = topic_interval(piece.topic)
+        step_ms = INTERVALS.get(interval, pd.Timedelta(0)) // pd.Timedelta(milliseconds=1)
+        end_ms = int(piece.end.timestamp() * 1000)
+        tries = 0
+        while piece.cursor < piece.end:
+            try:
+                tries += 1
+                if bucket is not None:
+                    await bucket.acquire()
+                async with semaphore:
+                    response = await self.query(api_key=self.api_key, topic=piece.topic,
+                                                start_time=piece.cursor, limit=self.page_size)
+                page = response['data']
+            except Exception as e:
+                piece.error = e
+                if tries >= self.max_attempts:
+                    return
+                piece.retries += 1
+                await asyncio.sleep(random.uniform(0, self.base_delay * 2 ** (tries - 1)))
+                continue
+
+            piece.pages += 1
+            tries = 0
+            profiling.count('datasource_pages')
+            records = [record for record in page if record['start_time'] < end_ms]
+            if not records:
+                break
+            chunk, schema = records_to_chunk(records, self.schemas.get(piece.topic))
+            self.schemas[piece.topic] = schema
+            if self.store:
+                append_bars(piece.topic, interval, chunk, kind='cybotrade')
+            yield chunk
+            if len(page) < self.page_size or len(records) < len(page) or records[-1]['start_time'] + step_ms >= end_ms:
+                break  # Last page, or the slice end is reached
+            piece.cursor = datetime.fromtimestamp((records[-1]['start_time'] + 1) / 1000, tz=timezone.utc)
+        piece.error = None
+        piece.done = True
+
+    def results(self):
+        frames = {}
+        for piece in sorted(self.slices, key=lambda piece: (piece.topic, piece.start)):
+            frames.setdefault(piece.topic, []).extend(piece.chunks)
+        for topic, chunks in frames.items():
+            df = pd.concat(chunks) if chunks else pd.DataFrame()
+            frames[topic] = df[~df.index.duplicated(keep='last')].sort_index() if not df.empty else df
+        return frames
+
+# ====================
+# Store Loading
+# ====================
+def fetch_topics(jobs, **kwargs):
+    """Synchronous FetchManager(**kwargs).run(jobs)"""
+    return asyncio.run(FetchManager(**kwargs).run(jobs))
+
+async def load_topics(topics, start_time, end_time, **kwargs):
+    """{topic: stored records in [start_time, end_time)}, fetching every topic's gaps concurrently"""
+    jobs = [(topic, fetch_start, fetch_end) for topic in topics
+            for fetch_start, fetch_end in missing_ranges(topic, topic_interval(topic), start_time, end_time,
+                                                         kind='cybotrade')]
+    if jobs:
+        manager = FetchManager(**kwargs)
+        await manager.run(jobs)
+        failed = {piece.topic for piece in manager.failed()}
+        for topic, fetch_start, _ in jobs:
+            if manager.store and topic not in failed:
+                mark_fetched(topic, topic_interval(topic), fetch_start, kind='cybotrade')
+    return {topic: read_bars(topic, topic_interval(topic), start_time, end_time, kind='cybotrade') for topic in topics}
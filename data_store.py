@@ -0,0 +1,309 @@
+# Local on-disk market data store
+# One Parquet file per (symbol, interval) under data/, appended incrementally so only
+# the missing tail (or head) of a requested range is ever downloaded.
+import os
+import random
+import re
+import time
+import pandas as pd
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+# Bar length per interval, used to decide whether newer bars can exist yet
+INTERVALS = {
+    '1m': pd.Timedelta(minutes=1),
+    '5m': pd.Timedelta(minutes=5),
+    '15m': pd.Timedelta(minutes=15),
+    '1h': pd.Timedelta(hours=1),
+    'hour': pd.Timedelta(hours=1),
+    '1d': pd.Timedelta(days=1),
+    'day': pd.Timedelta(days=1)
+}
+
+# The last stored bar may still be forming; re-download it once the file is this old
+REFRESH_AFTER = 300  # seconds
+
+# ====================
+# Paths & Timestamps
+# ====================
+def store_path(key, interval, kind='ohlcv'):
+    """Parquet file holding `key` (a ticker or Cybotrade topic) at `interval`"""
+    safe_key = re.sub(r'[^A-Za-z0-9._-]+', '_', key).strip('_')
+    return os.path.join(DATA_DIR, kind, f"{safe_key}_{interval}.parquet")
+
+def _align(ts, index):
+    # Match a user timestamp to the index timezone (naive timestamps are taken as UTC)
+    ts = pd.Timestamp(ts)
+    tz = getattr(index, 'tz', None)
+    if tz is not None and ts.tzinfo is None:
+        return ts.tz_localize(tz)
+    if tz is None and ts.tzinfo is not None:
+        return ts.tz_convert(None)
+    return ts
+
+def _align_index(index, like):
+    # Bring a DatetimeIndex to the timezone of `like` (naive is taken as UTC)
+    tz = getattr(like, 'tz', None)
+    if tz is not None and index.tz is None:
+        return index.tz_localize(tz)
+    if tz is None and index.tz is not None:
+        return index.tz_convert(None)
+    return index
+
+def _naive_utc(ts):
+    ts = pd.Timestamp(ts)
+    return ts.tz_convert(None) if ts.tzinfo is not None else ts
+
+def utc_datetime(ts):
+    """Timestamp / datetime / string as a UTC-aware datetime (naive values are taken as UTC)"""
+    ts = pd.Timestamp(ts)
+    return (ts.tz_localize('UTC') if ts.tzinfo is None else ts.tz_convert('UTC')).to_pydatetime()
+
+def _slice(df, start=None, end=None):
+    if df.empty:
+        return df
+    if start is not None:
+        df = df[df.index >= _align(start, df.index)]
+    if end is not None:
+        df = df[df.index < _align(end, df.index)]
+    return df
+
+# ====================
+# Read / Write
+# ====================
+# Each store entry is a compacted main file plus an optional `.parts` directory of
+# append-only chunks (written by append_bars while streaming). Parts are named by
+# write time, so on duplicate timestamps the newest row wins.
+def _parts_dir(path):
+    return path[:-len('.parquet')] + '.parts'
+
+def _part_files(path):
+    parts = _parts_dir(path)
+    if not os.path.isdir(parts):
+        return []
+    return [os.path.join(parts, name) for name in sorted(os.listdir(parts)) if name.endswith('.parquet')]
+
+def _exists(path):
+    return os.path.exists(path) or bool(_part_files(path))
+
+def _mtime(path):
+    times = [os.path.getmtime(p) for p in [path, _parts_dir(path)] if os.path.exists(p)]
+    return max(times) if times else 0.0
+
+def _touch(path):
+    for p in [path, _parts_dir(path)]:
+        if os.path.exists(p):
+            os.utime(p)
+
+# A `.from` file next to an entry holds the earliest time the source was queried from.
+# Bars before the first stored one do not exist past that point (e.g. a coin listed later
+# than the requested start), so missing_ranges does not ask for them again.
+def _from_path(path):
+    return path[:-len('.parquet')] + '.from'
+
+def _fetched_from(path):
+    try:
+        with open(_from_path(path)) as f:
+            return pd.Timestamp(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+def _read_stored(path, columns=None, parts=None):
+    parts = _part_files(path) if parts is None else parts
+    frames = [pd.read_parquet(p, columns=columns) for p in [path] + parts if os.path.exists(p)]
+    if not frames:
+        return pd.DataFrame()
+    if len(frames) == 1:
+        return frames[0]
+    df = pd.concat([frames[0]] + [f.set_axis(_align_index(f.index, frames[0].index)) for f in frames[1:]])
+    return df[~df.index.duplicated(keep='last')].sort_index()
+
+def _write_atomic(df, path):
+    # Write to a temp file and swap it in, so readers in other processes never see a partial file
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    df.to_parquet(tmp_path)
+    os.replace(tmp_path, path)
+
+def store_extent(key, interval, kind='ohlcv'):
+    """(first bar, last bar, row count) of a store entry, None if it holds no bars
+
+    Unlike the file times this only changes when rows are added, so it can key caches
+    derived from the stored data.
+    """
+    path = store_path(key, interval, kind)
+    if not _exists(path):
+        return None
+    index = _read_stored(path, columns=[]).index
+    return (index[0], index[-1], len(index)) if not index.empty else None
+
+def mark_fetched(key, interval, start, kind='ohlcv'):
+    """Record that the source was queried for `key` from `start` on (see missing_ranges)"""
+    path = store_path(key, interval, kind)
+    start = _naive_utc(start)
+    fetched_from = _fetched_from(path)
+    if fetched_from is not None and fetched_from <= start:
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{_from_path(path)}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(start.isoformat())
+    os.replace(tmp_path, _from_path(path))
+
+def write_parquet(df, path):
+    """Write `df` to `path` atomically, for caches that live next to the store"""
+    _write_atomic(df, path)
+
+def read_bars(key, interval, start=None, end=None, kind='ohlcv'):
+    """Range query [start, end) against the local store, never touches the network"""
+    return _slice(_read_stored(store_path(key, interval, kind)), start, end)
+
+def write_bars(key, interval, df, kind='ohlcv'):
+    """Merge new bars into the store; newer rows win on duplicate timestamps"""
+    if df is None or df.empty:
+        return
+    path = store_path(key, interval, kind)
+    parts = _part_files(path)
+
+    existing = _read_stored(path, parts=parts)
+    if not existing.empty:
+        df = df.set_axis(_align_index(df.index, existing.index))
+        df = pd.concat([existing, df])
+        df = df[~df.index.duplicated(keep='last')]
+    _write_atomic(df.sort_index(), path)
+
+    # Everything in the parts read above is now in the main file
+    for part in parts:
+        os.remove(part)
+
+def append_bars(key, interval, df, kind='ohlcv'):
+    """Store a chunk without reading or rewriting what is already stored (see compact_bars)"""
+    if df is None or df.empty:
+        return
+    path = store_path(key, interval, kind)
+    _write_atomic(df.sort_index(), os.path.join(_parts_dir(path), f"{time.time_ns()}.parquet"))
+
+def compact_bars(key, interval, kind='ohlcv'):
+    """Fold appended chunks into the main file"""
+    path = store_path(key, interval, kind)
+    parts = _part_files(path)
+    if parts:
+        _write_atomic(_read_stored(path, parts=parts), path)
+        for part in parts:
+            os.remove(part)
+
+def missing_ranges(key, interval, start, end, kind='ohlcv', refresh_after=REFRESH_AFTER):
+    """List of (start, end) ranges that must be downloaded to cover [start, end)
+
+    The last stored bar is re-downloaded once the file is `refresh_after` seconds old
+    (0: on every call). Bars before the first stored one are only requested from before
+    the earliest start already queried (see mark_fetched).
+    """
+    path = store_path(key, interval, kind)
+    if not _exists(path):
+        return [(start, end)]
+
+    index = _read_stored(path, columns=[]).index
+    if index.empty:
+        return [(start, end)]
+
+    first, last = index[0], index[-1]
+    step = INTERVALS.get(interval, pd.Timedelta(0))
+    ranges = []
+    fetched_from = _fetched_from(path)
+    head_end = first if fetched_from is None else min(first, _align(fetched_from, index))
+    if _align(start, index) < head_end:
+        ranges.append((start, head_end.to_pydatetime()))
+
+    # Re-fetch from the last stored bar: it may have been partial when it was written
+    end_ts = _align(end, index)
+    stale = time.time() - _mtime(path) >= refresh_after
+    if end_ts > last + step or (end_ts > last and stale):
+        ranges.append((last.to_pydatetime(), end))
+    return ranges
+
+# ====================
+# Incremental Loading
+# ====================
+def download_bars(symbol, start, end, interval='1d'):
+    """Download OHLCV bars for one ticker from Yahoo Finance as a flat-column DataFrame"""
+    import yfinance as yf
+
+    df = yf.download(symbol, start=start, end=end, interval=interval, progress=False, timeout=10)
+    if isinstance(df.columns, pd.MultiIndex):
+        df.columns = df.columns.get_level_values(0)
+    return df[[col for col in OHLCV_COLUMNS if col in df.columns]]
+
+def download_many(symbols, start, end, interval='1d'):
+    """Download OHLCV bars for several tickers in one grouped request, split into {symbol: DataFrame}"""
+    import yfinance as yf
+
+    df = yf.download(list(symbols), start=start, end=end, interval=interval, group_by='ticker',
+                     progress=False, threads=True, timeout=10)
+    frames = {}
+    for symbol in symbols:
+        if not isinstance(df.columns, pd.MultiIndex) or symbol not in df.columns.get_level_values(0):
+            frames[symbol] = pd.DataFrame()
+            continue
+        bars = df[symbol].dropna(how='all')  # Rows only other tickers traded on
+        frames[symbol] = bars[[col for col in OHLCV_COLUMNS if col in bars.columns]]
+    return frames
+
+def retry_with_backoff(func, *args, attempts=3, base_delay=1.0):
+    """Call func(*args), retrying failures with exponential backoff and full jitter"""
+    for attempt in range(attempts):
+        try:
+            return func(*args)
+        except Exception:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(random.uniform(0, base_delay * 2 ** attempt))
+
+def load_bars(symbol, interval, start, end, fetch=download_bars, kind='ohlcv'):
+    """Bars for [start, end), downloading only what the local store is missing
+
+    `fetch(symbol, start, end, interval)` must return a DataFrame indexed by bar time.
+    If a download fails the locally stored bars are still served.
+    """
+    for fetch_start, fetch_end in missing_ranges(symbol, interval, start, end, kind):
+        try:
+            write_bars(symbol, interval, fetch(symbol, fetch_start, fetch_end, interval), kind)
+            _touch(store_path(symbol, interval, kind))  # Mark as fresh even if nothing new arrived
+            mark_fetched(symbol, interval, fetch_start, kind)
+        except Exception as e:
+            if not _exists(store_path(symbol, interval, kind)):
+                raise
+            print(f"Error updating {symbol} {interval}, serving stored bars: {str(e)}")
+    return read_bars(symbol, interval, start, end, kind)
+
+def load_many(symbols, interval, start, end, fetch_many=download_many, kind='ohlcv', refresh_after=REFRESH_AFTER):
+    """{symbol: bars for [start, end)} with one batched download per group of symbols missing the same range
+
+    `fetch_many(symbols, start, end, interval)` must return {symbol: DataFrame}; it gets
+    UTC datetimes. refresh_after: see missing_ranges.
+    """
+    # One request spanning a symbol's gaps is cheaper than one request per gap; symbols
+    # whose gaps span the same range (usually every symbol's tail) share that request, so
+    # one symbol with a long head gap does not widen the download for all the others
+    groups = {}
+    for symbol in symbols:
+        ranges = missing_ranges(symbol, interval, start, end, kind, refresh_after)
+        if ranges:
+            span = (min(_naive_utc(gap[0]) for gap in ranges), max(_naive_utc(gap[1]) for gap in ranges))
+            groups.setdefault(span, []).append(symbol)
+
+    for (fetch_start, fetch_end), stale in groups.items():
+        try:
+            frames = fetch_many(stale, fetch_start.tz_localize('UTC').to_pydatetime(),
+                                fetch_end.tz_localize('UTC').to_pydatetime(), interval)
+            for symbol in stale:
+                write_bars(symbol, interval, frames.get(symbol), kind)
+                _touch(store_path(symbol, interval, kind))
+                mark_fetched(symbol, interval, fetch_start, kind)
+        except Exception as e:
+            if not any(_exists(store_path(symbol, interval, kind)) for symbol in stale):
+                raise
+            print(f"Error updating {', '.join(stale)} {interval}, serving stored bars: {str(e)}")
+    return {symbol: read_bars(symbol, interval, start, end, kind) for symbol in symbols}
@@ -0,0 +1,82 @@
+# Chart payload downsampling
+# Keeps the number of points sent to Plotly bounded by the chart's pixel width, whatever
+# the history length: candles are merged into OHLC-preserving buckets (first open, max
+# high, min low, last close, summed volume) and line series are reduced with LTTB
+# (Largest-Triangle-Three-Buckets), which keeps the visually important peaks and troughs.
+import numpy as np
+import pandas as pd
+
+CHART_WIDTH = 1200      # px, wide-layout chart
+PIXELS_PER_CANDLE = 4   # narrower candles are unreadable anyway
+
+def max_candles(width=CHART_WIDTH):
+    return max(1, width // PIXELS_PER_CANDLE)
+
+# ====================
+# OHLC Buckets
+# ====================
+def ohlc_buckets(df, n_buckets):
+    """Merge consecutive bars into at most `n_buckets` OHLCV candles
+
+    Each bucket spans the same number of bars and is stamped with its first bar's time,
+    so the highs and lows of the full series are preserved exactly.
+    """
+    if len(df) <= n_buckets:
+        return df
+    size = -(-len(df) // n_buckets)  # ceil
+    starts = np.arange(0, len(df), size)
+    ends = np.minimum(starts + size, len(df)) - 1
+
+    out = {
+        'Open': df['Open'].to_numpy()[starts],
+        'High': np.fmax.reduceat(df['High'].to_numpy(dtype=float), starts),
+        'Low': np.fmin.reduceat(df['Low'].to_numpy(dtype=float), starts),
+        'Close': df['Close'].to_numpy()[ends]
+    }
+    if 'Volume' in df.columns:
+        out['Volume'] = np.add.reduceat(np.nan_to_num(df['Volume'].to_numpy(dtype=float)), starts)
+    return pd.DataFrame(out, index=df.index[starts])
+
+# ====================
+# LTTB
+# ====================
+def lttb(x, y, n_out):
+    """Indices of the `n_out` points LTTB keeps from (x, y); first and last are always kept"""
+    n = len(y)
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+
+    # n - 2 interior points split into n_out - 2 buckets
+    edges = np.linspace(1, n - 1, n_out - 1).astype(int)
+    keep = np.empty(n_out, dtype=int)
+    keep[0], keep[-1] = 0, n - 1
+    a = 0
+    for i in range(n_out - 2):
+        lo, hi = edges[i], edges[i + 1]
+        # Average of the next bucket (or the last point) is the triangle's third corner
+        next_lo, next_hi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        cx, cy = x[next_lo:next_hi].mean(), y[next_lo:next_hi].mean()
+        area = np.abs((x[a] - cx) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (cy - y[a]))
+        a = lo + int(np.argmax(area))
+        keep[i + 1] = a
+    return keep
+
+def downsample_line(series, n_out):
+    """LTTB-reduced copy of a time-indexed Series (NaNs dropped)"""
+    series = series.dropna()
+    x = series.index.asi8 if isinstance(series.index, pd.DatetimeIndex) else np.arange(len(series))
+    return series.iloc[lttb(x, series.to_numpy(), n_out)]
+
+# ====================
+# Chart Payload
+# ====================
+def downsample_chart(df, lines=(), width=CHART_WIDTH):
+    """(candles, {column: line}) for an OHLCV frame, bounded by the chart's pixel width
+
+    Candles get one bucket per PIXELS_PER_CANDLE pixels, each line in `lines` one point
+    per pixel.
+    """
+    candles = ohlc_buckets(df, max_candles(width))
+    return candles, {column: downsample_line(df[column], width) for column in lines}
@@ -0,0 +1,189 @@
+# On-chain feature join
+# Aligns Cybotrade topic series (e.g. hourly miner-to-miner flows) to price bars so the HMM
+# can use them as extra features:
+#  - as-of join: a bar only sees records that were complete by the bar's close (record
+#    start + record interval + publication lag), found with one searchsorted over the
+#    sorted record times instead of a pandas merge
+#  - on-the-fly resampling: 'sum' / 'log_sum' / 'mean' / 'count' aggregate the records of
+#    the trailing `window` (one bar by default, so hourly records become daily values)
+#    with cumulative sums; 'last' takes the newest known record
+#  - the aligned matrix is cached in memory and as Parquet under data/features/, keyed by
+#    the feature spec, the bar index and the stored range and row count of each topic;
+#    only the CACHE_FILES most recently used files are kept
+import os
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import numpy as np
+import pandas as pd
+from data_store import DATA_DIR, INTERVALS, missing_ranges, read_bars, store_extent, write_parquet, utc_datetime
+from cybo_api import MINER_FLOW_TOPIC, topic_interval
+from cybo_fetch import load_topics
+
+FEATURE_DIR = os.path.join(DATA_DIR, 'features')
+PUBLICATION_LAG = pd.Timedelta(hours=1)  # records are published some time after their interval closes
+MEMO_SIZE = 32
+CACHE_FILES = 64     # Parquet files kept under FEATURE_DIR
+
+# Default on-chain HMM features: {feature name: (topic, column, aggregation)}
+ONCHAIN_FEATURES = {
+    'miner_flow': (MINER_FLOW_TOPIC, 'flow_total', 'log_sum'),
+    'miner_transactions': (MINER_FLOW_TOPIC, 'transactions_count_flow', 'log_sum')
+}
+
+_memo = {}
+
+# ====================
+# As-of Join Kernel
+# ====================
+def asof_join(bar_times, record_times, values, how='last', window=None):
+    """Record values known at each bar time, one row per bar
+
+    bar_times, record_times: sorted int64 ns timestamps; a record is known once its time
+    is <= the bar time. values: (records,) or (records x columns). how='last' takes the
+    newest known non-NaN value; 'sum', 'log_sum' (log1p of the sum), 'mean' and 'count'
+    aggregate the known records newer than bar time - window (window in ns).
+    NaN where no record is known (or, except for 'count', the window holds none).
+    """
+    values = np.asarray(values, dtype=float)
+    values = values[:, None] if values.ndim == 1 else values
+    hi = np.searchsorted(record_times, bar_times, side='right')
+    if how == 'last':
+        filled = pd.DataFrame(values).ffill().to_numpy()
+        out = np.full((len(bar_times), values.shape[1]), np.nan)
+        known = hi > 0
+        out[known] = filled[hi[known] - 1]
+        return out
+
+    if window is None:
+        raise ValueError(f"Aggregation '{how}' needs a window")
+    lo = np.searchsorted(record_times, np.asarray(bar_times) - window, side='right')
+    valid = ~np.isnan(values)
+    zeros = np.zeros((1, values.shape[1]))
+    sums = np.concatenate([zeros, np.cumsum(np.where(valid, values, 0), axis=0)])
+    counts = np.concatenate([zeros, np.cumsum(valid, axis=0)])
+    total, count = sums[hi] - sums[lo], counts[hi] - counts[lo]
+    if how == 'count':
+        return count
+    with np.errstate(divide='ignore', invalid='ignore'):
+        if how == 'sum':
+            return np.where(count > 0, total, np.nan)
+        if how == 'log_sum':
+            return np.where(count > 0, np.log1p(np.maximum(total, 0)), np.nan)
+        if how == 'mean':
+            return np.where(count > 0, total / count, np.nan)
+    raise ValueError(f"Unknown aggregation '{how}'")
+
+def _ns(index):
+    # int64 ns epoch of a DatetimeIndex (naive timestamps are taken as UTC)
+    index = pd.DatetimeIndex(index)
+    if index.tz is not None:
+        index = index.tz_convert(None)
+    return index.as_unit('ns').asi8
+
+def bar_interval(index):
+    """Bar length of a price index (median spacing, one day for a single bar)"""
+    index = pd.DatetimeIndex(index)
+    return pd.Timedelta(np.median(np.diff(_ns(index)))) if len(index) > 1 else pd.Timedelta(days=1)
+
+# ====================
+# Topic Alignment
+# ====================
+def align_records(records, index, columns, how='last', window=None, lag=PUBLICATION_LAG,
+                  record_interval=pd.Timedelta(hours=1)):
+    """DataFrame of `columns` of one topic's records as known at the close of every bar of `index`"""
+    step = bar_interval(index)
+    window = step if window is None else pd.Timedelta(window)
+    bar_times = _ns(index) + step.value  # a bar stamped t closes at t + interval
+    record_times = _ns(records.index) + (record_interval + lag).value
+    order = np.argsort(record_times, kind='stable')
+    values = records[list(columns)].to_numpy(dtype=float)[order]
+    joined = asof_join(bar_times, record_times[order], values, how, window.value)
+    return pd.DataFrame(joined, index=index, columns=list(columns))
+
+def _fingerprint(index, spec, lag, window, topics):
+    # Cache key: the feature spec, the exact bar times and the stored range and row count of
+    # every topic (not file times: a refetch that brings no new records keeps the key)
+    digest = hashlib.sha1(_ns(index).tobytes())
+    extents = {topic: store_extent(topic, topic_interval(topic), 'cybotrade') for topic in topics}
+    digest.update(json.dumps([sorted(spec.items()), str(lag), str(window), extents], default=str).encode())
+    return digest.hexdigest()[:20]
+
+def onchain_features(index, spec=None, lag=PUBLICATION_LAG, window=None, fetch=True, cache=True):
+    """DataFrame of on-chain features aligned to the price bars `index`, without lookahead
+
+    spec: {feature name: (topic, column, aggregation)}, default ONCHAIN_FEATURES. window:
+    aggregation window (default one bar). fetch: fetch records missing from the local
+    store first (all topics concurrently, on a worker thread if an event loop is already
+    running); on failure the stored records are used. Features whose topic has no records
+    are left out.
+    """
+    index = pd.DatetimeIndex(index)
+    spec = spec or ONCHAIN_FEATURES
+    topics = sorted({topic for topic, _, _ in spec.values()})
+    step = bar_interval(index)
+    window = step if window is None else pd.Timedelta(window)
+    # Records that can reach the first bar's window up to those complete by the last bar's
+    # close: a record stamped t is known from t + record interval + lag (see align_records)
+    record_interval = max(INTERVALS.get(topic_interval(topic), pd.Timedelta(hours=1)) for topic in topics)
+    start, end = index[0] + step - window - lag - record_interval, index[-1] + step
+
+    # Fetch only when the store misses part of the range (or its newest record is due a
+    # refresh), so a cached frame is served without starting an event loop
+    if fetch and any(missing_ranges(topic, topic_interval(topic), utc_datetime(start), utc_datetime(end),
+                                    kind='cybotrade') for topic in topics):
+        try:
+            _run_async(load_topics(topics, utc_datetime(start), utc_datetime(end)))
+        except Exception as e:
+            print(f"Error updating {', '.join(topics)}, using stored records: {str(e)}")
+
+    # Keyed by the stored extent of every topic, so records added by the fetch miss the cache
+    key = _fingerprint(index, spec, lag, window, topics)
+    path = os.path.join(FEATURE_DIR, f"{key}.parquet")
+    if cache and key in _memo:
+        return _memo[key].copy()
+    if cache and os.path.exists(path):
+        os.utime(path)  # Most recently used, see _prune
+        return _remember(key, pd.read_parquet(path)).copy()
+
+    records = {topic: read_bars(topic, topic_interval(topic), start, end, kind='cybotrade') for topic in topics}
+    columns = {}
+    for name, (topic, column, how) in spec.items():
+        df = records[topic]
+        if df.empty or column not in df.columns:
+            print(f"No {column} records for {topic}, leaving out {name}")
+            continue
+        interval = INTERVALS.get(topic_interval(topic), pd.Timedelta(hours=1))
+        columns[name] = align_records(df, index, [column], how, window, lag, interval)[column]
+    frame = pd.DataFrame(columns, index=index)
+
+    if cache:
+        write_parquet(frame, path)
+        _prune()
+        _remember(key, frame)
+    return frame.copy()
+
+def _run_async(coro):
+    # asyncio.run, moved to a worker thread when the caller already runs an event loop
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(coro)
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        return pool.submit(asyncio.run, coro).result()
+
+def _prune():
+    # Drop the least recently used feature files past CACHE_FILES
+    files = [os.path.join(FEATURE_DIR, name) for name in os.listdir(FEATURE_DIR) if name.endswith('.parquet')]
+    for path in sorted(files, key=os.path.getmtime)[:-CACHE_FILES]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # Already removed by another process
+
+def _remember(key, frame):
+    if len(_memo) >= MEMO_SIZE:
+        _memo.pop(next(iter(_memo)))
+    _memo[key] = frame
+    return frame
@@ -0,0 +1,261 @@
+# Rolling feature engine
+# Batch: one vectorized NumPy pass over a (time x asset) array for every asset at once.
+# Streaming: running sums with sliding Welford variance, O(1) per asset per new bar.
+# Both produce the same return / volatility / mean_return features as create_features.
+import numpy as np
+import pandas as pd
+from profiling import timed, count
+
+FEATURE_COLUMNS = ['return', 'volatility', 'mean_return']
+
+# Relative size (vs the block's sum of squares) below which a window's variance is recomputed
+CANCELLATION_TOL = 1e-7
+
+# ====================
+# Batch Kernel
+# ====================
+def rolling_mean_std(values, window, block=256, chunk_values=1 << 17):
+    """Trailing mean and sample std over `window` rows of a (time,) or (time, asset) array
+
+    Matches pandas rolling(window).mean() / .std(): NaN until the window is full and for
+    any window containing a NaN. Sums are cumulated per block of `block` rows around the
+    block's center, so rounding error grows neither with the length of the series nor with
+    a drifting level; all blocks of about `chunk_values` values are cumulated in one pass.
+    """
+    values = np.asarray(values, dtype=float)
+    squeeze = values.ndim == 1
+    if squeeze:
+        values = values[:, None]
+    n_rows, n_cols = values.shape
+    n_blocks = max(0, -(-(n_rows - window + 1) // block))
+    # Zero / invalid padding up to whole blocks; the windows that reach it are never full
+    padded_rows = window - 1 + n_blocks * block
+    # Asset-major copies, so every block's rows are contiguous
+    valid = np.zeros((n_cols, padded_rows), dtype=bool)
+    valid[:, :n_rows] = ~np.isnan(values.T)
+    filled = np.zeros((n_cols, padded_rows))
+    np.copyto(filled[:, :n_rows], values.T, where=valid[:, :n_rows])
+    mean = np.full((n_cols, padded_rows), np.nan)
+    std = np.full((n_cols, padded_rows), np.nan)
+
+    per_chunk = max(1, chunk_values // ((block + window) * n_cols))
+    for first in range(0, n_blocks, per_chunk):
+        last = min(first + per_chunk, n_blocks)
+        _block_moments(values, filled, valid, first * block, last - first, window, block, mean, std)
+
+    mean, std = mean[:, :n_rows].T, std[:, :n_rows].T
+    if squeeze:
+        return mean[:, 0], std[:, 0]
+    return np.ascontiguousarray(mean), np.ascontiguousarray(std)
+
+def _block_moments(values, filled, valid, offset, n_blocks, window, block, mean, std):
+    # Fills rows offset + window - 1 on of the (asset, row) mean / std for `n_blocks`
+    # consecutive blocks. Each block reads its rows plus the window - 1 before them, as a
+    # strided (asset, block, row) view
+    length = block + window - 1
+    rows = slice(offset, offset + n_blocks * block + window - 1)
+    segment = np.lib.stride_tricks.sliding_window_view(filled[:, rows], length, axis=1)[:, ::block]
+    segment_valid = np.lib.stride_tricks.sliding_window_view(valid[:, rows], length, axis=1)[:, ::block]
+
+    def window_sums(x):
+        # Sum of each trailing window, from a cumulative sum along the rows
+        cumulative = np.cumsum(x, axis=2)
+        out = cumulative[:, :, window - 1:].copy()
+        out[:, :, 1:] -= cumulative[:, :, :-window]
+        return out
+
+    if segment_valid.all():
+        center = segment.mean(axis=2, keepdims=True)
+        centered = segment - center
+        full = None
+    else:
+        center = segment.sum(axis=2, keepdims=True) / np.maximum(segment_valid.sum(axis=2, keepdims=True), 1)
+        centered = (segment - center) * segment_valid
+        full = window_sums(segment_valid) == window
+    squared = centered * centered
+    s = window_sums(centered)
+    s2 = window_sums(squared)
+
+    out = slice(offset + window - 1, offset + window - 1 + n_blocks * block)
+    n_cols = len(filled)
+    block_mean = s / window + center
+    mean[:, out] = (block_mean if full is None else np.where(full, block_mean, np.nan)).reshape(n_cols, -1)
+    if window > 1:
+        spread = s2 - s * s / window
+        block_std = np.sqrt(np.maximum(spread / (window - 1), 0.0))
+        std[:, out] = (block_std if full is None else np.where(full, block_std, np.nan)).reshape(n_cols, -1)
+        # Near-flat windows lose digits to cancellation in the sum of squares;
+        # recompute those few exactly from their raw values
+        unstable = spread < CANCELLATION_TOL * squared.sum(axis=2, keepdims=True)
+        cols, blocks, ends = np.nonzero(unstable if full is None else full & unstable)
+        if len(cols):
+            ends += offset + window - 1 + blocks * block
+            std[cols, ends] = values[ends[:, None] + np.arange(1 - window, 1), cols[:, None]].std(axis=1, ddof=1)
+
+def _shift(values):
+    # Same as pandas shift(1): each row sees the previous row's value
+    shifted = np.full(values.shape, np.nan)
+    shifted[1:] = values[:-1]
+    return shifted
+
+def feature_arrays(returns, window=30):
+    """(volatility, mean_return) arrays for a (time,) or (time, asset) array of returns
+
+    Both use only the `window` returns before each bar (shifted by one, no lookahead).
+    """
+    mean, std = rolling_mean_std(returns, window)
+    return _shift(std), _shift(mean)
+
+@timed()
+def create_features_panel(prices, window=30, indicators=None, exogenous=None):
+    """{symbol: features DataFrame} for every column of a Close price DataFrame in one pass
+
+    Each frame equals create_features(prices[symbol], window) for series without gaps;
+    assets with missing prices (e.g. listed later) fall back to a per-asset pass over
+    their valid returns. `indicators` ({column: (indicator, *params)}, see indicators.py)
+    adds extra feature columns computed on the close, shifted by one bar like the others.
+    `exogenous` (a DataFrame on the price index, e.g. feature_join.onchain_features) adds
+    its columns to every symbol as they are; they must already be free of lookahead.
+    """
+    returns = prices.pct_change(fill_method=None).to_numpy()[1:]
+    volatility, mean_return = feature_arrays(returns, window)
+    index = prices.index[1:]
+    count('bars_processed', returns.size)
+    extra = _indicator_features(prices, indicators)
+
+    panel = {}
+    for i, symbol in enumerate(prices.columns):
+        features = pd.DataFrame({
+            'return': returns[:, i],
+            'volatility': volatility[:, i],
+            'mean_return': mean_return[:, i]
+        }, index=index)
+        # Per-asset rows only: a listing gap in one asset must not shift another's windows
+        if np.isnan(returns[:, i]).any():
+            features = _series_features(returns[:, i], index, window)
+        for name, values in extra.items():
+            features[name] = values[symbol].reindex(features.index)
+        if exogenous is not None:
+            for name in exogenous.columns:
+                features[name] = exogenous[name].reindex(features.index)
+        panel[symbol] = features.dropna()
+    return panel
+
+def _indicator_features(prices, indicators):
+    # {column: (time x symbol) DataFrame}, shifted so each bar only sees the previous close
+    from indicators import compute_panel
+    if not indicators:
+        return {}
+    return {name: df.shift(1) for name, df in compute_panel({'close': prices}, indicators).items()}
+
+def _series_features(returns, index, window):
+    returns = pd.Series(returns, index=index).dropna()
+    volatility, mean_return = feature_arrays(returns.to_numpy(), window)
+    return pd.DataFrame({
+        'return': returns.to_numpy(),
+        'volatility': volatility,
+        'mean_return': mean_return
+    }, index=returns.index)
+
+# ====================
+# Streaming Engine
+# ====================
+class StreamingFeatures:
+    """O(1)-per-bar return / volatility / mean_return for one or many assets
+
+    Feed one price (or one row of prices, one per asset) per bar with update(). The
+    features for a bar use the previous `window` returns, exactly like create_features;
+    they are NaN until `window` returns have been seen. Mean and variance are kept with
+    a sliding Welford update and re-derived from the buffer every `resync_every` bars so
+    rounding error cannot accumulate. A missing (non-finite) price skips that asset's bar:
+    its return is NaN and stays out of the window, and the next return is taken from the
+    last valid price, as create_features does on the series with the gap dropped.
+    """
+
+    def __init__(self, window=30, n_assets=1, resync_every=10000):
+        self.window = window
+        self.resync_every = resync_every
+        self.last_price = None
+        # Ring buffer of the last `window` returns per asset. Its write row is shared while
+        # every asset has the same number of returns, per asset once one has skipped a bar
+        self.returns = np.zeros((window, n_assets))
+        self.row = 0
+        self.position = None
+        self.seen = np.zeros(n_assets, dtype=int)
+        self.full = False  # every asset's window is full
+        self.mean = np.zeros(n_assets)
+        self.m2 = np.zeros(n_assets)
+        self.updates = 0
+
+    def _volatility(self):
+        if self.window < 2:
+            return np.full(self.mean.shape, np.nan)
+        volatility = np.sqrt(np.maximum(self.m2 / (self.window - 1), 0.0))
+        return volatility if self.full else np.where(self.seen >= self.window, volatility, np.nan)
+
+    def _mean_return(self):
+        return self.mean.copy() if self.full else np.where(self.seen >= self.window, self.mean, np.nan)
+
+    def _push(self, x, finite):
+        if not finite and self.position is None:
+            self.position = np.full(len(self.mean), self.row)
+
+        if self.position is None:
+            oldest = self.returns[self.row].copy()
+            self.returns[self.row] = x
+            self.row = self.row + 1 if self.row + 1 < self.window else 0
+            if self.full:
+                # Full window: replace the oldest return in one step
+                new_mean = self.mean + (x - oldest) / self.window
+                self.m2 += (x - oldest) * (x - new_mean + oldest - self.mean)
+            else:
+                # Growing window: plain Welford step
+                self.seen += 1
+                new_mean = self.mean + (x - self.mean) / self.seen
+                self.m2 += (x - self.mean) * (x - new_mean)
+                self.full = self.seen[0] >= self.window
+            self.mean = new_mean
+        else:
+            # Same steps per asset, leaving out the missing returns
+            assets = np.nonzero(np.isfinite(x))[0]
+            x = x[assets]
+            mean, m2, seen = self.mean[assets], self.m2[assets], self.seen[assets]
+            position = self.position[assets]
+            full = seen >= self.window
+            oldest = self.returns[position, assets]
+            new_mean = np.where(full, mean + (x - oldest) / self.window, mean + (x - mean) / (seen + 1))
+            self.m2[assets] = np.where(full, m2 + (x - oldest) * (x - new_mean + oldest - mean),
+                                       m2 + (x - mean) * (x - new_mean))
+            self.mean[assets] = new_mean
+            self.returns[position, assets] = x
+            self.position[assets] = (position + 1) % self.window
+            self.seen[assets] = np.minimum(seen + 1, self.window)
+            self.full = bool((self.seen >= self.window).all())
+
+        self.updates += 1
+        if self.updates % self.resync_every == 0:
+            for asset, n in enumerate(self.seen):
+                if n:
+                    buffer = self.returns[:n, asset]
+                    self.mean[asset] = buffer.mean()
+                    self.m2[asset] = ((buffer - self.mean[asset]) ** 2).sum()
+
+    def update(self, price):
+        """Consume the next bar's price(s); returns (return, volatility, mean_return) arrays
+
+        The first call only primes the previous price and returns None.
+        """
+        price = np.atleast_1d(np.asarray(price, dtype=float))
+        if self.last_price is None:
+            self.last_price = price
+            return None
+
+        ret = price / self.last_price - 1
+        finite = bool(np.isfinite(ret).all())
+        if not finite:
+            ret[~np.isfinite(ret)] = np.nan
+        self.last_price = price if finite else np.where(np.isfinite(price), price, self.last_price)
+        # Features for this bar come from the window before it (shift(1))
+        volatility, mean_return = self._volatility(), self._mean_return()
+        self._push(ret, finite)
+        return ret, volatility, mean_return
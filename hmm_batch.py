@@ -0,0 +1,230 @@
+# Batched HMM decoding
+# Decodes many observation sequences (e.g. every symbol of the universe, or every fold of a
+# walk-forward), each with its own fitted GaussianHMM, in one call. Sequences may have
+# different lengths (they are right-padded and masked) and models may have different
+# numbers of states (padded states get zero probability). The time recursion is one NumPy
+# step over the whole batch, in log space:
+#  - Viterbi: most likely state path (same as model.predict)
+#  - forward filtering: P(state_t | x_1..x_t), what a live system knows at bar t
+#  - forward-backward smoothing (optional): P(state_t | x_1..x_T) (same as model.predict_proba)
+# Each bar costs a few NumPy calls whatever the batch size, so this pays off for many
+# sequences (a universe, many windows); for a handful of very long series hmmlearn's
+# compiled per-model decode is still faster.
+import numpy as np
+import pandas as pd
+
+# ====================
+# Batch Layout
+# ====================
+def pad_sequences(sequences):
+    """(X, lengths): ragged (T_i x D) sequences as one zero-padded (batch x T x D) array"""
+    sequences = [np.asarray(seq, dtype=float) for seq in sequences]
+    lengths = np.array([len(seq) for seq in sequences])
+    X = np.zeros((len(sequences), lengths.max(initial=0), sequences[0].shape[1] if sequences else 0))
+    for i, seq in enumerate(sequences):
+        X[i, :len(seq)] = seq
+    return X, lengths
+
+def stack_models(models):
+    """Parameters of diagonal-covariance GaussianHMMs stacked along a batch axis
+
+    Returns {'startprob': (B, K), 'transmat': (B, K, K), 'means': (B, K, D),
+    'variances': (B, K, D), 'n_states': (B,)} with K the largest state count.
+    """
+    K = max(model.n_components for model in models)
+    D = models[0].means_.shape[1]
+    params = {
+        'startprob': np.zeros((len(models), K)),
+        'transmat': np.zeros((len(models), K, K)),
+        'means': np.zeros((len(models), K, D)),
+        'variances': np.ones((len(models), K, D)),
+        'n_states': np.array([model.n_components for model in models])
+    }
+    for i, model in enumerate(models):
+        if model.covariance_type not in ('diag', 'spherical'):
+            raise ValueError(f"Batched decoding needs diagonal covariances, got '{model.covariance_type}'")
+        k = model.n_components
+        params['startprob'][i, :k] = model.startprob_
+        params['transmat'][i, :k, :k] = model.transmat_
+        params['means'][i, :k] = model.means_
+        params['variances'][i, :k] = np.diagonal(model.covars_, axis1=-2, axis2=-1)
+    return params
+
+def emission_logprob(X, params):
+    """log p(x_t | state) for every (sequence, bar, state), -inf for padded states
+
+    Expands the Gaussian quadratic form into three batched matrix products, so memory is
+    (B x T x K) instead of (B x T x K x D).
+    """
+    precision = 1 / params['variances']
+    means = params['means']
+    quad = (np.einsum('btd,bkd->btk', X ** 2, precision)
+            - 2 * np.einsum('btd,bkd->btk', X, means * precision)
+            + (means ** 2 * precision).sum(-1)[:, None, :])
+    log_norm = np.log(2 * np.pi * params['variances']).sum(-1)[:, None, :]
+    out = -0.5 * (log_norm + quad)
+    padded = np.arange(means.shape[1]) >= params['n_states'][:, None]
+    out[np.broadcast_to(padded[:, None, :], out.shape)] = -np.inf
+    return out
+
+def _log(values):
+    with np.errstate(divide='ignore'):
+        return np.log(values)
+
+# ====================
+# Viterbi
+# ====================
+def viterbi(log_emission, lengths, params):
+    """(states, log_prob): most likely state path per sequence, -1 past each sequence's end"""
+    B, T, K = log_emission.shape
+    # (B, to, from) layout so the max over predecessors reduces the contiguous last axis
+    log_trans = np.ascontiguousarray(np.swapaxes(_log(params['transmat']), 1, 2))
+    flat = np.arange(B * K)
+    backpointers = np.empty((T, B, K), dtype=np.int16)
+    backpointers[0] = np.arange(K)
+    delta = _log(params['startprob']) + log_emission[:, 0]
+    stay = np.broadcast_to(np.arange(K), (B, K))
+    all_active = lengths.min(initial=T)
+
+    for t in range(1, T):
+        scores = delta[:, None, :] + log_trans            # (B, to, from)
+        best = scores.argmax(axis=2)
+        step = scores.reshape(-1, K)[flat, best.ravel()].reshape(B, K) + log_emission[:, t]
+        if t < all_active:
+            delta = step
+            backpointers[t] = best
+        else:
+            # Finished sequences keep their last scores and point back to themselves
+            active = (t < lengths)[:, None]
+            delta = np.where(active, step, delta)
+            backpointers[t] = np.where(active, best, stay)
+
+    states = np.empty((B, T), dtype=int)
+    states[:, -1] = delta.argmax(axis=1)
+    rows = np.arange(B)
+    for t in range(T - 1, 0, -1):
+        states[:, t - 1] = backpointers[t, rows, states[:, t]]
+    states[np.arange(T) >= lengths[:, None]] = -1
+    return states, delta.max(axis=1)
+
+# ====================
+# Forward / Backward
+# ====================
+# Both passes run on per-bar rescaled probabilities (Rabiner scaling): the emission
+# likelihoods of every bar are divided by their maximum up front (one vectorized op over
+# all bars), each step is then one batched matrix-vector product, and the logs of the
+# scale factors add up to the log-likelihood. This is the log-space recursion factored so
+# the per-bar Python work stays at a handful of NumPy calls.
+def _scaled_emission(log_emission):
+    peak = log_emission.max(axis=2, keepdims=True)
+    return np.exp(log_emission - peak), peak[..., 0]
+
+def forward_filter(log_emission, lengths, params, log_alpha=None):
+    """(log_filtered, log_likelihood): log P(state_t | x_1..x_t) per (sequence, bar, state)
+
+    log_alpha: optional (B x K) normalized belief before the first bar (e.g. carried over
+    from an earlier window); the first bar then takes one transition step from it.
+    """
+    B, T, K = log_emission.shape
+    emission, peak = _scaled_emission(log_emission)
+    transmat = params['transmat']
+    filtered = np.empty((B, T, K))
+    scales = np.empty((B, T))
+    all_active = lengths.min(initial=T)
+
+    alpha = None if log_alpha is None else np.exp(log_alpha)
+    for t in range(T):
+        if alpha is None:
+            step = params['startprob'] * emission[:, 0]
+        else:
+            step = np.einsum('bi,bij->bj', alpha, transmat) * emission[:, t]
+        scale = step.sum(axis=1)
+        step /= scale[:, None]
+        if t >= all_active and alpha is not None:
+            active = t < lengths
+            step = np.where(active[:, None], step, alpha)
+            scale = np.where(active, scale, 1.0)
+        alpha = filtered[:, t] = step
+        scales[:, t] = scale
+
+    padding = np.arange(T)[None, :] >= lengths[:, None]
+    log_likelihood = np.where(padding, 0, np.log(scales) + peak).sum(axis=1)
+    log_filtered = _log(filtered)
+    log_filtered[padding] = np.nan
+    return log_filtered, log_likelihood
+
+def smooth(log_emission, lengths, params, log_filtered):
+    """log P(state_t | x_1..x_T) from the filtered beliefs and one backward pass"""
+    B, T, K = log_emission.shape
+    emission, _ = _scaled_emission(log_emission)
+    transmat = params['transmat']
+    filtered = np.exp(log_filtered)
+    beta = np.ones((B, K))
+    out = np.empty((B, T, K))
+    last = lengths - 1
+    for t in range(T - 1, -1, -1):
+        # beta_t(i) = sum_j A(i, j) p(x_{t+1} | j) beta_{t+1}(j), restarted at each sequence's last bar
+        if t < T - 1:
+            step = np.einsum('bij,bj->bi', transmat, emission[:, t + 1] * beta)
+            step /= step.sum(axis=1, keepdims=True)
+            beta = np.where((t < last)[:, None], step, 1.0) if t >= last.min(initial=T) else step
+        posterior = filtered[:, t] * beta
+        out[:, t] = posterior / posterior.sum(axis=1, keepdims=True)
+    log_out = _log(out)
+    log_out[np.arange(T)[None, :] > last[:, None]] = np.nan
+    return log_out
+
+# ====================
+# Decoding API
+# ====================
+def decode_batch(sequences, models, scalers=None, smoothed=False):
+    """Decode many feature sequences in one call
+
+    sequences: list of (T_i x D) arrays / DataFrames, or {name: features}. models: one
+    fitted GaussianHMM per sequence, or a single model for all. scalers: matching fitted
+    StandardScalers (or one, or None if the sequences are already scaled).
+    Returns {'states': [T_i ints, Viterbi path], 'filtered': [T_i x K_i filtered
+    probabilities], 'log_likelihood': (B,) array} plus 'smoothed' ([T_i x K_i posteriors,
+    as model.predict_proba]) when smoothed=True. With dict input, every list becomes a
+    dict with the same keys.
+    """
+    names = list(sequences) if isinstance(sequences, dict) else None
+    sequences = list(sequences.values()) if names is not None else list(sequences)
+    models = list(models.values()) if isinstance(models, dict) else models
+    models = models if isinstance(models, (list, tuple)) else [models] * len(sequences)
+    if scalers is not None:
+        scalers = list(scalers.values()) if isinstance(scalers, dict) else scalers
+        scalers = scalers if isinstance(scalers, (list, tuple)) else [scalers] * len(sequences)
+        sequences = [(np.asarray(seq, dtype=float) - scaler.mean_) / scaler.scale_
+                     for seq, scaler in zip(sequences, scalers)]
+
+    X, lengths = pad_sequences(sequences)
+    params = stack_models(models)
+    log_emission = emission_logprob(X, params)
+    states, _ = viterbi(log_emission, lengths, params)
+    log_filtered, log_likelihood = forward_filter(log_emission, lengths, params)
+
+    def unpad(batch):
+        return [batch[i, :n, :k] if batch.ndim == 3 else batch[i, :n]
+                for i, (n, k) in enumerate(zip(lengths, params['n_states']))]
+
+    result = {'states': unpad(states), 'filtered': unpad(np.exp(log_filtered)),
+              'log_likelihood': log_likelihood}
+    if smoothed:
+        result['smoothed'] = unpad(np.exp(smooth(log_emission, lengths, params, log_filtered)))
+    if names is not None:
+        for key in ('states', 'filtered', 'smoothed'):
+            if key in result:
+                result[key] = dict(zip(names, result[key]))
+        result['log_likelihood'] = pd.Series(log_likelihood, index=names)
+    return result
+
+def filter_sequence(model, rows, log_alpha=None):
+    """(log_filtered, last log_alpha) for one scaled sequence, optionally continuing from log_alpha"""
+    params = stack_models([model])
+    X = np.asarray(rows, dtype=float)[None]
+    start = None if log_alpha is None else np.asarray(log_alpha)[None]
+    log_filtered, _ = forward_filter(emission_logprob(X, params), np.array([len(rows)]), params, start)
+    log_filtered = log_filtered[0, :, :model.n_components]
+    return log_filtered, (log_filtered[-1] if len(rows) else log_alpha)
+
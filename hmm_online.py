@@ -0,0 +1,126 @@
+# Incremental HMM updates for streaming bars
+# Instead of refitting on the full history from a random start, EM is warm-started from the
+# previous parameters on a sliding window, and the newest bar's regime comes from one
+# forward-algorithm (filtering) step instead of a full Viterbi decode.
+import copy
+from collections import deque
+import numpy as np
+from hmm_batch import _log
+
+PSEUDO_COUNT = 1e-2
+
+def refit_hmm(model, scaler, features, window=365, n_iter=10):
+    """Copy of `model` refitted for a few EM iterations on the last `window` bars
+
+    EM starts from the current parameters (init_params=''), so a small iteration budget is
+    enough when only a few bars changed. The scaler is kept fixed so the feature space
+    (and therefore the meaning of each state) stays stable between refits.
+    """
+    return _warm_fit(model, _scale(scaler, np.asarray(features, dtype=float)[-window:]), n_iter)
+
+def _scale(scaler, rows):
+    # Same as scaler.transform, without sklearn's feature-name checks on bare arrays
+    return (rows - scaler.mean_) / scaler.scale_
+
+def _warm_fit(model, scaled, n_iter):
+    refitted = copy.deepcopy(model)
+    refitted.init_params = ''
+    refitted.n_iter = n_iter
+    # Priors worth one pseudo-observation at the previous parameters keep a state that the
+    # window never visits from collapsing (zero transition rows, NaN means)
+    refitted.startprob_prior = 1 + PSEUDO_COUNT
+    refitted.transmat_prior = 1 + PSEUDO_COUNT
+    refitted.means_prior = model.means_
+    refitted.means_weight = 1.0
+    refitted.covars_prior = np.diagonal(model.covars_, axis1=-2, axis2=-1)
+    refitted.covars_weight = 2.0
+    refitted.fit(scaled)
+    return refitted
+
+# ====================
+# Forward Filtering
+# ====================
+def _logsumexp(a, axis=None):
+    peak = np.max(a, axis=axis, keepdims=True)
+    # An all -inf slice (a state nothing can reach) stays -inf instead of turning NaN
+    peak = np.where(np.isfinite(peak), peak, 0)
+    out = _log(np.sum(np.exp(a - peak), axis=axis, keepdims=True)) + peak
+    return np.squeeze(out, axis=axis) if axis is not None else out.item()
+
+def emission_logprob(model, x):
+    """log p(x | state) for every state of a diagonal-covariance GaussianHMM"""
+    variances = np.diagonal(model.covars_, axis1=-2, axis2=-1)
+    diff = np.asarray(x)[..., None, :] - model.means_
+    return -0.5 * (np.log(2 * np.pi * variances).sum(-1) + (diff ** 2 / variances).sum(-1))
+
+def filter_step(model, log_alpha, x):
+    """One forward-algorithm step: normalized log P(state_t | x_1..x_t)
+
+    Pass log_alpha=None for the first bar of a sequence.
+    """
+    if log_alpha is None:
+        log_alpha = _log(model.startprob_) + emission_logprob(model, x)
+    else:
+        log_prior = _logsumexp(log_alpha[:, None] + _log(model.transmat_), axis=0)
+        log_alpha = log_prior + emission_logprob(model, x)
+    return log_alpha - _logsumexp(log_alpha)
+
+def volatility_ranks(model, volatility_column=1):
+    """Raw state -> volatility rank (0=low), read off the fitted state means"""
+    return np.argsort(np.argsort(model.means_[:, volatility_column]))
+
+def volatility_mapping(model, volatility_column=1):
+    """Raw state -> mapped state as in interpret_states (0=lowest volatility, 2=highest, else 1)"""
+    ranks = volatility_ranks(model, volatility_column)
+    return np.where(ranks == 0, 0, np.where(ranks == len(ranks) - 1, 2, 1))
+
+# ====================
+# Online Regime Tracker
+# ====================
+class OnlineHMM:
+    """Per-symbol regime tracker that updates in constant time per bar
+
+    Keeps the last `window` scaled feature rows, filters each new bar with the current
+    model and, every `refit_every` bars, warm-starts `n_iter` EM iterations on the window.
+    """
+
+    def __init__(self, model, scaler, features, window=365, n_iter=10, refit_every=1):
+        self.model = model
+        self.scaler = scaler
+        self.window = window
+        self.n_iter = n_iter
+        self.refit_every = refit_every
+        self.volatility_column = list(features.columns).index('volatility')
+        self.buffer = deque(_scale(scaler, features.to_numpy(dtype=float)[-window:]), maxlen=window)
+        self.bars_since_refit = 0
+
+        # Filter over the starting window once to get the current belief
+        self.log_alpha = None
+        for row in self.buffer:
+            self.log_alpha = filter_step(self.model, self.log_alpha, row)
+        self.states = [self.mapped_state]
+
+    @property
+    def probabilities(self):
+        """Filtered probability of each raw state for the newest bar"""
+        return np.exp(self.log_alpha)
+
+    @property
+    def mapped_state(self):
+        """Newest bar's regime, 0=low, 1=medium, 2=high volatility"""
+        mapping = volatility_mapping(self.model, self.volatility_column)
+        return int(mapping[np.argmax(self.log_alpha)])
+
+    def update(self, feature_row):
+        """Consume one new feature row (return, volatility, mean_return); returns the mapped state"""
+        row = _scale(self.scaler, np.asarray(feature_row, dtype=float))
+        self.buffer.append(row)
+
+        self.bars_since_refit += 1
+        if self.bars_since_refit >= self.refit_every:
+            self.model = _warm_fit(self.model, np.asarray(self.buffer), self.n_iter)
+            self.bars_since_refit = 0
+
+        self.log_alpha = filter_step(self.model, self.log_alpha, row)
+        self.states.append(self.mapped_state)
+        return self.states[-1]
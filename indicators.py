@@ -0,0 +1,225 @@
+# Indicator library
+# Every indicator runs on (time x asset) NumPy arrays, so all assets are computed in one
+# pass. Indicators are registered by name and requested as {output name: (indicator,
+# *params)}; intermediate results (EMAs, rolling mean/std, returns, true range) are cached
+# per request batch, so e.g. EMA12 / EMA26 / MACD or SMA20 / Bollinger20 share their work.
+# Rolling windows use the block cumsum kernel from features.py; exponential smoothing uses
+# scipy's compiled lfilter.
+import numpy as np
+import pandas as pd
+from features import rolling_mean_std
+from portfolio import ffill
+
+INDICATORS = {}
+
+def indicator(name):
+    """Register fn(ctx, *params) -> array or {suffix: array} under `name`"""
+    def register(fn):
+        INDICATORS[name] = fn
+        return fn
+    return register
+
+# ====================
+# Kernels
+# ====================
+def ewm(values, alpha, min_periods=1):
+    """pandas ewm(alpha=alpha, adjust=False).mean() on every column at once
+
+    Columns may start late (leading NaNs); interior gaps are forward-filled.
+    """
+    from scipy.signal import lfilter
+
+    values = np.asarray(values, dtype=float)
+    missing = np.isnan(values)
+    if missing.any():
+        values = ffill(values)
+        missing = np.isnan(values)
+    out = np.full(values.shape, np.nan)
+    first = np.argmax(~missing, axis=0)
+    first[missing.all(axis=0)] = len(values)
+    # One filter call per distinct start row (a single call when all assets share history)
+    for start in np.unique(first):
+        if start >= len(values):
+            continue
+        cols = np.flatnonzero(first == start)
+        block = values[start:, cols]
+        smoothed, _ = lfilter([alpha], [1, alpha - 1], block, axis=0, zi=(1 - alpha) * block[:1])
+        smoothed[:min_periods - 1] = np.nan
+        out[start:, cols] = smoothed
+    return out
+
+def rolling_mean(values, window, min_periods=None):
+    """rolling(window, min_periods).mean(): windows that are not full (the first rows, or
+    around missing values) average their valid values once there are min_periods of them"""
+    values = np.asarray(values, dtype=float)
+    min_periods = window if min_periods is None else min_periods
+    mean, _ = rolling_mean_std(values, window)
+    partial_rows = np.isnan(mean)
+    if min_periods < window and partial_rows.any():
+        zeros = np.zeros((1,) + values.shape[1:])
+        sums = np.concatenate([zeros, np.nancumsum(values, axis=0)])
+        counts = np.concatenate([zeros, np.cumsum(~np.isnan(values), axis=0)])
+        start = np.maximum(np.arange(len(values)) - window + 1, 0)
+        total, count = sums[1:] - sums[start], counts[1:] - counts[start]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            partial = np.where(count >= min_periods, total / count, np.nan)
+        mean[partial_rows] = partial[partial_rows]
+    return mean
+
+# ====================
+# Context (shared intermediates)
+# ====================
+class IndicatorContext:
+    """Input fields plus a memo of intermediate arrays for one batch of requests
+
+    fields: {'close': (time, asset) array, optionally 'open', 'high', 'low', 'volume'}.
+    """
+
+    def __init__(self, fields):
+        self.fields = {name.lower(): np.asarray(values, dtype=float) for name, values in fields.items()}
+        self.cache = {}
+        self.hits = 0
+
+    def cached(self, key, compute):
+        if key in self.cache:
+            self.hits += 1
+        else:
+            self.cache[key] = compute()
+        return self.cache[key]
+
+    def field(self, name):
+        return self.fields[name]
+
+    def mean_std(self, window, field='close'):
+        return self.cached(('mean_std', field, window), lambda: rolling_mean_std(self.field(field), window))
+
+    def sma(self, window, min_periods=None, field='close'):
+        if min_periods is None or min_periods == window:
+            return self.mean_std(window, field)[0]
+        return self.cached(('sma', field, window, min_periods),
+                           lambda: rolling_mean(self.field(field), window, min_periods))
+
+    def ema(self, span, field='close'):
+        return self.cached(('ema', field, span), lambda: ewm(self.field(field), 2 / (span + 1)))
+
+    def wilder(self, key, values_fn, window):
+        # Wilder smoothing (alpha = 1 / window), NaN until `window` values were seen
+        return self.cached(('wilder', key, window), lambda: ewm(values_fn(), 1 / window, min_periods=window))
+
+    def diff(self, field='close'):
+        def compute():
+            values = self.field(field)
+            out = np.full(values.shape, np.nan)
+            out[1:] = values[1:] - values[:-1]
+            return out
+        return self.cached(('diff', field), compute)
+
+    def log_returns(self, field='close'):
+        def compute():
+            values = self.field(field)
+            out = np.full(values.shape, np.nan)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                out[1:] = np.log(values[1:] / values[:-1])
+            return out
+        return self.cached(('log_returns', field), compute)
+
+    def true_range(self):
+        def compute():
+            high, low, close = self.field('high'), self.field('low'), self.field('close')
+            previous = np.vstack([close[:1] * np.nan, close[:-1]])
+            ranges = np.stack([high - low, np.abs(high - previous), np.abs(low - previous)])
+            return np.fmax.reduce(ranges, axis=0)
+        return self.cached(('true_range',), compute)
+
+# ====================
+# Indicators
+# ====================
+@indicator('sma')
+def sma(ctx, window=20, min_periods=None):
+    return ctx.sma(window, min_periods)
+
+@indicator('ema')
+def ema(ctx, span=20):
+    return ctx.ema(span)
+
+@indicator('rsi')
+def rsi(ctx, window=14):
+    delta = ctx.diff()
+    gain = ctx.wilder('gain', lambda: np.where(np.isnan(delta), np.nan, np.maximum(delta, 0)), window)
+    loss = ctx.wilder('loss', lambda: np.where(np.isnan(delta), np.nan, np.maximum(-delta, 0)), window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(loss == 0, 100.0, 100 - 100 / (1 + gain / loss))
+
+@indicator('atr')
+def atr(ctx, window=14):
+    return ctx.wilder('true_range', ctx.true_range, window)
+
+@indicator('bollinger')
+def bollinger(ctx, window=20, k=2.0):
+    mid, std = ctx.mean_std(window)
+    return {'mid': mid, 'upper': mid + k * std, 'lower': mid - k * std}
+
+@indicator('macd')
+def macd(ctx, fast=12, slow=26, signal=9):
+    line = ctx.cached(('macd', fast, slow), lambda: ctx.ema(fast) - ctx.ema(slow))
+    signal_line = ctx.cached(('macd_signal', fast, slow, signal), lambda: ewm(line, 2 / (signal + 1)))
+    return {'line': line, 'signal': signal_line, 'hist': line - signal_line}
+
+@indicator('realized_vol')
+def realized_vol(ctx, window=30, periods_per_year=365):
+    _, std = ctx.cached(('mean_std', 'log_returns', window),
+                        lambda: rolling_mean_std(ctx.log_returns(), window))
+    return std * np.sqrt(periods_per_year)
+
+# ====================
+# Requests
+# ====================
+def compute(fields, requests):
+    """{output name: (time, asset) array} for every requested indicator
+
+    requests: {name: (indicator, *params)}, e.g. {'SMA20': ('sma', 20), 'MACD': ('macd',)}.
+    Indicators with several outputs add one entry per output, named '<name>_<output>'.
+    """
+    ctx = fields if isinstance(fields, IndicatorContext) else IndicatorContext(fields)
+    out = {}
+    for name, (kind, *params) in requests.items():
+        result = INDICATORS[kind](ctx, *params)
+        if isinstance(result, dict):
+            out.update({f"{name}_{suffix}": values for suffix, values in result.items()})
+        else:
+            out[name] = result
+    return out
+
+def compute_frame(df, requests):
+    """Indicators for one symbol's OHLCV DataFrame, as a DataFrame on the same index"""
+    fields = {column: df[[column]].to_numpy(dtype=float) for column in df.columns
+              if column.lower() in ('open', 'high', 'low', 'close', 'volume')}
+    return pd.DataFrame({name: values[:, 0] for name, values in compute(fields, requests).items()},
+                        index=df.index)
+
+def compute_panel(frames, requests):
+    """Indicators for many symbols: frames maps field name -> (time x symbol) DataFrame
+
+    Returns {output name: DataFrame} with the same index and columns as the inputs.
+    """
+    first = next(iter(frames.values()))
+    results = compute({field: df.to_numpy(dtype=float) for field, df in frames.items()}, requests)
+    return {name: pd.DataFrame(values, index=first.index, columns=first.columns)
+            for name, values in results.items()}
+
+# ====================
+# Dashboard Signals
+# ====================
+# Calculate technical indicators (used by app.py; importable without Streamlit so it can be benchmarked)
+def calculate_signals(df):
+    # Simple example using Moving Averages (both from one indicator-library pass)
+    averages = compute_frame(df, {'SMA20': ('sma', 20, 1), 'SMA50': ('sma', 50, 1)})
+    df['SMA20'] = averages['SMA20']
+    df['SMA50'] = averages['SMA50']
+    
+    # Generate trading signals (simple example)
+    df['Signal'] = 'HOLD'
+    df.loc[df['SMA20'] > df['SMA50'], 'Signal'] = 'BUY'
+    df.loc[df['SMA20'] < df['SMA50'], 'Signal'] = 'SELL'
+    
+    return df
@@ -0,0 +1,166 @@
+# Live streaming signals
+# New bars come from an async feed: poll_feed wraps any fetch function (the dashboard polls
+# the local store / Yahoo), replay_feed is a local stand-in that replays stored frames.
+# LiveBoard keeps an O(1) running SMA pair per symbol, so each bar costs the same whatever
+# the history length, and records one delta per update for the page to render.
+import asyncio
+import threading
+from collections import deque
+
+def crossover_signal(fast, slow):
+    # Same rule as indicators.calculate_signals (the dashboard signal)
+    if fast > slow:
+        return 'BUY'
+    if fast < slow:
+        return 'SELL'
+    return 'HOLD'
+
+# ====================
+# Incremental Indicators
+# ====================
+class RollingMean:
+    """rolling(window, min_periods=1).mean() of a stream, O(1) per value
+
+    revise() replaces the newest value, for a bar that is still forming. The running sum
+    is re-derived from the buffer every `resync_every` updates so rounding cannot drift.
+    """
+
+    def __init__(self, window, resync_every=10000):
+        self.window = window
+        self.resync_every = resync_every
+        self.values = deque(maxlen=window)
+        self.total = 0.0
+        self.updates = 0
+
+    def update(self, x):
+        if len(self.values) == self.window:
+            self.total -= self.values[0]
+        self.values.append(x)
+        self.total += x
+        self.updates += 1
+        if self.updates % self.resync_every == 0:
+            self.total = sum(self.values)
+        return self.total / len(self.values)
+
+    def revise(self, x):
+        if not self.values:
+            return self.update(x)
+        self.total += x - self.values[-1]
+        self.values[-1] = x
+        return self.total / len(self.values)
+
+class LiveSignal:
+    """Fast/slow SMA crossover for one symbol, updated bar by bar"""
+
+    def __init__(self, fast=20, slow=50):
+        self.fast = RollingMean(fast)
+        self.slow = RollingMean(slow)
+
+    def update(self, close, revise=False):
+        """(sma_fast, sma_slow, signal) after a new close (or a revised last close)"""
+        step = 'revise' if revise else 'update'
+        fast = getattr(self.fast, step)(close)
+        slow = getattr(self.slow, step)(close)
+        return fast, slow, crossover_signal(fast, slow)
+
+# ====================
+# Live Board
+# ====================
+class LiveBoard:
+    """Latest SMA/signal state for many symbols plus a bounded log of deltas
+
+    apply() takes one (symbol, time, close) bar: a newer time appends a bar, the same time
+    revises the forming bar, an older time is ignored. Readers poll deltas_since(cursor)
+    and only render what changed. Thread-safe: a feed thread writes while sessions read.
+    """
+
+    def __init__(self, fast=20, slow=50, max_deltas=10000):
+        self.fast_name, self.slow_name = f"SMA{fast}", f"SMA{slow}"
+        self.windows = (fast, slow)
+        self.signals = {}
+        self.latest = {}
+        self.deltas = deque(maxlen=max_deltas)
+        self.seq = 0
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def seed(self, frames):
+        """Prime each symbol with its recent history ({symbol: OHLCV DataFrame})"""
+        for symbol, df in frames.items():
+            for ts, close in df['Close'].dropna().iloc[-max(self.windows):].items():
+                self.apply(symbol, ts, float(close))
+
+    def apply(self, symbol, timestamp, close):
+        """Consume one bar; returns the delta dict, or None if nothing changed"""
+        with self._lock:
+            signal = self.signals.get(symbol)
+            if signal is None:
+                signal = self.signals[symbol] = LiveSignal(*self.windows)
+            previous = self.latest.get(symbol)
+            if previous is not None:
+                if timestamp < previous['time'] or (timestamp == previous['time'] and close == previous['close']):
+                    return None
+            revise = previous is not None and timestamp == previous['time']
+
+            fast, slow, action = signal.update(close, revise=revise)
+            self.seq += 1
+            delta = {
+                'seq': self.seq,
+                'symbol': symbol,
+                'time': timestamp,
+                'close': close,
+                self.fast_name: fast,
+                self.slow_name: slow,
+                'signal': action,
+                'signal_changed': previous is not None and previous['signal'] != action
+            }
+            self.latest[symbol] = delta
+            self.deltas.append(delta)
+            return delta
+
+    def deltas_since(self, cursor, symbols=None):
+        """(deltas with seq > cursor, optionally for `symbols` only, new cursor)"""
+        with self._lock:
+            new = [delta for delta in self.deltas if delta['seq'] > cursor
+                   and (symbols is None or delta['symbol'] in symbols)]
+            return new, self.seq
+
+    async def run(self, feed):
+        async for symbol, timestamp, close in feed:
+            self.apply(symbol, timestamp, close)
+
+    def start(self, feed):
+        """Consume an async feed on a daemon thread (once per board)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=asyncio.run, args=(self.run(feed),), daemon=True)
+            self._thread.start()
+        return self._thread
+
+# ====================
+# Feeds
+# ====================
+async def poll_feed(fetch_latest, interval=5.0):
+    """Yield (symbol, time, close) from fetch_latest() every `interval` seconds
+
+    fetch_latest returns {symbol: DataFrame of recent bars}; it runs in a worker thread so
+    a slow download never blocks the event loop. Already-seen bars are dropped by LiveBoard.
+    """
+    while True:
+        try:
+            frames = await asyncio.to_thread(fetch_latest)
+        except Exception as e:
+            print(f"Error polling live bars: {str(e)}")
+            frames = {}
+        for symbol, df in frames.items():
+            for ts, close in df['Close'].dropna().items():
+                yield symbol, ts, float(close)
+        await asyncio.sleep(interval)
+
+async def replay_feed(frames, delay=0.0):
+    """Local stand-in for a live feed: replays stored bars in time order across symbols"""
+    rows = sorted((ts, symbol, float(close)) for symbol, df in frames.items()
+                  for ts, close in df['Close'].dropna().items())
+    for ts, symbol, close in rows:
+        yield symbol, ts, close
+        if delay:
+            await asyncio.sleep(delay)
@@ -0,0 +1,121 @@
+# Vectorized performance analytics
+# Every function takes per-period returns for many curves at once, as a (time, curve)
+# array or DataFrame (columns = strategies, assets or sweep cells), and returns structured
+# results instead of printing. NaN returns (e.g. a curve's first bar) count as missing
+# for the statistics and as flat for the equity curve.
+import numpy as np
+import pandas as pd
+from features import rolling_mean_std
+
+# Crypto trades every day, so both CAGR and the ratios annualize with 365 periods
+PERIODS_PER_YEAR = 365
+
+def _as_2d(returns):
+    # (array, column labels, index) for a Series / DataFrame / 1-D or 2-D array
+    if isinstance(returns, pd.Series):
+        returns = returns.to_frame()
+    if isinstance(returns, pd.DataFrame):
+        return returns.to_numpy(dtype=float), list(returns.columns), returns.index
+    values = np.asarray(returns, dtype=float)
+    if values.ndim == 1:
+        values = values[:, None]
+    return values, list(range(values.shape[1])), None
+
+def equity_curves(returns):
+    """Cumulative growth of 1 for every curve"""
+    values, _, _ = _as_2d(returns)
+    growth = values + 1
+    growth[np.isnan(growth)] = 1.0
+    return np.cumprod(growth, axis=0, out=growth)
+
+def drawdowns(equity):
+    """(drawdown, duration) arrays: distance below the running peak and periods since it"""
+    drawdown = np.maximum.accumulate(equity, axis=0)
+    np.divide(equity, drawdown, out=drawdown)
+    drawdown -= 1
+    rows = np.arange(len(equity))[:, None]
+    duration = np.where(drawdown >= 0, rows, 0)
+    np.maximum.accumulate(duration, axis=0, out=duration)
+    np.subtract(rows, duration, out=duration)
+    return drawdown, duration
+
+# ====================
+# Report
+# ====================
+def performance_report(returns, turnover=None, periods_per_year=PERIODS_PER_YEAR):
+    """One row of metrics per curve, computed for all curves in one pass
+
+    returns: (time, curve) per-period returns.
+    turnover: optional (time, curve) traded notional per period (e.g. run_portfolio's
+    'turnover'); adds annualized turnover and the number of trading periods.
+    Drawdown duration is in periods; hit_rate is the share of non-flat periods that
+    made money.
+    """
+    values, columns, _ = _as_2d(returns)
+    n_periods = len(values)
+    equity = equity_curves(values)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        # NaN-aware statistics only when some curve actually has gaps (they are ~5x slower)
+        has_gaps = np.isnan(values).any()
+        average = np.nanmean if has_gaps else np.mean
+        mean = average(values, axis=0)
+        std = (np.nanstd if has_gaps else np.std)(values, axis=0, ddof=1)
+        downside = np.sqrt(average(np.minimum(values, 0) ** 2, axis=0))
+        drawdown, duration = drawdowns(equity)
+        max_drawdown = drawdown.min(axis=0)
+        total_return = equity[-1] - 1
+        cagr = equity[-1] ** (periods_per_year / n_periods) - 1
+        active = np.count_nonzero(np.nan_to_num(values), axis=0)
+        report = {
+            'total_return': total_return,
+            'cagr': cagr,
+            'volatility': std * np.sqrt(periods_per_year),
+            'sharpe': mean / std * np.sqrt(periods_per_year),
+            'sortino': mean / downside * np.sqrt(periods_per_year),
+            'calmar': cagr / np.abs(max_drawdown),
+            'max_drawdown': max_drawdown,
+            'max_drawdown_duration': duration.max(axis=0),
+            'hit_rate': np.count_nonzero(values > 0, axis=0) / active
+        }
+
+    if turnover is not None:
+        traded, _, _ = _as_2d(turnover)
+        traded = np.nan_to_num(traded)
+        report['turnover'] = traded.mean(axis=0) * periods_per_year
+        report['trades'] = np.count_nonzero(traded, axis=0)
+
+    # Undefined ratios (flat curves, no drawdown) come out as NaN rather than inf
+    report = {name: np.where(np.isfinite(value), value, np.nan) for name, value in report.items()}
+    return pd.DataFrame(report, index=columns)
+
+def rolling_metrics(returns, window=90, periods_per_year=PERIODS_PER_YEAR):
+    """{'return', 'volatility', 'sharpe', 'drawdown'} -> (time, curve) DataFrames
+
+    Return, volatility and Sharpe are annualized over the trailing `window` periods;
+    drawdown is measured from the running peak of the whole curve.
+    """
+    values, columns, index = _as_2d(returns)
+    mean, std = rolling_mean_std(np.nan_to_num(values), window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(std > 0, mean / std * np.sqrt(periods_per_year), np.nan)
+    drawdown, _ = drawdowns(equity_curves(values))
+
+    frame = lambda data: pd.DataFrame(data, index=index, columns=columns)
+    return {
+        'return': frame(mean * periods_per_year),
+        'volatility': frame(std * np.sqrt(periods_per_year)),
+        'sharpe': frame(sharpe),
+        'drawdown': frame(drawdown)
+    }
+
+# ====================
+# Trades
+# ====================
+def trade_counts(positions):
+    """Number of units traded per position column (|position change| summed), as a Series"""
+    if not isinstance(positions, pd.DataFrame):
+        positions = pd.DataFrame(positions)
+    values = positions.to_numpy(dtype=float)
+    traded = np.nansum(np.abs(np.diff(values, axis=0)), axis=0)
+    return pd.Series(traded, index=positions.columns, name='trades')
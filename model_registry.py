@@ -0,0 +1,99 @@
+# Persisted model registry
+# Fitted HMMs, their scalers and the interpret_states volatility ordering are pickled under
+# data/models/, keyed by symbol, feature window, date range and n_components. An entry is
+# only reused while the hash of the features it was fitted on still matches.
+import os
+import hashlib
+import pickle
+import pandas as pd
+from data_store import DATA_DIR
+from strategy import fit_hmm_many
+from backtest import interpret_states
+from profiling import timed, count
+
+REGISTRY_DIR = os.path.join(DATA_DIR, 'models')
+
+def registry_key(symbol, window, start, end, n_components):
+    """File-safe registry key, e.g. BTC-USD_w30_20220101_20250101_k3"""
+    start, end = pd.Timestamp(start).strftime('%Y%m%d'), pd.Timestamp(end).strftime('%Y%m%d')
+    return f"{symbol}_w{window}_{start}_{end}_k{n_components}".replace('/', '_')
+
+def data_hash(features):
+    """Content hash of a feature frame (values and index)"""
+    hashed = pd.util.hash_pandas_object(features, index=True).to_numpy()
+    return hashlib.sha1(hashed.tobytes()).hexdigest()
+
+def state_mapping(features, states):
+    """Raw HMM state -> volatility rank (0=low), as computed by interpret_states"""
+    state_df = interpret_states(features, states)
+    pairs = state_df[['state', 'mapped_state']].drop_duplicates()
+    return dict(zip(pairs['state'].astype(int), pairs['mapped_state'].astype(int)))
+
+# ====================
+# Load / Save
+# ====================
+def _path(key):
+    return os.path.join(REGISTRY_DIR, f"{key}.pkl")
+
+def load_entry(key, features_hash=None):
+    """Registry entry for `key`, or None if missing, unreadable or fitted on different data"""
+    path = _path(key)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, 'rb') as f:
+            entry = pickle.load(f)
+    except Exception as e:
+        print(f"Error loading model {key}: {str(e)}")
+        return None
+    if features_hash is not None and entry.get('data_hash') != features_hash:
+        return None  # Input data changed, the stored fit is stale
+    return entry
+
+def save_entry(key, entry):
+    os.makedirs(REGISTRY_DIR, exist_ok=True)
+    tmp_path = f"{_path(key)}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, _path(key))
+
+# ====================
+# Cached Fitting
+# ====================
+@timed()
+def fit_hmm_cached(features_by_symbol, window=30, n_components=3, n_jobs=None):
+    """Drop-in for fit_hmm_many that loads registry hits and only fits the misses
+
+    Returns {symbol: (model, hidden_states, scaler)}; the volatility ordering of each fit
+    is stored alongside and can be read back with load_entry.
+    """
+    results = {}
+    misses = {}
+    keys = {}
+    for symbol, features in features_by_symbol.items():
+        keys[symbol] = registry_key(symbol, window, features.index[0], features.index[-1], n_components)
+        entry = load_entry(keys[symbol], data_hash(features))
+        if entry is None:
+            misses[symbol] = features
+        else:
+            results[symbol] = (entry['model'], entry['states'], entry['scaler'])
+    count('registry_hits', len(results))
+    count('registry_misses', len(misses))
+
+    if misses:
+        fitted = fit_hmm_many(misses, n_components=n_components, n_jobs=n_jobs)
+        for symbol, (model, states, scaler) in fitted.items():
+            features = misses[symbol]
+            save_entry(keys[symbol], {
+                'symbol': symbol,
+                'window': window,
+                'n_components': n_components,
+                'data_hash': data_hash(features),
+                'model': model,
+                'scaler': scaler,
+                'states': states,
+                'state_mapping': state_mapping(features, states)
+            })
+            results[symbol] = (model, states, scaler)
+
+    return {symbol: results[symbol] for symbol in features_by_symbol}
@@ -0,0 +1,119 @@
+# Lazily evaluated strategy pipeline
+# fetch -> create_features -> fit_hmm -> interpret_states -> generate_portfolio_signals -> run_backtest -> analyze_performance
+from functools import cached_property
+from datetime import datetime, timedelta
+import pandas as pd
+from backtest import (
+    fetch_crypto_data,
+    fit_hmm_many,
+    interpret_states,
+    generate_portfolio_signals,
+    run_backtest,
+    analyze_performance
+)
+from model_registry import fit_hmm_cached
+from features import create_features_panel
+from hmm_batch import decode_batch
+from hmm_online import volatility_mapping
+
+class Pipeline:
+    """HMM strategy pipeline where every stage runs on first access and is memoized.
+
+    Creating a Pipeline does no work; asking for `metrics` runs every stage once,
+    asking for `features` only downloads prices and builds features. Pass `prices`
+    (a Close price DataFrame with one column per ticker) to skip the download.
+    Fitted models come from the model registry unless `use_registry=False`.
+    `indicators` adds extra HMM feature columns (see features.create_features_panel).
+    `onchain` adds Cybotrade on-chain features: True for feature_join.ONCHAIN_FEATURES,
+    or a {name: (topic, column, aggregation)} spec.
+    Every ticker gets its own position; the backtest trades them as one portfolio.
+    `decoded` / `regime_probabilities` decode every ticker in one batched call (hmm_batch.py).
+    """
+
+    def __init__(self, tickers=('BTC-USD', 'ETH-USD'), start_date=None, end_date=None,
+                 days=365*3, n_components=3, fee=0.001, prices=None, n_jobs=None,
+                 window=30, use_registry=True, indicators=None, onchain=None):
+        self.tickers = list(tickers)
+        self.end_date = end_date or datetime.now()
+        self.start_date = start_date or self.end_date - timedelta(days=days)
+        self.n_components = n_components
+        self.fee = fee
+        self.n_jobs = n_jobs
+        self.window = window
+        self.use_registry = use_registry
+        self.indicators = indicators
+        self.onchain = onchain
+        if prices is not None:
+            self.__dict__['prices'] = prices  # Pre-seed the memoized stage
+
+    @cached_property
+    def prices(self):
+        return fetch_crypto_data(self.tickers, self.start_date, self.end_date)
+
+    @cached_property
+    def onchain_features(self):
+        # On-chain topics as-of joined to the price bars (cached by feature_join), or None
+        if not self.onchain:
+            return None
+        from feature_join import onchain_features
+        return onchain_features(self.prices.index, spec=None if self.onchain is True else self.onchain)
+
+    @cached_property
+    def features(self):
+        # All tickers in one vectorized pass; same frames as create_features per ticker
+        return create_features_panel(self.prices[list(self.tickers)], window=self.window,
+                                     indicators=self.indicators, exogenous=self.onchain_features)
+
+    @cached_property
+    def models(self):
+        # {ticker: (model, hidden_states, scaler)}, fitted in parallel worker processes
+        if self.use_registry:
+            return fit_hmm_cached(self.features, window=self.window,
+                                  n_components=self.n_components, n_jobs=self.n_jobs)
+        return fit_hmm_many(self.features, n_components=self.n_components, n_jobs=self.n_jobs)
+
+    @cached_property
+    def state_dfs(self):
+        return {ticker: interpret_states(self.features[ticker], self.models[ticker][1])
+                for ticker in self.tickers}
+
+    @cached_property
+    def decoded(self):
+        # Viterbi paths plus filtered and smoothed state probabilities, every ticker in one batched call
+        return decode_batch({ticker: self.features[ticker] for ticker in self.tickers},
+                            [self.models[ticker][0] for ticker in self.tickers],
+                            [self.models[ticker][2] for ticker in self.tickers], smoothed=True)
+
+    @cached_property
+    def regime_probabilities(self):
+        # {ticker: DataFrame of P(low / medium / high volatility regime | bars so far)}
+        out = {}
+        for ticker in self.tickers:
+            features = self.features[ticker]
+            mapping = volatility_mapping(self.models[ticker][0], list(features.columns).index('volatility'))
+            filtered = self.decoded['filtered'][ticker]
+            out[ticker] = pd.DataFrame({name: filtered[:, mapping == regime].sum(axis=1)
+                                        for regime, name in enumerate(['low', 'medium', 'high'])},
+                                       index=features.index)
+        return out
+
+    @cached_property
+    def signals(self):
+        # Every ticker is traded; bars where any ticker has no state yet are dropped
+        states = pd.DataFrame({ticker: self.state_dfs[ticker]['mapped_state'] for ticker in self.tickers})
+        return generate_portfolio_signals(states.dropna().astype(int), self.prices)
+
+    @cached_property
+    def backtest(self):
+        # run_backtest adds columns in place, keep the signals stage untouched
+        return run_backtest(self.signals.copy(), fee=self.fee)
+
+    @cached_property
+    def metrics(self):
+        return analyze_performance(self.backtest)
+
+    def computed(self):
+        """Names of the stages that have already been evaluated"""
+        stages = ['prices', 'onchain_features', 'features', 'models', 'state_dfs', 'decoded', 'regime_probabilities',
+                  'signals', 'backtest', 'metrics']
+        return [stage for stage in stages if stage in self.__dict__]
@@ -0,0 +1,98 @@
+# Array-backed multi-asset portfolio backtester
+# Works on (time x asset) position and price matrices for any number of assets. Fees are
+# charged on traded notional (turnover), not by scaling the return. Bars are processed in
+# chunks with the previous price, position and equity carried over, so memory stays bounded
+# by the chunk size even for np.memmap inputs with millions of bars and hundreds of assets.
+import numpy as np
+from signal_engine import compute_signals
+
+# Values (bars x assets) per chunk; each temporary array is about 8 MB
+CHUNK_VALUES = 1 << 20
+
+def positions_from_states(states):
+    """(time, asset) int8 positions from mapped HMM states, executed on the next bar"""
+    positions, _ = compute_signals(states)
+    shifted = np.zeros_like(positions)
+    shifted[1:] = positions[:-1]
+    return shifted
+
+def _as_array(values):
+    # DataFrames -> ndarray; ndarrays and memmaps are sliced lazily per chunk
+    return values.to_numpy() if hasattr(values, 'to_numpy') else values
+
+def ffill(values):
+    # Column-wise forward fill of NaNs for a 2-D array (leading NaNs stay NaN)
+    rows = np.where(np.isnan(values), 0, np.arange(len(values))[:, None])
+    np.maximum.accumulate(rows, axis=0, out=rows)
+    return values[rows, np.arange(values.shape[1])]
+
+def run_portfolio(positions, prices, fee=0.001, chunk_size=None, asset_returns=False):
+    """Backtest a (time, asset) positions matrix against a (time, asset) price matrix
+
+    positions[t] is the exposure (fraction of equity) held over bar t, already shifted so
+    it was decided before bar t. Bar t's portfolio return is
+    sum(positions[t] * asset_return[t]) - fee * sum(|positions[t] - positions[t-1]|).
+    A missing price contributes a zero return until the asset trades again.
+    Returns a dict of arrays:
+      returns, equity, turnover  (time,)
+      trades, asset_pnl, asset_fees  (asset,): position changes, summed return
+          contribution and fees per asset
+      asset_returns  (time, asset), only when asset_returns=True
+    chunk_size: bars per chunk (default: about CHUNK_VALUES values per chunk).
+    """
+    positions, prices = _as_array(positions), _as_array(prices)
+    if positions.ndim == 1:
+        positions, prices = positions[:, None], prices[:, None]
+    n_bars, n_assets = prices.shape
+    chunk_size = chunk_size or max(1, CHUNK_VALUES // n_assets)
+
+    returns = np.empty(n_bars)
+    equity = np.empty(n_bars)
+    turnover = np.empty(n_bars)
+    trades = np.zeros(n_assets, dtype=np.int64)
+    asset_pnl = np.zeros(n_assets)
+    asset_fees = np.zeros(n_assets)
+    per_asset = np.empty((n_bars, n_assets)) if asset_returns else None
+
+    last_price = np.full(n_assets, np.nan)
+    last_position = np.zeros(n_assets)
+    level = 1.0
+    for start in range(0, n_bars, chunk_size):
+        end = min(start + chunk_size, n_bars)
+        price = np.asarray(prices[start:end], dtype=float)
+        position = np.asarray(positions[start:end], dtype=float)
+
+        # Forward-fill gaps so the bar after a missing price is measured from the last known one
+        price = ffill(np.vstack([last_price[None], price]))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ret = price[1:] / price[:-1] - 1
+        ret[~np.isfinite(ret)] = 0.0
+        change = np.abs(np.diff(position, axis=0, prepend=last_position[None]))
+
+        gross = position * ret
+        cost = fee * change
+        returns[start:end] = gross.sum(axis=1) - cost.sum(axis=1)
+        turnover[start:end] = change.sum(axis=1)
+        equity[start:end] = level * np.cumprod(1 + returns[start:end])
+        trades += np.count_nonzero(change, axis=0)
+        asset_pnl += gross.sum(axis=0)
+        asset_fees += cost.sum(axis=0)
+        if per_asset is not None:
+            per_asset[start:end] = ret
+
+        # Carry state into the next chunk
+        last_price = price[-1]
+        last_position = position[-1]
+        level = equity[end - 1]
+
+    result = {
+        'returns': returns,
+        'equity': equity,
+        'turnover': turnover,
+        'trades': trades,
+        'asset_pnl': asset_pnl,
+        'asset_fees': asset_fees
+    }
+    if per_asset is not None:
+        result['asset_returns'] = per_asset
+    return result
@@ -0,0 +1,310 @@
+# Pipeline profiling
+# Stage timers (context manager or decorator), memory high-water marks and counters such as
+# bars processed, EM iterations and cache hits/misses, grouped into runs. A run covers one
+# pipeline/producer pass or one dashboard render; finished runs are appended to
+# data/profile_runs.jsonl (read by the dashboard debug panel) and the latest run of each
+# name is exported as Prometheus text to data/profile.prom.
+#
+# Off by default. Set HMM_PROFILE=1 (or call enable()) to record runs; while no run is open
+# on the current thread, stage() returns a shared no-op context manager and count() returns
+# after a single attribute lookup. @timed only wraps functions decorated while profiling is
+# enabled (HMM_PROFILE=1 at import), so with profiling off they run undecorated.
+# Stage times are inclusive, so nested stages are also counted in their parent.
+import os
+import json
+import time
+import threading
+import tracemalloc
+from collections import deque
+from contextlib import contextmanager
+from functools import wraps
+from data_store import DATA_DIR
+
+try:
+    import resource  # Unix only, used for the process RSS high-water mark
+except ImportError:
+    resource = None
+
+RUNS_LOG = os.path.join(DATA_DIR, 'profile_runs.jsonl')
+PROM_FILE = os.path.join(DATA_DIR, 'profile.prom')
+RUN_HISTORY = 50                # runs kept in memory and in the log
+MAX_LOG_BYTES = 2 * 2**20       # the log is trimmed to RUN_HISTORY runs past this size
+
+_enabled = os.environ.get('HMM_PROFILE', '') not in ('', '0')
+_trace_memory = os.environ.get('HMM_PROFILE_MEMORY', '') not in ('', '0')
+
+class _Local(threading.local):
+    run = None  # Class default: a missing attribute would make every lookup raise and catch
+
+_local = _Local()
+_write_lock = threading.Lock()
+RUNS = deque(maxlen=RUN_HISTORY)
+
+def enable(trace_memory=False):
+    """Record runs from now on; trace_memory adds per-stage Python allocation peaks (tracemalloc, slower)
+
+    Only functions decorated with @timed after this call are timed; set HMM_PROFILE=1 to
+    time those of modules imported earlier.
+    """
+    global _enabled, _trace_memory
+    _enabled, _trace_memory = True, trace_memory
+
+def disable():
+    global _enabled
+    _enabled = False
+
+def is_enabled():
+    return _enabled
+
+def _rss_peak_mb():
+    if resource is None:
+        return None
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KB on Linux
+
+# ====================
+# Runs
+# ====================
+class Run:
+    """Stage timings, memory and counters recorded on one thread between start_run and end_run"""
+
+    def __init__(self, name, trace_memory):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.started = time.time()
+        self.start_clock = time.perf_counter()
+        self.stages = {}
+        self.counters = {}
+        self.frames = []  # open stages, innermost last
+        if trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self.owns_tracing = True
+        else:
+            self.owns_tracing = False
+
+    def record(self, name, seconds, peak_bytes):
+        stage = self.stages.setdefault(name, {'calls': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+        stage['calls'] += 1
+        stage['seconds'] += seconds
+        stage['max_seconds'] = max(stage['max_seconds'], seconds)
+        stage['rss_peak_mb'] = _rss_peak_mb()
+        if peak_bytes is not None:
+            stage['peak_mb'] = max(stage.get('peak_mb', 0.0), peak_bytes / 2**20)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'started': time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(self.started)),
+            'seconds': time.perf_counter() - self.start_clock,
+            'pid': os.getpid(),
+            'rss_peak_mb': _rss_peak_mb(),
+            'stages': self.stages,
+            'counters': self.counters
+        }
+
+def current_run():
+    return _local.run
+
+def start_run(name, force=False):
+    """Open a run on this thread (replacing one left open); None when profiling is off and not forced"""
+    if not (_enabled or force):
+        _local.run = None
+        return None
+    _local.run = Run(name, _trace_memory)
+    return _local.run
+
+def end_run(export=True):
+    """Close this thread's run; returns its dict (or None if no run was open)"""
+    run = current_run()
+    if run is None:
+        return None
+    _local.run = None
+    if run.owns_tracing:
+        tracemalloc.stop()
+    result = run.to_dict()
+    RUNS.append(result)
+    if export:
+        try:
+            _append_log(result)
+            export_prometheus()
+        except Exception as e:
+            print(f"Error exporting profile run: {str(e)}")
+    return result
+
+@contextmanager
+def run(name, force=False, export=True):
+    start_run(name, force)
+    try:
+        yield current_run()
+    finally:
+        end_run(export)
+
+# ====================
+# Stages and Counters
+# ====================
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_STAGE = _NullStage()
+
+class _Stage:
+    def __init__(self, run, name):
+        self.run = run
+        self.name = name
+
+    def __enter__(self):
+        frames = self.run.frames
+        if self.run.trace_memory:
+            # reset_peak() would lose the parent's peak so far, so hand it to the parent first
+            current, peak = tracemalloc.get_traced_memory()
+            if frames:
+                frames[-1]['peak'] = max(frames[-1]['peak'], peak)
+            tracemalloc.reset_peak()
+            frames.append({'base': current, 'peak': current})
+        else:
+            frames.append(None)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        seconds = time.perf_counter() - self.start
+        frame = self.run.frames.pop()
+        peak_bytes = None
+        if frame is not None:
+            frame['peak'] = max(frame['peak'], tracemalloc.get_traced_memory()[1])
+            peak_bytes = frame['peak'] - frame['base']
+            if self.run.frames:
+                self.run.frames[-1]['peak'] = max(self.run.frames[-1]['peak'], frame['peak'])
+        self.run.record(self.name, seconds, peak_bytes)
+        return False
+
+def stage(name):
+    """Context manager timing one stage of the current run (a no-op when no run is open)"""
+    run = _local.run
+    if run is None:
+        return _NULL_STAGE
+    return _Stage(run, name)
+
+def timed(name=None):
+    """Decorator form of stage(); the stage name defaults to the function name
+
+    Returns the function itself when profiling is off at decoration time (no per-call cost),
+    so functions decorated before enable() are not timed.
+    """
+    def decorate(fn):
+        if not _enabled:
+            return fn
+        stage_name = name or fn.__name__
+
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            run = _local.run
+            if run is None:
+                return fn(*args, **kwargs)
+            with _Stage(run, stage_name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def count(name, n=1):
+    """Add n to a counter of the current run (a no-op when no run is open)"""
+    run = _local.run
+    if run is not None:
+        run.counters[name] = run.counters.get(name, 0) + n
+
+def timeit_best(func, *args, repeat=3):
+    """(best wall time of `repeat` calls of func(*args) in seconds, last result), for benchmarks"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+# ====================
+# Export
+# ====================
+def _append_log(result, path=RUNS_LOG):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    line = json.dumps(result, default=str) + '\n'
+    with _write_lock:
+        with open(path, 'a') as f:
+            f.write(line)
+        if os.path.getsize(path) > MAX_LOG_BYTES:
+            runs = load_runs(RUN_HISTORY, path)
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                f.writelines(json.dumps(r, default=str) + '\n' for r in runs)
+            os.replace(tmp_path, path)
+
+def load_runs(n=RUN_HISTORY, path=RUNS_LOG):
+    """The last n runs from the log (every process that profiled), oldest first"""
+    if not os.path.exists(path):
+        return list(RUNS)[-n:]
+    runs = []
+    with open(path) as f:
+        for line in deque(f, maxlen=n):
+            try:
+                runs.append(json.loads(line))
+            except ValueError:
+                continue  # A line cut short by a concurrent trim
+    return runs
+
+def _label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"')
+
+# (metric, help) in exposition order; each family's samples are written under its own HELP/TYPE
+PROM_METRICS = [
+    ('hmm_run_seconds', 'Wall time of the latest run'),
+    ('hmm_rss_peak_bytes', 'Process resident memory high-water mark at the end of the run'),
+    ('hmm_stage_seconds', 'Inclusive time spent in a stage during the latest run'),
+    ('hmm_stage_calls', 'Stage calls during the latest run'),
+    ('hmm_stage_peak_bytes', 'Python allocation peak within a stage (tracemalloc runs only)'),
+    ('hmm_counter', 'Counters (bars, EM iterations, cache hits/misses) of the latest run')
+]
+
+def prometheus_text(runs):
+    """Prometheus exposition text (gauges) for the latest run of each run name"""
+    latest = {}
+    for r in runs:
+        latest[r['name']] = r
+    samples = {metric: [] for metric, _ in PROM_METRICS}
+    for name, r in latest.items():
+        run_label = f'run="{_label(name)}"'
+        samples['hmm_run_seconds'].append(f'{{{run_label}}} {r["seconds"]:.6f}')
+        if r.get('rss_peak_mb') is not None:
+            samples['hmm_rss_peak_bytes'].append(f'{{{run_label}}} {int(r["rss_peak_mb"] * 2**20)}')
+        for stage_name, s in r['stages'].items():
+            labels = f'{run_label},stage="{_label(stage_name)}"'
+            samples['hmm_stage_seconds'].append(f'{{{labels}}} {s["seconds"]:.6f}')
+            samples['hmm_stage_calls'].append(f'{{{labels}}} {s["calls"]}')
+            if 'peak_mb' in s:
+                samples['hmm_stage_peak_bytes'].append(f'{{{labels}}} {int(s["peak_mb"] * 2**20)}')
+        for counter, value in r['counters'].items():
+            samples['hmm_counter'].append(f'{{{run_label},name="{_label(counter)}"}} {value}')
+
+    lines = []
+    for metric, help_text in PROM_METRICS:
+        lines.append(f'# HELP {metric} {help_text}')
+        lines.append(f'# TYPE {metric} gauge')
+        lines.extend(metric + sample for sample in samples[metric])
+    return '\n'.join(lines) + '\n'
+
+def export_prometheus(path=PROM_FILE, runs=None):
+    """Write prometheus_text for the logged runs (node_exporter textfile-collector format)"""
+    text = prometheus_text(load_runs() if runs is None else runs)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+def runs_frame(runs):
+    """One row per (run, stage) for display"""
+    import pandas as pd
+
+    rows = [{'run': r['name'], 'started': r['started'], 'stage': stage_name, **s}
+            for r in runs for stage_name, s in r['stages'].items()]
+    return pd.DataFrame(rows)
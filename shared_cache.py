@@ -0,0 +1,181 @@
+# Shared cross-process cache for the dashboard
+# Values are pickled into a SQLite database under data/, so every Streamlit server process
+# (and every session in it) shares one copy instead of each keeping its own.
+#  - Request coalescing: a per-key lease row lets exactly one caller fetch a missing or
+#    expired key; everyone else waits for its result instead of calling upstream too.
+#  - Stale-while-revalidate: an expired value younger than ttl + stale_ttl is served
+#    immediately while one background thread refreshes it.
+#  - Size-bounded LRU: once the stored bytes exceed max_bytes, the least recently used
+#    entries are evicted.
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from data_store import DATA_DIR
+from profiling import count
+
+CACHE_DB = os.path.join(DATA_DIR, 'cache.sqlite')
+
+POLL_INTERVAL = 0.05  # seconds between checks while another caller fetches the key
+TOUCH_INTERVAL = 30   # seconds; hits refresh their LRU timestamp at most this often
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache (
+    key TEXT PRIMARY KEY,
+    value BLOB,
+    created REAL,
+    accessed REAL,
+    size INTEGER
+);
+CREATE TABLE IF NOT EXISTS leases (
+    key TEXT PRIMARY KEY,
+    owner TEXT,
+    expires REAL
+);
+"""
+
+class SharedCache:
+    """get(key, fetch) returns the cached value for `key`, calling fetch() only when needed
+
+    ttl: seconds a value is fresh. stale_ttl: extra seconds an expired value may still be
+    served while it is refreshed in the background. lease_timeout: how long a fetch may
+    hold a key before another caller takes over.
+    """
+
+    def __init__(self, path=CACHE_DB, ttl=300, stale_ttl=3600, max_bytes=256 * 2**20, lease_timeout=60):
+        self.path = path
+        self.ttl = ttl
+        self.stale_ttl = stale_ttl
+        self.max_bytes = max_bytes
+        self.lease_timeout = lease_timeout
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(_SCHEMA)
+
+    def _conn(self):
+        # One connection per thread (sqlite3 connections are not shareable across threads)
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute('PRAGMA journal_mode=WAL')
+            self._local.conn = conn
+        return conn
+
+    # ====================
+    # Storage
+    # ====================
+    def _read(self, key):
+        row = self._conn().execute("SELECT value, created, accessed FROM cache WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, created, accessed = row
+        now = time.time()
+        if now - accessed > TOUCH_INTERVAL:
+            with self._conn() as conn:
+                conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+        return pickle.loads(value), now - created
+
+    def _write(self, key, value):
+        blob = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?, ?, ?)", (key, blob, now, now, len(blob)))
+            self._evict(conn, keep=key)
+
+    def _evict(self, conn, keep):
+        # Drop least recently used entries until the total size fits in max_bytes
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in conn.execute("SELECT key, size FROM cache ORDER BY accessed").fetchall():
+            if total <= self.max_bytes:
+                break
+            if key != keep:
+                conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+                total -= size
+
+    def invalidate(self, key):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+
+    # ====================
+    # Leases (request coalescing)
+    # ====================
+    def _acquire(self, key):
+        # Owner token if this caller now holds the key's lease, else None
+        owner = f"{os.getpid()}:{threading.get_ident()}:{time.monotonic_ns()}"
+        now = time.time()
+        with self._conn() as conn:
+            taken = conn.execute("INSERT OR IGNORE INTO leases VALUES (?, ?, ?)",
+                                 (key, owner, now + self.lease_timeout)).rowcount
+            if not taken:  # Take over a lease whose holder died or hung
+                taken = conn.execute("UPDATE leases SET owner = ?, expires = ? WHERE key = ? AND expires < ?",
+                                     (owner, now + self.lease_timeout, key, now)).rowcount
+        return owner if taken == 1 else None
+
+    def _release(self, key, owner):
+        with self._conn() as conn:
+            conn.execute("DELETE FROM leases WHERE key = ? AND owner = ?", (key, owner))
+
+    def _fetch_and_store(self, key, fetch, owner):
+        # Caller holds the lease; None results are not cached so failures are retried
+        try:
+            value = fetch()
+            if value is not None:
+                self._write(key, value)
+            return value
+        finally:
+            self._release(key, owner)
+
+    def _revalidate(self, key, fetch, owner):
+        try:
+            self._fetch_and_store(key, fetch, owner)
+        except Exception as e:
+            print(f"Error refreshing cache key {key}: {str(e)}")
+
+    # ====================
+    # Lookup
+    # ====================
+    def get(self, key, fetch, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        waited_since = None
+        while True:
+            cached = self._read(key)
+            if cached is not None:
+                value, age = cached
+                if age < ttl:
+                    count('cache_hits')
+                    return value
+                if age < ttl + self.stale_ttl:
+                    # Serve stale, refresh once in the background
+                    count('cache_stale_hits')
+                    owner = self._acquire(key)
+                    if owner:
+                        threading.Thread(target=self._revalidate, args=(key, fetch, owner), daemon=True).start()
+                    return value
+
+            owner = self._acquire(key)
+            if owner:
+                # Another caller may have stored the value between our read and the lease
+                fresh = self._read(key)
+                if fresh is not None and fresh[1] < ttl:
+                    self._release(key, owner)
+                    count('cache_hits')
+                    return fresh[0]
+                count('cache_misses')
+                try:
+                    return self._fetch_and_store(key, fetch, owner)
+                except Exception:
+                    if cached is not None:
+                        return cached[0]  # Upstream failed, an old value beats nothing
+                    raise
+
+            # Another caller is fetching this key: wait for its result
+            if waited_since is None:
+                count('cache_coalesced')
+                waited_since = time.time()
+            if time.time() - waited_since > self.lease_timeout:
+                return fetch()
+            time.sleep(POLL_INTERVAL)
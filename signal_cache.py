@@ -0,0 +1,102 @@
+# Shared HMM signal cache
+# The background producer (signal_producer.py) writes the latest regime, position and
+# action per symbol, plus recent history, into a SQLite database under data/. The
+# dashboard only reads from it, so showing a signal never fits a model. WAL mode lets the
+# producer write while any number of dashboard sessions read.
+import os
+import sqlite3
+import time
+import pandas as pd
+from data_store import DATA_DIR
+
+SIGNAL_DB = os.path.join(DATA_DIR, 'signals.sqlite')
+
+REGIME_NAMES = {0: 'low volatility', 1: 'medium volatility', 2: 'high volatility'}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS signals (
+    symbol TEXT PRIMARY KEY,
+    as_of TEXT,
+    price REAL,
+    state INTEGER,
+    position INTEGER,
+    action TEXT,
+    last_action TEXT,
+    last_action_at TEXT,
+    computed_at REAL
+);
+CREATE TABLE IF NOT EXISTS signal_history (
+    symbol TEXT,
+    time TEXT,
+    price REAL,
+    state INTEGER,
+    position INTEGER,
+    action TEXT,
+    PRIMARY KEY (symbol, time)
+);
+"""
+
+def connect(path=SIGNAL_DB):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.executescript(_SCHEMA)
+    return conn
+
+# ====================
+# Write (producer)
+# ====================
+def write_signals(latest, history=None, path=SIGNAL_DB):
+    """Replace the latest signal rows and each symbol's history in one transaction
+
+    latest: list of dicts with the `signals` columns (computed_at defaults to now).
+    history: {symbol: DataFrame indexed by time with price/state/position/action}.
+    """
+    conn = connect(path)
+    try:
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO signals VALUES "
+                "(:symbol, :as_of, :price, :state, :position, :action, :last_action, :last_action_at, :computed_at)",
+                [{'computed_at': time.time(), **row} for row in latest])
+            for symbol, df in (history or {}).items():
+                conn.execute("DELETE FROM signal_history WHERE symbol = ?", (symbol,))
+                conn.executemany(
+                    "INSERT INTO signal_history VALUES (?, ?, ?, ?, ?, ?)",
+                    [(symbol, str(ts), float(row.price), int(row.state), int(row.position), row.action)
+                     for ts, row in zip(df.index, df.itertuples(index=False))])
+    finally:
+        conn.close()
+
+# ====================
+# Read (dashboard)
+# ====================
+def _query(sql, params=(), path=SIGNAL_DB):
+    if not os.path.exists(path):
+        return pd.DataFrame()
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True, timeout=10)
+    try:
+        return pd.read_sql_query(sql, conn, params=params)
+    finally:
+        conn.close()
+
+def read_latest(symbol=None, path=SIGNAL_DB):
+    """Latest signal for `symbol` as a dict (None if not produced yet), or all symbols as a DataFrame"""
+    if symbol is None:
+        return _query("SELECT * FROM signals ORDER BY symbol", path=path)
+    df = _query("SELECT * FROM signals WHERE symbol = ?", (symbol,), path=path)
+    if df.empty:
+        return None
+    row = df.iloc[0].to_dict()
+    row['regime'] = REGIME_NAMES.get(row['state'], 'unknown')
+    row['age'] = time.time() - row['computed_at']
+    return row
+
+def read_history(symbol, path=SIGNAL_DB):
+    """Stored signal history for `symbol`, indexed by time"""
+    df = _query("SELECT time, price, state, position, action FROM signal_history "
+                "WHERE symbol = ? ORDER BY time", (symbol,), path=path)
+    if not df.empty:
+        df['time'] = pd.to_datetime(df['time'])
+        df = df.set_index('time')
+    return df
@@ -0,0 +1,93 @@
+# Vectorized signal engine
+# Turns mapped HMM states (0=low, 1=medium, 2=high volatility) into positions
+# and buy/sell/hold actions for many assets at once, without a per-row loop.
+import numpy as np
+
+# Action codes
+HOLD = 0
+BUY = 1
+SELL = 2
+
+ACTION_NAMES = np.array(['hold', 'buy', 'sell'], dtype=object)
+
+# ====================
+# Position State Machine
+# ====================
+def compute_signals(states):
+    """Compute positions and action codes from a (time,) or (time, asset) array of mapped states.
+
+    Rules per asset (same as the original loop):
+    - entry (position 1, buy) on a transition into state 0
+    - exit (position 0, sell) on every bar in state 2
+    - otherwise carry the previous position forward (hold)
+    The first bar is always flat / hold.
+    """
+    states = np.asarray(states, dtype=float)
+    squeeze = states.ndim == 1
+    if squeeze:
+        states = states[:, None]
+    n_bars, n_assets = states.shape
+
+    actions = np.zeros((n_bars, n_assets), dtype=np.int8)
+    positions = np.zeros((n_bars, n_assets), dtype=np.int8)
+    if n_bars < 2:
+        return (positions[:, 0], actions[:, 0]) if squeeze else (positions, actions)
+
+    # NaN states compare False to everything, so they fall through to hold like the loop did
+    current, previous = states[1:], states[:-1]
+    entry = (current == 0) & (previous != 0)
+    exit_ = current == 2
+    actions[1:][entry] = BUY
+    actions[1:][exit_] = SELL
+
+    # Carry forward: each bar takes the position set by the last buy/sell at or before it
+    rows = np.arange(n_bars)[:, None]
+    last_event = np.where(actions != HOLD, rows, 0)
+    np.maximum.accumulate(last_event, axis=0, out=last_event)
+    event_position = (actions == BUY).astype(np.int8)
+    positions = np.take_along_axis(event_position, last_event, axis=0)
+
+    if squeeze:
+        return positions[:, 0], actions[:, 0]
+    return positions, actions
+
+# ====================
+# Action Labels
+# ====================
+def _combo_label(codes, names):
+    # Group assets by action in order of first appearance, e.g. 'sell BTC & buy ETH'
+    groups = {}
+    for name, code in zip(names, codes):
+        if code != HOLD:
+            groups.setdefault(int(code), []).append(name)
+    if not groups:
+        return 'hold'
+
+    parts = []
+    for code, members in groups.items():
+        if len(members) == len(names) and len(names) > 1:
+            target = 'both' if len(names) == 2 else 'all'
+        else:
+            target = ', '.join(members)
+        parts.append(f"{ACTION_NAMES[code]} {target}")
+    return ' & '.join(parts)
+
+def combine_actions(actions, names):
+    """Build one label per bar ('hold', 'buy BTC', 'sell both', ...) from a (time, asset) action array.
+
+    Only the distinct action combinations are labelled in Python; every bar then
+    picks its label by index, so cost does not depend on the number of bars.
+    """
+    actions = np.asarray(actions, dtype=np.int8)
+    if actions.ndim == 1:
+        actions = actions[:, None]
+    if len(actions) == 0:
+        return np.array([], dtype=object)
+
+    # Encode each row as a base-3 integer so the distinct combinations come from a 1-D unique
+    powers = 3 ** np.arange(actions.shape[1], dtype=np.int64)
+    keys = actions.astype(np.int64) @ powers
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    combos = (unique_keys[:, None] // powers) % 3
+    labels = np.array([_combo_label(combo, names) for combo in combos], dtype=object)
+    return labels[inverse.reshape(-1)]
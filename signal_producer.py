@@ -0,0 +1,81 @@
+# Background HMM signal producer
+# Periodically loads the closed daily bars of every dashboard symbol, fits (or reuses from the
+# model registry) one HMM per symbol, and writes the latest regime, position and action to the
+# shared signal cache read by app.py.
+# Run with: python signal_producer.py            (refresh every 5 minutes)
+#           python signal_producer.py --once     (single refresh)
+import sys
+import time
+import pandas as pd
+from cybo_api import CRYPTO_SYMBOLS
+from signal_engine import compute_signals, ACTION_NAMES
+from signal_cache import write_signals, SIGNAL_DB
+import profiling
+
+REFRESH_INTERVAL = 300  # seconds
+HISTORY_BARS = 365
+
+def symbol_signals(prices, state_df):
+    """(latest row dict, history DataFrame) for one symbol's mapped states"""
+    states = state_df['mapped_state']
+    positions, actions = compute_signals(states.to_numpy())
+    history = pd.DataFrame({
+        'price': prices.reindex(states.index).to_numpy(),
+        'state': states.to_numpy(),
+        'position': positions,
+        'action': ACTION_NAMES[actions]
+    }, index=states.index)
+
+    trades = history[history['action'] != 'hold']
+    latest = {
+        'as_of': str(history.index[-1]),
+        'price': float(history['price'].iloc[-1]),
+        'state': int(history['state'].iloc[-1]),
+        'position': int(history['position'].iloc[-1]),
+        'action': history['action'].iloc[-1],
+        'last_action': trades['action'].iloc[-1] if len(trades) else 'hold',
+        'last_action_at': str(trades.index[-1]) if len(trades) else None
+    }
+    return latest, history.tail(HISTORY_BARS)
+
+def produce_once(symbols=None, days=365*3, n_components=3, window=30, path=SIGNAL_DB, prices=None):
+    """Compute and store signals for `symbols` (default: every dashboard symbol); returns the latest rows"""
+    from pipeline import Pipeline  # Pulls in the HMM stack, only needed by the producer
+
+    symbols = list(symbols or CRYPTO_SYMBOLS)
+    # Closed daily bars only: ending the range at today's 00:00 UTC leaves out the forming bar,
+    # so the registry key and features hash stay the same all day and every refresh after the
+    # first reuses the fitted models instead of refitting each symbol
+    end_date = pd.Timestamp.now('UTC').floor('D').tz_localize(None)
+    with profiling.run('signal_producer'):  # Recorded only with HMM_PROFILE=1
+        pipeline = Pipeline(symbols, start_date=end_date - pd.Timedelta(days=days), end_date=end_date,
+                            n_components=n_components, window=window, prices=prices)
+        available = [symbol for symbol in symbols if symbol in pipeline.prices.columns
+                     and pipeline.prices[symbol].count() > window + 2]
+        pipeline.tickers = available  # Skip symbols with no (or too little) price history
+
+        latest, history = [], {}
+        for symbol in available:
+            row, history[symbol] = symbol_signals(pipeline.prices[symbol], pipeline.state_dfs[symbol])
+            latest.append({'symbol': symbol, **row})
+        with profiling.stage('write_signals'):
+            write_signals(latest, history, path=path)
+    return latest
+
+def run_forever(symbols=None, interval=REFRESH_INTERVAL, **kwargs):
+    while True:
+        start = time.time()
+        try:
+            latest = produce_once(symbols, **kwargs)
+            print(f"[{time.strftime('%H:%M:%S')}] Wrote signals for {len(latest)} symbols "
+                  f"in {time.time() - start:.1f}s")
+        except Exception as e:
+            print(f"Error producing signals: {str(e)}")
+        time.sleep(max(0, interval - (time.time() - start)))
+
+
+if __name__ == "__main__":
+    if '--once' in sys.argv:
+        produce_once()
+    else:
+        run_forever()
@@ -0,0 +1,271 @@
+# Bar simulator (target-weight rebalancer)
+# Replays OHLCV bars (e.g. the 1h bars in the local store) for several assets. This is not a
+# per-bar event loop: there is no strategy callback on every bar. The strategy's target
+# weights are precomputed for all bars (decided at each bar's close); every change becomes
+# an order that a pluggable fill model executes on the next bar, and an order that finds
+# no price there is re-queued on the bar after. Python code only runs on bars with orders;
+# between them holdings are constant, so marking to market is one vectorized pass over all
+# bars. Throughput (bars per second) therefore depends on how often the targets change.
+import numpy as np
+import pandas as pd
+from data_store import OHLCV_COLUMNS, read_bars
+from portfolio import ffill
+
+# ====================
+# Order & Fill Records
+# ====================
+class Order:
+    """Order created at the close of bar `bar` for `quantity` units of asset `asset`"""
+    __slots__ = ('bar', 'asset', 'quantity')
+
+    def __init__(self, bar, asset, quantity):
+        self.bar = bar
+        self.asset = asset
+        self.quantity = quantity
+
+    def __repr__(self):
+        return f"Order(bar={self.bar}, asset={self.asset}, quantity={self.quantity:.6g})"
+
+class Fill:
+    """Execution of an order on bar `bar` at `price`, paying `fee` in cash"""
+    __slots__ = ('bar', 'asset', 'quantity', 'price', 'fee')
+
+    def __init__(self, bar, asset, quantity, price, fee):
+        self.bar = bar
+        self.asset = asset
+        self.quantity = quantity
+        self.price = price
+        self.fee = fee
+
+    def __repr__(self):
+        return (f"Fill(bar={self.bar}, asset={self.asset}, quantity={self.quantity:.6g}, "
+                f"price={self.price:.6g}, fee={self.fee:.6g})")
+
+# ====================
+# Fill Models
+# ====================
+# A fill model is called once per order batch with the bar arrays, the execution bar, the asset
+# columns and the signed order quantities, and returns one fill price per order.
+class NextOpen:
+    """Fill at the open of the next bar"""
+
+    def __call__(self, bars, bar, assets, quantities):
+        return bars['Open'][bar, assets]
+
+class VWAP:
+    """Fill at the next bar's typical price (High + Low + Close) / 3, a VWAP proxy for OHLCV bars"""
+
+    def __init__(self):
+        self._close = self._typical = None
+
+    def typical_price(self, bars):
+        # Typical price for every bar, computed once per bar array so each fill is one lookup
+        if bars['Close'] is not self._close:
+            self._typical = (bars['High'] + bars['Low'] + bars['Close']) / 3
+            self._close = bars['Close']
+        return self._typical
+
+    def __call__(self, bars, bar, assets, quantities):
+        return self.typical_price(bars)[bar, assets]
+
+class VolumeSlippage:
+    """Wraps another fill model and moves the price against the order
+
+    slippage = impact * sqrt(participation), capped at max_slippage, where participation
+    is the order's share of the bar's Volume. `volume_in_quote=True` treats Volume as
+    quote-currency turnover (Yahoo reports crypto volume in USD), else as asset units.
+    """
+
+    def __init__(self, base=None, impact=0.1, max_slippage=0.05, volume_in_quote=True):
+        self.base = base or NextOpen()
+        self.impact = impact
+        self.max_slippage = max_slippage
+        self.volume_in_quote = volume_in_quote
+        self._volume = self._inverse_volume = None
+
+    def inverse_volume(self, volume):
+        # 1 / Volume for every bar (inf where there was no volume), computed once per bar array
+        # so each fill is a multiply instead of a guarded divide
+        if volume is not self._volume:
+            with np.errstate(divide='ignore'):
+                self._inverse_volume = np.where(volume > 0, 1 / volume, np.inf)
+            self._volume = volume
+        return self._inverse_volume
+
+    def __call__(self, bars, bar, assets, quantities):
+        price = self.base(bars, bar, assets, quantities)
+        size = np.abs(quantities) * price if self.volume_in_quote else np.abs(quantities)
+        participation = size * self.inverse_volume(bars['Volume'])[bar, assets]
+        slippage = np.minimum(self.impact * np.sqrt(participation), self.max_slippage)
+        return price * (1 + np.sign(quantities) * slippage)
+
+FILL_MODELS = {'next_open': NextOpen, 'vwap': VWAP, 'volume_slippage': VolumeSlippage}
+
+# ====================
+# Simulator
+# ====================
+def load_bar_arrays(symbols, interval='1h', start=None, end=None):
+    """(index, {column: (time, asset) array}) from the local store
+
+    Only timestamps present for every symbol are kept.
+    """
+    frames = [read_bars(symbol, interval, start, end) for symbol in symbols]
+    index = frames[0].index
+    for frame in frames[1:]:
+        index = index.intersection(frame.index)
+    bars = {column: np.column_stack([frame[column].reindex(index).to_numpy(dtype=float) for frame in frames])
+            for column in OHLCV_COLUMNS}
+    return index, bars
+
+class BarSimulator:
+    """Replays (time, asset) OHLCV arrays and executes target-weight changes as orders
+
+    bars: {'Open', 'High', 'Low', 'Close', 'Volume'} -> (time, asset) float arrays.
+    fill_model: a fill model instance or a FILL_MODELS name.
+    fee: fraction of traded notional paid per fill.
+    """
+
+    def __init__(self, bars, index=None, symbols=None, fill_model='next_open', fee=0.001,
+                 initial_cash=10000.0):
+        self.bars = bars
+        self.n_bars, self.n_assets = bars['Close'].shape
+        self.index = index if index is not None else pd.RangeIndex(self.n_bars)
+        self.symbols = list(symbols) if symbols is not None else list(range(self.n_assets))
+        self.fill_model = FILL_MODELS[fill_model]() if isinstance(fill_model, str) else fill_model
+        self.fee = fee
+        self.initial_cash = initial_cash
+
+    @classmethod
+    def from_store(cls, symbols, interval='1h', start=None, end=None, **kwargs):
+        index, bars = load_bar_arrays(symbols, interval, start, end)
+        return cls(bars, index=index, symbols=symbols, **kwargs)
+
+    def run(self, targets):
+        """Simulate a (time, asset) array of target weights (fractions of equity)
+
+        targets[t] is decided at the close of bar t; assets whose target changed get an
+        order sized against the last known close and filled on bar t + 1 (a change made
+        before an asset's first price waits until it has one). An order whose fill bar has
+        no price is re-queued on the following bar until it fills, or until a new target
+        for its asset replaces it. Returns a dict with `equity` and `returns` Series,
+        per-bar `units` held, the `orders` / `fills` and the `open_orders` still unfilled
+        at the end (NaN quantity: never sized).
+        """
+        targets = np.asarray(targets, dtype=float).reshape(self.n_bars, -1)
+        close = self.bars['Close']
+
+        # Rebalance bars: the target changed and there is a next bar to fill on
+        changed = np.diff(targets, axis=0, prepend=np.zeros((1, self.n_assets))) != 0
+        rebalances = np.flatnonzero(changed[:-1].any(axis=1))
+        rows, changed_assets = np.nonzero(changed[rebalances])
+        bounds = np.searchsorted(rows, np.arange(len(rebalances) + 1)).tolist()
+
+        # A missing close keeps the last one, for both order sizing and marking to market
+        # (marked as 0 before an asset's first price)
+        known = ffill(close)
+        marked = np.nan_to_num(known)
+        # Units per unit of equity for every target, sized against the last known close
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sizing = targets[rebalances] / known[rebalances]
+        cash = self.initial_cash
+        units = np.zeros(self.n_assets)
+        orders, fills = [], []
+        fill_bars, cash_after, units_after = [], [], []
+        # asset -> Order that lapsed for lack of a price, or an unsized (NaN quantity) Order for a
+        # target change made before the asset's first price; both are retried on the next bar
+        pending = {}
+        next_rebalance, bar = 0, -1
+        while True:
+            if pending and bar + 1 < self.n_bars - 1 and (next_rebalance == len(rebalances)
+                                                          or rebalances[next_rebalance] > bar + 1):
+                bar += 1
+                assets = changed_assets[:0]
+            elif next_rebalance < len(rebalances):
+                bar = int(rebalances[next_rebalance])
+                assets = changed_assets[bounds[next_rebalance]:bounds[next_rebalance + 1]]
+                equity = cash + np.dot(units, marked[bar])
+                quantities = sizing[next_rebalance, assets] * equity - units[assets]
+                next_rebalance += 1
+            else:
+                break
+
+            new_orders = []
+            if len(assets):
+                live = np.isfinite(quantities) & (quantities != 0)
+                if not live.all():
+                    for asset in assets[~np.isfinite(quantities)].tolist():
+                        pending[asset] = Order(bar, asset, np.nan)
+                    assets, quantities = assets[live], quantities[live]
+                new_orders = [Order(bar, asset, quantity)
+                              for asset, quantity in zip(assets.tolist(), quantities.tolist())]
+                orders.extend(new_orders)
+            if pending:
+                # A new order for an asset replaces its lapsed one
+                for order in new_orders:
+                    pending.pop(order.asset, None)
+                equity = cash + np.dot(units, marked[bar])
+                retries, lapsed = {}, []
+                for asset, order in pending.items():
+                    if np.isnan(order.quantity):
+                        # Size the postponed target change against this bar's close
+                        quantity = targets[bar, asset] * equity / known[bar, asset] - units[asset]
+                        if not np.isfinite(quantity):
+                            retries[asset] = order
+                            continue
+                        if quantity == 0:
+                            continue
+                        order = Order(bar, asset, float(quantity))
+                        orders.append(order)
+                    lapsed.append(order)
+                new_orders = lapsed + new_orders
+                pending = retries
+                assets = np.array([order.asset for order in new_orders], dtype=int)
+                quantities = np.array([order.quantity for order in new_orders])
+            if not new_orders:
+                continue
+
+            prices = self.fill_model(self.bars, bar + 1, assets, quantities)
+            filled = np.isfinite(prices)
+            if not filled.all():
+                # No price on the fill bar: retry the order on the next bar
+                for order, ok in zip(new_orders, filled):
+                    if not ok:
+                        pending[order.asset] = order
+                assets, quantities, prices = assets[filled], quantities[filled], prices[filled]
+                if not len(assets):
+                    continue
+            for asset, quantity, price in zip(assets.tolist(), quantities.tolist(), prices.tolist()):
+                fee = abs(quantity * price) * self.fee
+                fills.append(Fill(bar + 1, asset, quantity, price, fee))
+                cash -= quantity * price + fee
+            units[assets] += quantities
+
+            fill_bars.append(bar + 1)
+            cash_after.append(cash)
+            units_after.append(units.copy())
+
+        # Holdings are constant between fills: mark every bar to market in one pass
+        segment = np.searchsorted(np.asarray(fill_bars, dtype=int), np.arange(self.n_bars), side='right') - 1
+        cash_path = np.concatenate([[self.initial_cash], cash_after])[segment + 1]
+        units_after = np.reshape(units_after, (-1, self.n_assets))
+        units_path = np.vstack([np.zeros((1, self.n_assets)), units_after])[segment + 1]
+        equity = cash_path + (units_path * marked).sum(axis=1)
+
+        equity = pd.Series(equity, index=self.index, name='equity')
+        return {
+            'equity': equity,
+            'returns': equity.pct_change().fillna(0),
+            'units': units_path,
+            'orders': orders,
+            'fills': fills,
+            'open_orders': list(pending.values())
+        }
+
+def fills_frame(fills, index=None, symbols=None):
+    """DataFrame view of Fill records, with timestamps and symbols when given"""
+    df = pd.DataFrame({name: [getattr(fill, name) for fill in fills] for name in Fill.__slots__})
+    if index is not None and len(df):
+        df['time'] = index[df['bar'].to_numpy()]
+    if symbols is not None and len(df):
+        df['symbol'] = [symbols[asset] for asset in df['asset']]
+    return df
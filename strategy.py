@@ -1,41 +1,53 @@
-import yfinance as yf
-from sklearn.preprocessing import StandardScaler  # Add this at the top
-import numpy as np
+import os
 import pandas as pd
-from hmmlearn import hmm
-import matplotlib.pyplot as plt
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, timedelta
+from data_store import load_many
+from features import feature_arrays
+from signal_engine import compute_signals, combine_actions, ACTION_NAMES
+from profiling import timed, stage, count
 
-# Fetch data from Yahoo Finance
+# Fetch daily closes, served from the local data store and topped up from Yahoo Finance
+@timed()
 def fetch_crypto_data(tickers, start_date, end_date):
-    data = yf.download(tickers, start=start_date, end=end_date, interval='1d')
-    return data['Close']
+    if isinstance(tickers, str):
+        tickers = [tickers]
+    closes = {}
+    for ticker, bars in load_many(tickers, '1d', start_date, end_date).items():
+        closes[ticker] = bars['Close'] if not bars.empty else pd.Series(dtype=float)
+        count('bars_loaded', len(bars))
+    return pd.DataFrame(closes)
 
-# Example usage
-end_date = datetime.now()
-start_date = end_date - timedelta(days=365*3)  # 3 years of data
-btc_eth_data = fetch_crypto_data(['BTC-USD', 'ETH-USD'], start_date, end_date)
-
-def create_features(data):
+@timed()
+def create_features(data, window=30, exogenous=None):
     # Calculate daily returns
     returns = data.pct_change().dropna()
     
-    # Calculate rolling volatility (30-day)
-    volatility = returns.rolling(window=30).std().shift(1)  # Add shift(1)
-    mean_return = returns.rolling(window=30).mean().shift(1)
+    # Rolling volatility and mean return (30-day by default), shifted by one bar
+    # so each row only sees past returns; computed by the vectorized NumPy kernel
+    volatility, mean_return = feature_arrays(returns.to_numpy(), window)
     
     # Combine features
-    features = pd.concat([
-        returns.rename('return'),
-        volatility.rename('volatility'),
-        mean_return.rename('mean_return')
-    ], axis=1).dropna()
+    features = pd.DataFrame({
+        'return': returns.to_numpy(),
+        'volatility': volatility,
+        'mean_return': mean_return
+    }, index=returns.index)
+    
+    # Extra aligned columns (e.g. on-chain flows from feature_join.onchain_features)
+    if exogenous is not None:
+        for name in exogenous.columns:
+            features[name] = exogenous[name].reindex(features.index)
+    features = features.dropna()
+    count('bars_processed', len(returns))
     
     return features
 
-btc_features = create_features(btc_eth_data['BTC-USD'])
-eth_features = create_features(btc_eth_data['ETH-USD'])
-def fit_hmm(features, n_components=3):
+@timed()
+def fit_hmm(features, n_components=3, n_iter=1000, random_state=42):
+    from sklearn.preprocessing import StandardScaler
+    from hmmlearn import hmm
+    
     # Standardize features
     scaler = StandardScaler()
     scaled_features = scaler.fit_transform(features)
@@ -44,19 +56,44 @@ def fit_hmm(features, n_components=3):
     model = hmm.GaussianHMM(
         n_components=n_components,
         covariance_type="diag",
-        n_iter=1000,
-        random_state=42
+        n_iter=n_iter,
+        random_state=random_state
     )
     model.fit(scaled_features)
     
     # Predict hidden states
     hidden_states = model.predict(scaled_features)
+    _count_fit(model)
     
     return model, hidden_states, scaler
 
-# Fit models for BTC and ETH
-btc_model, btc_states, btc_scaler = fit_hmm(btc_features)
-eth_model, eth_states, eth_scaler = fit_hmm(eth_features)
+def _count_fit(model):
+    # EM iterations and convergence of one fit, for the profiling counters
+    count('hmm_fits')
+    count('em_iterations', model.monitor_.iter)
+    count('em_converged', int(model.monitor_.converged))
+
+def fit_hmm_many(features_by_symbol, n_components=3, n_jobs=None, n_iter=1000, random_state=42):
+    """Fit one HMM per symbol, in parallel worker processes
+
+    Returns {symbol: (model, hidden_states, scaler)}. Every symbol is fitted with the same
+    `random_state`, so results do not depend on the worker count or completion order.
+    n_jobs=None uses every core, n_jobs=1 fits in this process.
+    """
+    symbols = list(features_by_symbol)
+    n_jobs = min(n_jobs or os.cpu_count() or 1, len(symbols)) if symbols else 1
+    args = [(features_by_symbol[symbol], n_components, n_iter, random_state) for symbol in symbols]
+    
+    if n_jobs == 1:
+        return {symbol: fit_hmm(*arg) for symbol, arg in zip(symbols, args)}
+    
+    with stage('fit_hmm_many'), ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        futures = {symbol: pool.submit(fit_hmm, *arg) for symbol, arg in zip(symbols, args)}
+        results = {symbol: future.result() for symbol, future in futures.items()}
+    # Worker processes do not share this run, count their fits here
+    for model, _, _ in results.values():
+        _count_fit(model)
+    return results
 
 def interpret_states(features, states, model):
     # Create DataFrame with states
@@ -66,18 +103,18 @@ def interpret_states(features, states, model):
     # Calculate mean metrics per state
     state_means = state_df.groupby('state').mean()
     
-    # Order states by volatility (assuming 3 states: low, medium, high volatility)
+    # Order states by volatility (low, medium, high volatility)
     ordered_states = state_means['volatility'].sort_values().index
     
-    # Create state mapping (0=low volatility, 1=medium, 2=high)
-    state_mapping = {ordered_states[0]: 0, ordered_states[1]: 1, ordered_states[2]: 2}
+    # Create state mapping (0=low volatility, 1=medium, 2=high); with more than 3 states
+    # every state between the lowest and highest volatility one maps to 1
+    state_mapping = {state: 1 for state in ordered_states}
+    state_mapping[ordered_states[0]] = 0
+    state_mapping[ordered_states[-1]] = 2
     state_df['mapped_state'] = state_df['state'].map(state_mapping)
     
     return state_df
 
-btc_state_df = interpret_states(btc_features, btc_states, btc_model)
-eth_state_df = interpret_states(eth_features, eth_states, eth_model)
-
 def generate_signals(btc_states, eth_states, btc_prices, eth_prices):
     signals = pd.DataFrame(index=btc_states.index)
     signals['btc_state'] = btc_states
@@ -85,58 +122,39 @@ def generate_signals(btc_states, eth_states, btc_prices, eth_prices):
     signals['btc_price'] = btc_prices
     signals['eth_price'] = eth_prices
     
-    # Initialize positions and actions
-    signals['btc_position'] = 0
-    signals['eth_position'] = 0
-    signals['btc_action'] = 'hold'
-    signals['eth_action'] = 'hold'
-    
-    for i in range(1, len(signals)):
-        # BTC Rules
-        prev_btc_state = signals['btc_state'].iloc[i-1]
-        current_btc_state = signals['btc_state'].iloc[i]
-        
-        if current_btc_state == 0 and prev_btc_state != 0:  # Transition to low volatility
-            signals.at[signals.index[i], 'btc_position'] = 1
-            signals.at[signals.index[i], 'btc_action'] = 'buy'
-        elif current_btc_state == 2:  # High volatility
-            signals.at[signals.index[i], 'btc_position'] = 0
-            signals.at[signals.index[i], 'btc_action'] = 'sell'
-        else:  # Maintain position
-            signals.at[signals.index[i], 'btc_position'] = signals['btc_position'].iloc[i-1]
-            signals.at[signals.index[i], 'btc_action'] = 'hold'
-        
-        # ETH Rules
-        prev_eth_state = signals['eth_state'].iloc[i-1]
-        current_eth_state = signals['eth_state'].iloc[i]
-        
-        if current_eth_state == 0 and prev_eth_state != 0:  # Transition to low volatility
-            signals.at[signals.index[i], 'eth_position'] = 1
-            signals.at[signals.index[i], 'eth_action'] = 'buy'
-        elif current_eth_state == 2:  # High volatility
-            signals.at[signals.index[i], 'eth_position'] = 0
-            signals.at[signals.index[i], 'eth_action'] = 'sell'
-        else:  # Maintain position
-            signals.at[signals.index[i], 'eth_position'] = signals['eth_position'].iloc[i-1]
-            signals.at[signals.index[i], 'eth_action'] = 'hold'
-    
-    # Combine actions into a single column
-    signals['action'] = signals.apply(
-        lambda x: ' | '.join([f"BTC:{x['btc_action']}", f"ETH:{x['eth_action']}"]), 
-        axis=1
-    )
+    # Positions and actions for both assets in one vectorized pass
+    positions, actions = compute_signals(signals[['btc_state', 'eth_state']].to_numpy())
+    signals['btc_position'] = positions[:, 0].astype(int)
+    signals['eth_position'] = positions[:, 1].astype(int)
+    signals['btc_action'] = ACTION_NAMES[actions[:, 0]]
+    signals['eth_action'] = ACTION_NAMES[actions[:, 1]]
     
-    # Simplify action display
-    signals['action'] = signals['action'].replace({
-        'BTC:hold | ETH:hold': 'hold',
-        'BTC:buy | ETH:hold': 'buy BTC',
-        'BTC:sell | ETH:hold': 'sell BTC',
-        'BTC:hold | ETH:buy': 'buy ETH',
-        'BTC:hold | ETH:sell': 'sell ETH',
-        'BTC:buy | ETH:buy': 'buy both',
-        'BTC:sell | ETH:sell': 'sell both',
-        'BTC:buy | ETH:sell': 'buy BTC & sell ETH',
-        'BTC:sell | ETH:buy': 'sell BTC & buy ETH'
-    })
-    
-    return signals
\ No newline at end of file
+    # Combine actions into a single column ('hold', 'buy BTC', 'sell both', ...)
+    signals['action'] = combine_actions(actions, ['BTC', 'ETH'])
+    
+    return signals
+
+
+# Example usage (only when run directly, so importing this module stays cheap)
+if __name__ == "__main__":
+    end_date = datetime.now()
+    start_date = end_date - timedelta(days=365*3)  # 3 years of data
+    btc_eth_data = fetch_crypto_data(['BTC-USD', 'ETH-USD'], start_date, end_date)
+    
+    btc_features = create_features(btc_eth_data['BTC-USD'])
+    eth_features = create_features(btc_eth_data['ETH-USD'])
+    
+    # Fit models for BTC and ETH
+    btc_model, btc_states, btc_scaler = fit_hmm(btc_features)
+    eth_model, eth_states, eth_scaler = fit_hmm(eth_features)
+    
+    btc_state_df = interpret_states(btc_features, btc_states, btc_model)
+    eth_state_df = interpret_states(eth_features, eth_states, eth_model)
+    
+    signals = generate_signals(
+        btc_state_df['mapped_state'],
+        eth_state_df['mapped_state'],
+        btc_eth_data['BTC-USD'],
+        btc_eth_data['ETH-USD']
+    )
+    print(signals[['btc_state', 'eth_state', 'btc_position', 'eth_position', 'action']].tail(10))
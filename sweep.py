@@ -0,0 +1,137 @@
+# Parameter-sweep backtesting
+# Runs a grid of (n_components, window, fee) configurations on the BTC/ETH pair. Work is
+# shared between cells: features are built once per (symbol, window), HMMs are fitted once
+# per (symbol, window, n_components) in parallel processes, and signals once per
+# (window, n_components); only the cheap backtest runs per fee. Each cell's metrics are
+# cached on disk under data/sweeps/, keyed by a hash of the configuration and input data.
+import os
+import json
+import hashlib
+import itertools
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from data_store import DATA_DIR
+from model_registry import data_hash
+from backtest import (
+    create_features,
+    fit_hmm,
+    interpret_states,
+    generate_signals,
+    run_backtest
+)
+from metrics import performance_report
+
+SWEEP_DIR = os.path.join(DATA_DIR, 'sweeps')
+
+DEFAULTS = {'n_components': 3, 'window': 30, 'fee': 0.001}
+
+# Bump when backtest results change for the same inputs, so old cached cells are not reused
+CACHE_VERSION = 1
+
+def expand_grid(grid):
+    """List of cells (dicts) for every combination in `grid`, with DEFAULTS filled in
+
+    Only the DEFAULTS parameters can be swept: any other key would end up in the cells
+    and their cache keys without changing the backtest, so it raises a ValueError.
+    """
+    unknown = sorted(set(grid) - set(DEFAULTS))
+    if unknown:
+        raise ValueError(f"Cannot sweep {', '.join(unknown)}: supported parameters are {', '.join(DEFAULTS)}")
+    empty = sorted(key for key, values in grid.items() if not len(values))
+    if empty:
+        raise ValueError(f"No values to sweep for {', '.join(empty)}")
+    grid = {**{key: [value] for key, value in DEFAULTS.items()}, **grid}
+    keys = list(grid)
+    return [dict(zip(keys, values)) for values in itertools.product(*(grid[key] for key in keys))]
+
+def config_hash(cell, prices_hash, n_iter):
+    payload = json.dumps({**cell, 'data': prices_hash, 'n_iter': n_iter, 'version': CACHE_VERSION},
+                         sort_keys=True)
+    return hashlib.sha1(payload.encode()).hexdigest()[:16]
+
+# ====================
+# Metrics Cache
+# ====================
+def _cache_path(key):
+    return os.path.join(SWEEP_DIR, f"{key}.json")
+
+def load_cell(key):
+    path = _cache_path(key)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_cell(key, metrics):
+    os.makedirs(SWEEP_DIR, exist_ok=True)
+    tmp_path = f"{_cache_path(key)}.{os.getpid()}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(metrics, f)
+    os.replace(tmp_path, _cache_path(key))
+
+# ====================
+# Sweep
+# ====================
+def _fit_all(jobs, n_jobs, n_iter):
+    # jobs: {(symbol, window, n_components): features} -> {key: hidden_states}
+    if n_jobs == 1 or len(jobs) <= 1:
+        return {key: fit_hmm(features, key[2], n_iter)[1] for key, features in jobs.items()}
+    with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+        futures = {key: pool.submit(fit_hmm, features, key[2], n_iter) for key, features in jobs.items()}
+        return {key: future.result()[1] for key, future in futures.items()}
+
+def run_sweep(prices, grid, n_jobs=None, n_iter=1000, use_cache=True):
+    """Backtest every cell of `grid` on a two-column `prices` frame (BTC/ETH slots)
+
+    The strategy trades a pair, so `prices` must hold exactly two columns (select them
+    first, e.g. prices[['BTC-USD', 'ETH-USD']]). `grid` maps parameter names (n_components,
+    window, fee) to lists of values; other names raise a ValueError (see expand_grid).
+    Returns a tidy DataFrame: one row per cell with its parameters, the
+    metrics.performance_report metrics, the config hash and whether it came from the cache.
+    """
+    if prices.shape[1] != 2:
+        raise ValueError(f"run_sweep backtests a pair: expected 2 price columns, got {prices.shape[1]}")
+    btc, eth = list(prices.columns)
+    prices_hash = data_hash(prices[[btc, eth]])
+    cells = expand_grid(grid)
+
+    rows = []
+    pending = []
+    for cell in cells:
+        key = config_hash(cell, prices_hash, n_iter)
+        metrics = load_cell(key) if use_cache else None
+        if metrics is None:
+            pending.append((cell, key))
+        else:
+            rows.append({**cell, **metrics, 'config_hash': key, 'cached': True})
+
+    if pending:
+        # Shared features and fits for everything the pending cells need
+        windows = {cell['window'] for cell, _ in pending}
+        features = {(symbol, window): create_features(prices[symbol], window=window)
+                    for symbol in (btc, eth) for window in windows}
+        fit_jobs = {(symbol, cell['window'], cell['n_components']): features[(symbol, cell['window'])]
+                    for cell, _ in pending for symbol in (btc, eth)}
+        states = _fit_all(fit_jobs, n_jobs or os.cpu_count() or 1, n_iter)
+
+        signals_by_model = {}
+        strategy_returns = {}
+        for cell, key in pending:
+            model_key = (cell['window'], cell['n_components'])
+            if model_key not in signals_by_model:
+                state_dfs = [interpret_states(features[(symbol, cell['window'])],
+                                              states[(symbol, *model_key)]) for symbol in (btc, eth)]
+                signals_by_model[model_key] = generate_signals(
+                    state_dfs[0]['mapped_state'], state_dfs[1]['mapped_state'], prices[btc], prices[eth])
+            returns = run_backtest(signals_by_model[model_key].copy(), fee=cell['fee'])['strategy_return']
+            strategy_returns.setdefault(cell['window'], {})[key] = returns
+
+        # One vectorized report per window: cells with other windows have other bar ranges, and
+        # padding them onto one index would change n_periods (and so CAGR / Calmar)
+        reports = {window: performance_report(pd.DataFrame(series)) for window, series in strategy_returns.items()}
+        for cell, key in pending:
+            metrics = {name: float(value) for name, value in reports[cell['window']].loc[key].items()}
+            save_cell(key, metrics)
+            rows.append({**cell, **metrics, 'config_hash': key, 'cached': False})
+
+    return pd.DataFrame(rows).sort_values(list(DEFAULTS)).reset_index(drop=True)
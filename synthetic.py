@@ -0,0 +1,140 @@
+# Synthetic market data
+# Deterministic (seeded) OHLCV bars and Cybotrade-style on-chain flows driven by sticky
+# volatility regimes, so benchmarks and HMM fits run offline and reproduce exactly.
+# The regime path is returned alongside the bars: an HMM fitted on the features should
+# recover it, and flows rise ahead of high-volatility regimes so they carry signal.
+# FakeDatasource serves such records through the Cybotrade Datasource query interface.
+import asyncio
+import zlib
+import numpy as np
+import pandas as pd
+
+REGIME_VOLS = (0.002, 0.005, 0.012)   # per-bar return volatility in regimes 0 / 1 / 2
+START = '2015-01-01'
+MAX_HOURLY_BARS = 2_000_000           # past this hourly stamps would overflow pandas' Timestamp range
+
+# ====================
+# Regimes and Bars
+# ====================
+def regime_states(n_bars, n_assets, seed=42, stay=0.98):
+    """Sticky 3-state regime paths, a (time x asset) int array with values 0 / 1 / 2
+
+    Each bar keeps its regime with probability `stay`, otherwise jumps to another one.
+    """
+    rng = np.random.default_rng(seed)
+    switch = rng.random((n_bars, n_assets)) > stay
+    jumps = rng.integers(1, 3, size=(n_bars, n_assets))
+    return np.cumsum(np.where(switch, jumps, 0), axis=0) % 3
+
+def ohlcv_arrays(states, seed=42, vols=REGIME_VOLS):
+    """{'Open', 'High', 'Low', 'Close', 'Volume': (time x asset) arrays} for a regime path"""
+    n_bars, n_assets = states.shape
+    rng = np.random.default_rng(seed)
+    vols = np.asarray(vols)[states]
+    close = 100 * np.exp(np.cumsum(rng.normal(0, 1.0, (n_bars, n_assets)) * vols, axis=0))
+    open_ = np.vstack([close[:1], close[:-1]])
+    spread = np.abs(rng.normal(0, 1.0, (n_bars, n_assets))) * vols * close
+    return {'Open': open_, 'High': np.maximum(open_, close) + spread, 'Low': np.minimum(open_, close) - spread,
+            'Close': close, 'Volume': rng.uniform(1e6, 1e8, (n_bars, n_assets))}
+
+def bar_index(n_bars, freq=None, start=START):
+    # Hourly bars, or minute bars for histories too long to stamp hourly
+    if freq is None:
+        freq = 'h' if n_bars <= MAX_HOURLY_BARS else 'min'
+    return pd.date_range(start, periods=n_bars, freq=freq)
+
+def symbols(n_assets):
+    return [f"SYN{i}-USD" for i in range(n_assets)]
+
+def synthetic_market(n_bars, n_assets, seed=42, stay=0.995, freq=None):
+    """{'index', 'symbols', 'states', 'bars'}: regime path plus OHLCV arrays for n_assets"""
+    states = regime_states(n_bars, n_assets, seed, stay)
+    return {
+        'index': bar_index(n_bars, freq),
+        'symbols': symbols(n_assets),
+        'states': states,
+        'bars': ohlcv_arrays(states, seed)
+    }
+
+def close_frame(market):
+    """Close prices, one column per symbol (the input of fetch_crypto_data's callers)"""
+    return pd.DataFrame(market['bars']['Close'], index=market['index'], columns=market['symbols'])
+
+def ohlcv_frames(market, symbols=None):
+    """{symbol: OHLCV DataFrame}, the layout of the local data store"""
+    bars, columns = market['bars'], market['symbols']
+    return {symbol: pd.DataFrame({field: values[:, columns.index(symbol)] for field, values in bars.items()},
+                                 index=market['index'])
+            for symbol in (symbols or columns)}
+
+# ====================
+# On-Chain Flows
+# ====================
+def synthetic_flows(states, index, seed=42, lead=24, base_flow=50.0):
+    """Hourly miner-flow records shaped like the Cybotrade Datasource output
+
+    Returns a DataFrame indexed by UTC start_time with start_time (ms epoch), flow_total,
+    flow_mean and transactions_count_flow. Flow size follows the regime `lead` bars ahead
+    (flows pick up before volatility does) with lognormal noise.
+    states: one regime path (1-D), index: the bar times.
+    """
+    rng = np.random.default_rng(seed)
+    states = np.asarray(states)
+    ahead = np.concatenate([states[lead:], np.repeat(states[-1:], min(lead, len(states)))])
+    scale = base_flow * np.array([1.0, 1.8, 3.5])[ahead]
+    counts = rng.poisson(np.array([20, 30, 55])[ahead]) + 1
+    flow_total = scale * rng.lognormal(0.0, 0.5, len(states))
+    times = pd.DatetimeIndex(index)
+    times = times.tz_localize('UTC') if times.tz is None else times.tz_convert('UTC')
+    return pd.DataFrame({
+        'start_time': times.as_unit('ms').asi8,
+        'flow_total': flow_total,
+        'flow_mean': flow_total / counts,
+        'transactions_count_flow': counts.astype(float)
+    }, index=times)
+
+# ====================
+# Fake Datasource
+# ====================
+class FakeDatasource:
+    """Local stand-in for cybotrade_datasource.query serving hourly flow records for any topic
+
+    Every request waits `latency` seconds and fails with probability `failure_rate`
+    (seeded). Records are a deterministic function of (topic, start_time), so any page
+    split returns the same data; none exist past `end` (default: now).
+    Tracks calls, failures and the peak number of requests in flight.
+    """
+
+    def __init__(self, latency=0.05, failure_rate=0.0, seed=42, end=None, interval_ms=3_600_000):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.rng = np.random.default_rng(seed)
+        self.end_ms = int(pd.Timestamp(end or pd.Timestamp.now('UTC')).timestamp() * 1000)
+        self.interval_ms = interval_ms
+        self.calls = 0
+        self.failures = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+
+    def records(self, topic, start_ms, limit):
+        first = -(-start_ms // self.interval_ms) * self.interval_ms
+        times = np.arange(first, min(first + limit * self.interval_ms, self.end_ms), self.interval_ms, dtype=np.int64)
+        phase = zlib.crc32(topic.encode()) % 1000
+        hours = times // 3_600_000 + phase
+        counts = 20 + (hours * 7919) % 37
+        flow_total = 50.0 * (1.5 + np.sin(hours / 24.0)) * (1 + (hours * 104729) % 101 / 100.0)
+        return [{'start_time': int(t), 'flow_total': float(f), 'flow_mean': float(f / c),
+                 'transactions_count_flow': float(c)} for t, f, c in zip(times, flow_total, counts)]
+
+    async def query(self, api_key=None, topic=None, start_time=None, limit=1000):
+        self.calls += 1
+        self.in_flight += 1
+        self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(self.latency)
+            if self.rng.random() < self.failure_rate:
+                self.failures += 1
+                raise ConnectionError(f"Fake datasource: injected failure for {topic}")
+            return {'data': self.records(topic, int(pd.Timestamp(start_time).timestamp() * 1000), limit)}
+        finally:
+            self.in_flight -= 1
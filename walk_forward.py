@@ -0,0 +1,94 @@
+# Walk-forward (rolling-origin) backtesting
+# Every fold trains on the `train_window` bars before its origin and is scored on the next
+# `test_window` bars only, so all states used for trading are out-of-sample. Features are
+# built once for the whole series (they only look backwards) and sliced per fold.
+# Consecutive folds form chains: the first fold of a chain is fitted from scratch, later
+# folds warm-start EM from the previous fold's parameters, and the filtered belief carries
+# over from one fold to the next. Chains are independent and run in parallel processes.
+import os
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from backtest import create_features, fit_hmm, generate_signals, run_backtest, analyze_performance
+from hmm_online import refit_hmm, volatility_mapping
+from hmm_batch import filter_sequence
+
+def make_folds(n_bars, train_window, test_window):
+    """(train_start, test_start, test_end) bar offsets for every fold"""
+    return [(origin - train_window, origin, min(origin + test_window, n_bars))
+            for origin in range(train_window, n_bars, test_window)]
+
+def _run_chain(features, folds, n_components, n_iter, warm_iter, refit_every):
+    # Out-of-sample mapped states for a run of consecutive folds
+    volatility_column = list(features.columns).index('volatility')
+    model = scaler = log_alpha = None
+    out = []
+
+    for i, (train_start, test_start, test_end) in enumerate(folds):
+        train = features.iloc[train_start:test_start]
+        if model is None:
+            model, _, scaler = fit_hmm(train, n_components=n_components, n_iter=n_iter)
+            # Initial belief from filtering the first training window
+            _, log_alpha = filter_sequence(model, scaler.transform(train))
+        elif i % refit_every == 0:
+            model = refit_hmm(model, scaler, train, window=len(train), n_iter=warm_iter)
+
+        mapping = volatility_mapping(model, volatility_column)
+        log_filtered, log_alpha = filter_sequence(model, scaler.transform(features.iloc[test_start:test_end]),
+                                                  log_alpha)
+        states = mapping[np.argmax(log_filtered, axis=1)]
+        out.append(pd.Series(states, index=features.index[test_start:test_end]))
+
+    return pd.concat(out) if out else pd.Series(dtype=int)
+
+def walk_forward_states(features_by_symbol, train_window=365, test_window=30, refit_every=1,
+                        n_components=3, n_iter=1000, warm_iter=20, n_chains=None, n_jobs=None):
+    """{symbol: Series of out-of-sample mapped states}
+
+    refit_every: warm refit every N folds (the model only filters in between).
+    n_chains: number of independent fold chains per symbol (default: one per core);
+    each chain costs one cold fit, every other fold a `warm_iter` EM refit.
+    """
+    n_jobs = n_jobs or os.cpu_count() or 1
+    tasks = []
+    for symbol, features in features_by_symbol.items():
+        folds = make_folds(len(features), train_window, test_window)
+        chains = [list(chain) for chain in np.array_split(np.array(folds), min(n_chains or n_jobs, len(folds)))
+                  if len(chain)] if folds else []
+        tasks += [(symbol, (features, [tuple(fold) for fold in chain], n_components, n_iter, warm_iter, refit_every))
+                  for chain in chains]
+
+    if n_jobs == 1 or len(tasks) <= 1:
+        results = [(symbol, _run_chain(*args)) for symbol, args in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            futures = [(symbol, pool.submit(_run_chain, *args)) for symbol, args in tasks]
+            results = [(symbol, future.result()) for symbol, future in futures]
+
+    states = {}
+    for symbol in features_by_symbol:
+        parts = [series for name, series in results if name == symbol]
+        states[symbol] = pd.concat(parts).sort_index() if parts else pd.Series(dtype=int)
+    return states
+
+def run_walk_forward(prices, train_window=365, test_window=30, refit_every=1, n_components=3,
+                     window=30, fee=0.001, n_iter=1000, warm_iter=20, n_chains=None, n_jobs=None):
+    """Out-of-sample backtest of the BTC/ETH strategy (first two columns of `prices`)
+
+    Returns (signals, metrics) like run_backtest / analyze_performance, restricted to the
+    bars that were out-of-sample for both assets. Raises ValueError when the series is too
+    short for a single fold.
+    """
+    btc, eth = list(prices.columns[:2])
+    features = {symbol: create_features(prices[symbol], window=window) for symbol in (btc, eth)}
+    n_bars = min(len(df) for df in features.values())
+    if not make_folds(n_bars, train_window, test_window):
+        raise ValueError(f"Walk-forward needs more than train_window={train_window} feature bars, got {n_bars}")
+    states = walk_forward_states(features, train_window, test_window, refit_every, n_components,
+                                 n_iter, warm_iter, n_chains, n_jobs)
+
+    index = states[btc].index.intersection(states[eth].index)
+    signals = generate_signals(states[btc].loc[index], states[eth].loc[index],
+                               prices[btc], prices[eth])
+    signals = run_backtest(signals, fee=fee)
+    return signals, analyze_performance(signals)